@@ -0,0 +1,44 @@
+import gc
+
+import tno.essim_adapter
+from tno.essim_adapter.settings import EnvSettings
+
+# Load the app, and with it the ESDL metamodel, once in the master, the workers share it copy-on-write.
+# Disable it with GUNICORN_PRELOAD=False when using --reload.
+preload_app = EnvSettings.gunicorn_preload()
+tno.essim_adapter.defer_background_services = preload_app
+
+
+def when_ready(server):
+    if EnvSettings.registry_endpoint():
+        from tno.essim_adapter.registry import RegistryClient, UsageBoard
+
+        # Register the instance once, with the run slots and the usage of all its workers. The board is
+        # created before the workers are forked, room is left for workers that replace exited ones
+        tno.essim_adapter.usage_board = UsageBoard(2 * server.cfg.workers)
+        server.registry_client = RegistryClient(
+            endpoint=EnvSettings.registry_endpoint(),
+            adapter_uri=EnvSettings.adapter_uri(),
+            max_workers=EnvSettings.run_slots() * server.cfg.workers,
+            heartbeat_interval=EnvSettings.registry_heartbeat_interval(),
+            usage=tno.essim_adapter.usage_board.usage,
+        )
+        server.registry_client.start()
+
+    if preload_app:
+        from tno.essim_adapter.model.model import preload_esdl_metamodel
+
+        preload_esdl_metamodel()
+        # Keep the garbage collector of the workers from touching, and thereby copying, the preloaded objects
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        tno.essim_adapter.start_background_services()
+
+
+def on_exit(server):
+    registry_client = getattr(server, "registry_client", None)
+    if registry_client is not None:
+        registry_client.deregister()
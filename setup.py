@@ -4,4 +4,10 @@ setup(
     name="MMvIB ESSIM Model Adapter",
     version="0.1",
     packages=["tno"],
+    extras_require={
+        # ARTIFACT_COMPRESSION=zstd
+        "zstd": ["zstandard"],
+        # KPI_PARQUET_EXPORT and TIMESERIES_EXPORT
+        "parquet": ["pyarrow"],
+    },
 )
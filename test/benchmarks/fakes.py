@@ -0,0 +1,164 @@
+"""In-process stand-ins for the services the adapter talks to, so benchmarks run without live services."""
+import json
+import os
+import random
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from time import time
+from typing import Dict, Optional
+
+import synthetic
+
+
+class ObjectResponse:
+    def __init__(self, data: bytes, headers: Dict[str, str]):
+        self.data = data
+        self.headers = headers
+
+    def read(self, decode_content: bool = True) -> bytes:
+        return self.data
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class InMemoryMinio:
+    """Implements the part of the Minio client API used by the adapter, objects are kept in a dict."""
+
+    def __init__(self):
+        self.objects: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def bucket_exists(self, bucket_name: str) -> bool:
+        return True
+
+    def make_bucket(self, bucket_name: str):
+        pass
+
+    def put_object(self, bucket_name: str, object_name: str, data, length: int,
+                   content_type: str = "application/octet-stream", metadata: Optional[Dict[str, str]] = None):
+        headers = {"Content-Type": content_type, **(metadata or {})}
+        with self._lock:
+            self.objects[f"{bucket_name}/{object_name}"] = (data.read(length), headers)
+
+    def fput_object(self, bucket_name: str, object_name: str, file_path: str,
+                    content_type: str = "application/octet-stream", metadata: Optional[Dict[str, str]] = None):
+        with open(file_path, "rb") as f:
+            self.put_object(bucket_name, object_name, f, os.path.getsize(file_path), content_type, metadata)
+
+    def get_object(self, bucket_name: str, object_name: str) -> ObjectResponse:
+        with self._lock:
+            data, headers = self.objects[f"{bucket_name}/{object_name}"]
+        return ObjectResponse(data, headers)
+
+    def add(self, path: str, data: bytes):
+        bucket, _, object_name = path.partition("/")
+        self.put_object(bucket, object_name, BytesIO(data), len(data))
+
+
+class FakeESSIM:
+    """A local ESSIM REST server. Simulations take a fixed duration, every KPI module finishes kpi_delay seconds
+    after the simulation and fails with probability kpi_error_rate. Start requests are refused as busy (503)
+    with probability busy_rate."""
+
+    BASE_PATH = "/essim/simulation"
+
+    def __init__(self, duration: float = 2.0, busy_rate: float = 0.0, kpi_modules: int = 3, kpi_delay: float = 1.0,
+                 kpi_error_rate: float = 0.0, kpi_values: int = 5, seed: int = None):
+        self.duration = duration
+        self.busy_rate = busy_rate
+        self.kpi_delay = kpi_delay
+        self.kpi_error_rate = kpi_error_rate
+        self.kpi_results = synthetic.kpi_results(kpi_modules, kpi_values)
+
+        self.simulations: Dict[str, dict] = {}
+        self.requests = {"start": 0, "busy": 0, "status": 0, "kpi": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}{self.BASE_PATH}"
+
+    def start(self) -> str:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                self.send_json(*fake.start_simulation())
+
+            def do_GET(self):
+                self.send_json(*fake.get(self.path[len(FakeESSIM.BASE_PATH):].strip("/").split("/")))
+
+            def do_DELETE(self):
+                self.send_json(200, {})
+
+            def send_json(self, status_code, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-essim", daemon=True).start()
+        return self.url
+
+    def stop(self):
+        self._server.shutdown()
+
+    def start_simulation(self):
+        with self._lock:
+            self.requests["start"] += 1
+            if self._random.random() < self.busy_rate:
+                self.requests["busy"] += 1
+                return 503, {"description": "All simulation slots are in use"}
+            simulation_id = str(uuid.uuid4())
+            self.simulations[simulation_id] = {
+                "started": time(),
+                "failed_modules": {kpi["id"] for kpi in self.kpi_results if self._random.random() < self.kpi_error_rate},
+            }
+        return 201, {"id": simulation_id}
+
+    def get(self, parts):
+        if parts == ["kpiModules"]:
+            return 200, [{"calculator_id": kpi["id"], "title": kpi["name"], "description": kpi["descr"]}
+                         for kpi in self.kpi_results]
+
+        simulation = self.simulations.get(parts[0])
+        if simulation is None:
+            return 404, {"Description": f"Simulation {parts[0]} not found"}
+        elapsed = time() - simulation["started"]
+
+        if parts[-1] == "status":
+            self.requests["status"] += 1
+            if elapsed < self.duration:
+                return 200, {"State": "RUNNING", "Description": str(elapsed / self.duration)}
+            return 200, {"State": "COMPLETE", "Description": "Simulation completed"}
+
+        self.requests["kpi"] += 1
+        kpi_elapsed = elapsed - self.duration
+        response = []
+        for kpi in self.kpi_results:
+            if kpi_elapsed < 0:
+                status = {"status": "Not yet started"}
+            elif kpi_elapsed < self.kpi_delay:
+                status = {"status": "Calculating", "progress": 100 * kpi_elapsed / self.kpi_delay}
+            elif kpi["id"] in simulation["failed_modules"]:
+                status = {"status": "Error"}
+            else:
+                status = {"status": "Success", "kpi": kpi["kpi"]}
+            response.append({kpi["id"]: status})
+        return 200, response
@@ -0,0 +1,152 @@
+"""Load test of the adapter: drive concurrent model runs through the Flask API against a local fake ESSIM.
+
+ESSIM is replaced by an in-process REST server (see fakes.FakeESSIM) and MinIO by an in-memory stand-in.
+Every client runs request, initialize, run, status (polled until the run finished), results and remove
+for its share of the runs. The report shows the throughput in runs/s and the latency percentiles of each
+endpoint.
+
+Usage:
+    python test/benchmarks/load_test.py --runs 100 --concurrency 20 --duration 5 --busy-rate 0.2
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+from collections import defaultdict
+from time import perf_counter, sleep
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# The repository root, for the tno package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import synthetic  # noqa: E402
+from fakes import FakeESSIM, InMemoryMinio  # noqa: E402
+
+FINISHED_STATES = ("SUCCEEDED", "ERROR")
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class LoadTest:
+    def __init__(self, app, args):
+        self.app = app
+        self.args = args
+        self.latencies = defaultdict(list)
+        self.run_times = []
+        self.outcomes = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def call(self, client, endpoint, method, path, **kwargs):
+        start = perf_counter()
+        response = getattr(client, method)(path, **kwargs)
+        elapsed = perf_counter() - start
+        with self._lock:
+            self.latencies[endpoint].append(elapsed)
+        return response
+
+    def model_run(self, client, i):
+        start = perf_counter()
+        model_run_id = self.call(client, "request", "get", "/model/request").json["model_run_id"]
+        self.call(client, "initialize", "post", f"/model/initialize/{model_run_id}", json={
+            "essim_post_body": {"user": "loadtest", "scenarioID": f"loadtest_{i}"},
+            "input_esdl_file_path": "loadtest/input.esdl",
+            "output_esdl_file_path": f"./output/{i}/output.esdl",
+            "output_file_path": f"./output/{i}/KPIs.json",
+            "base_path": "loadtest/",
+        })
+        self.call(client, "run", "get", f"/model/run/{model_run_id}")
+        while self.call(client, "status", "get", f"/model/status/{model_run_id}").json["state"] not in FINISHED_STATES:
+            sleep(self.args.status_interval)
+        state = self.call(client, "results", "get", f"/model/results/{model_run_id}").json["state"]
+        self.call(client, "remove", "get", f"/model/remove/{model_run_id}")
+        with self._lock:
+            self.run_times.append(perf_counter() - start)
+            self.outcomes[state] += 1
+
+    def client(self, run_numbers):
+        client = self.app.test_client()
+        for i in run_numbers:
+            try:
+                self.model_run(client, i)
+            except Exception as e:
+                with self._lock:
+                    self.outcomes[f"exception: {e!r}"] += 1
+
+    def run(self):
+        clients = [
+            threading.Thread(target=self.client, args=(range(c, self.args.runs, self.args.concurrency),))
+            for c in range(self.args.concurrency)
+        ]
+        start = perf_counter()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        return perf_counter() - start
+
+    def report(self, elapsed, fake_essim):
+        completed = sum(self.outcomes.values())
+        print(f"\n{completed} runs in {elapsed:.1f}s: {completed / elapsed:.2f} runs/s")
+        print("Outcomes: " + ", ".join(f"{outcome}={count}" for outcome, count in self.outcomes.items()))
+        print("Fake ESSIM requests: " + ", ".join(f"{name}={count}" for name, count in fake_essim.requests.items()))
+        if self.run_times:
+            print(f"Run time: median {statistics.median(self.run_times):.2f}s, "
+                  f"p95 {percentile(self.run_times, 95):.2f}s, max {max(self.run_times):.2f}s")
+
+        print(f"\n{'endpoint':<12}{'count':>8}{'p50 (ms)':>12}{'p95 (ms)':>12}{'p99 (ms)':>12}{'max (ms)':>12}")
+        for endpoint, latencies in self.latencies.items():
+            print(f"{endpoint:<12}{len(latencies):>8}" + "".join(
+                f"{1000 * value:>12.2f}" for value in (percentile(latencies, 50), percentile(latencies, 95),
+                                                       percentile(latencies, 99), max(latencies))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20, help="total number of model runs")
+    parser.add_argument("--concurrency", type=int, default=10, help="number of concurrent clients")
+    parser.add_argument("--engine", default="threaded", help="RUN_ENGINE of the adapter: threaded or async")
+    parser.add_argument("--max-workers", type=int, default=10, help="MAX_WORKERS of the adapter")
+    parser.add_argument("--duration", type=float, default=2.0, help="simulation duration in seconds")
+    parser.add_argument("--busy-rate", type=float, default=0.0, help="fraction of start requests answered with 503")
+    parser.add_argument("--kpi-modules", type=int, default=3)
+    parser.add_argument("--kpi-values", type=int, default=5, help="values per KPI, e.g. one per carrier")
+    parser.add_argument("--kpi-delay", type=float, default=1.0, help="KPI calculation time in seconds")
+    parser.add_argument("--kpi-error-rate", type=float, default=0.0, help="fraction of failing KPI modules")
+    parser.add_argument("--assets", type=int, default=50, help="number of assets in the input ESDL")
+    parser.add_argument("--status-interval", type=float, default=0.5, help="status polling interval of the clients")
+    args = parser.parse_args()
+
+    fake_essim = FakeESSIM(duration=args.duration, busy_rate=args.busy_rate, kpi_modules=args.kpi_modules,
+                           kpi_values=args.kpi_values, kpi_delay=args.kpi_delay, kpi_error_rate=args.kpi_error_rate,
+                           seed=1)
+
+    # The adapter reads its settings on import
+    os.environ.update({
+        "ESSIM_URL": fake_essim.start(),
+        "RUN_ENGINE": args.engine,
+        "MAX_WORKERS": str(args.max_workers),
+        "ESSIM_BUSY_BACKOFF": "0.5",
+        "POLL_MIN_INTERVAL": "0.2",
+        "POLL_MAX_INTERVAL": "2",
+    })
+    os.environ.pop("MINIO_ENDPOINT", None)
+    os.environ.pop("REGISTRY_ENDPOINT", None)
+
+    from tno.essim_adapter.apis.model_api import essim
+    from tno.essim_adapter.main import app
+
+    essim.minio_client = InMemoryMinio()
+    essim.minio_client.add("loadtest/input.esdl", synthetic.energy_system(args.assets).encode("utf-8"))
+
+    load_test = LoadTest(app, args)
+    elapsed = load_test.run()
+    load_test.report(elapsed, fake_essim)
+    fake_essim.stop()
+
+
+if __name__ == "__main__":
+    main()
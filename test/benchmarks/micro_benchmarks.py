@@ -0,0 +1,180 @@
+"""Micro-benchmarks of the adapter's hot functions on synthetic inputs of increasing size.
+
+Every benchmark is timed over a number of repeats (the median is reported) and run once more under
+tracemalloc to record its peak memory. MinIO and InfluxDB are replaced by in-process stand-ins.
+
+Usage:
+    python test/benchmarks/micro_benchmarks.py [--sizes small,medium,large] [--repeat 5]
+                                               [--json results.json] [--compare baseline.json]
+
+With --compare the results are checked against an earlier --json output, the script exits with 1 when a
+benchmark became slower than the allowed --tolerance.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tracemalloc
+from time import perf_counter
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# The repository root, for the tno package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from influxdb import InfluxDBClient  # noqa: E402
+
+import synthetic  # noqa: E402
+from fakes import InMemoryMinio  # noqa: E402
+from tno.essim_adapter.model.essim import ESSIM  # noqa: E402
+from tno.essim_adapter.types import ESSIMAdapterConfig, InfluxDBInfo, ModelRun, ModelState, ProfileInfo  # noqa: E402
+
+SIZE_CLASSES = {
+    "small": {"assets": 10, "kpi_modules": 3, "kpi_values": 5, "profile_values": 168},
+    "medium": {"assets": 100, "kpi_modules": 10, "kpi_values": 50, "profile_values": 8760},
+    "large": {"assets": 1000, "kpi_modules": 30, "kpi_values": 500, "profile_values": 35040},
+}
+
+INPUT_ESDL_PATH = "benchmark/input.esdl"
+
+
+def new_model(size):
+    """An ESSIM model with one initialized model run, its input ESDL is stored in an in-memory MinIO."""
+    model = ESSIM()
+    model.minio_client = InMemoryMinio()
+    model.minio_client.add(INPUT_ESDL_PATH, synthetic.energy_system(size["assets"]).encode("utf-8"))
+    model.model_run_dict["benchmark"] = ModelRun(
+        state=ModelState.RUNNING,
+        config=ESSIMAdapterConfig(
+            essim_post_body={"user": "benchmark", "scenarioID": "benchmark"},
+            input_esdl_file_path=INPUT_ESDL_PATH,
+            base_path="benchmark/",
+        ),
+        result=None,
+    )
+    return model
+
+
+def profile_info(num_values):
+    return ProfileInfo(
+        values=[float(v) for v in range(num_values)],
+        start_datetime="2019-01-01T00:00:00+0000",
+        end_datetime="2020-01-01T00:00:00+0000",
+        num_values=num_values,
+        influxdb_info=InfluxDBInfo(database="energy_profiles", measurement="standard_profiles", field="value",
+                                   host="influxdb", port=8086, use_ssl=False),
+    )
+
+
+def bench_essim_post_body(size):
+    model = new_model(size)
+    config = model.model_run_dict["benchmark"].config
+    return lambda: model.essim_post_body(config)
+
+
+def bench_process_kpi_results(size):
+    response, index = synthetic.essim_kpi_response(size["kpi_modules"], size["kpi_values"])
+    return lambda: ESSIM.process_kpi_results(response, index)
+
+
+def bench_post_process_results(size):
+    model = new_model(size)
+    result = synthetic.kpi_results(size["kpi_modules"], size["kpi_values"])
+    return lambda: model.post_process_results("benchmark", result)
+
+
+def bench_save_profile_to_influxdb(size):
+    profile = profile_info(size["profile_values"])
+
+    def run():
+        with mock.patch.object(InfluxDBClient, "write_points"):
+            ESSIM.save_profile_to_influxdb(profile)
+    return run
+
+
+def bench_query_esdl_influxdb_profile(size):
+    model = new_model(size)
+    profile = synthetic.influxdb_profile("benchmark")
+    result = synthetic.influxdb_result(profile.field, size["profile_values"])
+
+    def run():
+        with mock.patch.object(InfluxDBClient, "query", return_value=result):
+            model.query_esdl_influxdb_profile(profile)
+    return run
+
+
+def bench_load_profiles_from_influxdb(size):
+    # Only the traversal of the ESDL is measured, every profile query returns the same small profile
+    model = new_model(size)
+    model.query_esdl_influxdb_profile = lambda esdl_influxdb_profile: profile_info(24)
+    return lambda: model.load_profiles_from_influxdb("benchmark")
+
+
+BENCHMARKS = {
+    "essim_post_body (base64 ESDL)": bench_essim_post_body,
+    "process_kpi_results": bench_process_kpi_results,
+    "post_process_results": bench_post_process_results,
+    "save_profile_to_influxdb": bench_save_profile_to_influxdb,
+    "query_esdl_influxdb_profile": bench_query_esdl_influxdb_profile,
+    "load_profiles_from_influxdb": bench_load_profiles_from_influxdb,
+}
+
+
+def measure(run, repeat):
+    run()   # warm up
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        run()
+        times.append(perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"time_ms": statistics.median(times) * 1000, "peak_kb": peak / 1024}
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for key, result in results.items():
+        if key in baseline and result["time_ms"] > baseline[key]["time_ms"] * (1 + tolerance):
+            regressions.append(f"{key}: {baseline[key]['time_ms']:.2f} ms -> {result['time_ms']:.2f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="small,medium,large")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="compare with the results in this file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown, 0.2 is 20%%")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'benchmark':<34}{'size':<8}{'time (ms)':>12}{'peak (KB)':>12}")
+    for name, benchmark in BENCHMARKS.items():
+        for size_class in args.sizes.split(","):
+            result = measure(benchmark(SIZE_CLASSES[size_class]), args.repeat)
+            results[f"{name} [{size_class}]"] = result
+            print(f"{name:<34}{size_class:<8}{result['time_ms']:>12.2f}{result['peak_kb']:>12.0f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Synthetic ESDLs, KPI payloads and InfluxDB query results of configurable size for the benchmarks."""
+import random
+from datetime import datetime, timedelta
+
+import pytz
+from esdl import esdl
+from esdl.esdl_handler import EnergySystemHandler
+from influxdb.resultset import ResultSet
+
+START_DATE = datetime(2019, 1, 1, tzinfo=pytz.utc)
+END_DATE = datetime(2020, 1, 1, tzinfo=pytz.utc)
+CARRIERS = ["Electricity", "Natural gas", "Heat", "Hydrogen", "Biomass"]
+
+
+def influxdb_profile(profile_id: str) -> esdl.InfluxDBProfile:
+    return esdl.InfluxDBProfile(
+        id=profile_id,
+        host="http://influxdb",
+        port=8086,
+        database="energy_profiles",
+        measurement="standard_profiles",
+        field=f"field_{profile_id}",
+        startDate=START_DATE,
+        endDate=END_DATE,
+    )
+
+
+def energy_system(num_assets: int) -> str:
+    """An ESDL with num_assets producers and consumers, carriers, cost information and environmental profiles,
+    about a third of them referring to InfluxDB profiles."""
+    esh = EnergySystemHandler()
+    es = esh.create_empty_energy_system("benchmark", "Synthetic energy system for benchmarks")
+    area = es.instance[0].area
+
+    carriers = esdl.Carriers(id="carriers")
+    for i, name in enumerate(CARRIERS):
+        carrier = esdl.EnergyCarrier(id=f"carrier_{i}", name=name)
+        if i % 2 == 0:
+            carrier.cost = influxdb_profile(f"carrier_cost_{i}")
+        carriers.carrier.append(carrier)
+    es.energySystemInformation = esdl.EnergySystemInformation(
+        id="esi",
+        carriers=carriers,
+        environmentalProfiles=esdl.EnvironmentalProfiles(
+            id="environmental_profiles",
+            outsideTemperatureProfile=influxdb_profile("outside_temperature"),
+            windSpeedProfile=influxdb_profile("wind_speed"),
+        ),
+    )
+
+    for i in range(num_assets):
+        if i % 2 == 0:
+            asset = esdl.GenericProducer(id=f"asset_{i}", name=f"Producer {i}", power=1e6)
+            port = esdl.OutPort(id=f"port_{i}", name="Out", carrier=carriers.carrier[i % len(CARRIERS)])
+        else:
+            asset = esdl.GenericConsumer(id=f"asset_{i}", name=f"Consumer {i}", power=1e6)
+            port = esdl.InPort(id=f"port_{i}", name="In", carrier=carriers.carrier[i % len(CARRIERS)])
+        if i % 3 == 0:
+            port.profile.append(influxdb_profile(f"port_profile_{i}"))
+        asset.port.append(port)
+        if i % 3 == 1:
+            asset.costInformation = esdl.CostInformation(
+                id=f"cost_information_{i}",
+                marginalCosts=influxdb_profile(f"marginal_costs_{i}"),
+            )
+        area.asset.append(asset)
+
+    return esh.to_string()
+
+
+def kpi_results(num_modules: int, num_values: int):
+    """Processed KPI results as produced by ESSIM.process_kpi_results, input of Model.post_process_results."""
+    rng = random.Random(num_modules * num_values)
+    results = []
+    for m in range(num_modules):
+        results.append({
+            "id": f"kpi_module_{m}",
+            "name": f"KPI module {m}",
+            "descr": f"Synthetic KPI module {m}",
+            "calc_status": "Success",
+            "kpi": [{
+                "Local": [
+                    {
+                        "Name": f"KPI {m}.{k}",
+                        "Unit": "WATTHOUR",
+                        "Values": [
+                            {"carrier": CARRIERS[c % len(CARRIERS)] + f" {c}", "value": rng.random() * 1e9}
+                            for c in range(num_values)
+                        ],
+                    }
+                    for k in range(2)
+                ] + [{"Name": f"Total {m}", "Unit": "PERCENTAGE", "Values": rng.random() * 100}]
+            }],
+        })
+    return results
+
+
+def essim_kpi_response(num_modules: int, num_values: int):
+    """A raw response of ESSIM's KPI endpoint, input of ESSIM.process_kpi_results, and the KPI module index."""
+    response = []
+    index = {}
+    for i, result in enumerate(kpi_results(num_modules, num_values)):
+        index[result["id"]] = {"id": result["id"], "name": result["name"], "descr": result["descr"]}
+        if i % 4 == 3:
+            response.append({result["id"]: {"status": "Calculating", "progress": 50}})
+        else:
+            response.append({result["id"]: {"status": "Success", "kpi": result["kpi"]}})
+    return response, index
+
+
+def influxdb_result(field: str, num_values: int) -> ResultSet:
+    """What InfluxDBClient.query returns for a profile of num_values hourly values."""
+    rng = random.Random(num_values)
+    return ResultSet({
+        "series": [{
+            "name": "standard_profiles",
+            "columns": ["time", field],
+            "values": [
+                [(START_DATE + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M:%SZ"), rng.random()]
+                for h in range(num_values)
+            ],
+        }]
+    })
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The repository root, for the tno package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Scripts run by hand against a running adapter or with their own command line, not tests
+collect_ignore = ["test_api_with_minio.py", "query_influxdb_profile.py", "upload_profiles.py",
+                  "startup_benchmark.py", "benchmarks"]
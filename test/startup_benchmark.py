@@ -0,0 +1,60 @@
+"""Measure the startup time of the adapter: importing the app and serving the first requests.
+
+Every measurement runs in a fresh interpreter, so nothing is cached between runs.
+
+Usage: python test/startup_benchmark.py [number of runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# The repository root, for the tno package
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEASURE = """
+import json
+from time import perf_counter
+
+t0 = perf_counter()
+import esdl.esdl_handler
+t1 = perf_counter()
+from tno.essim_adapter.main import app
+t2 = perf_counter()
+client = app.test_client()
+client.get('/status/')
+t3 = perf_counter()
+client.get('/model/request')
+t4 = perf_counter()
+
+print(json.dumps({
+    "import esdl": t1 - t0,
+    "import app": t2 - t1,
+    "first /status": t3 - t2,
+    "first /model/request": t4 - t3,
+    "total": t4 - t0,
+}))
+"""
+
+
+def measure_once():
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_ROOT, os.getenv("PYTHONPATH")])))
+    output = subprocess.run([sys.executable, "-c", MEASURE], capture_output=True, text=True, check=True,
+                            env=env).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    measurements = [measure_once() for _ in range(runs)]
+
+    print(f"Startup time over {runs} runs (seconds)")
+    print(f"{'phase':<24}{'median':>10}{'min':>10}{'max':>10}")
+    for phase in measurements[0]:
+        values = [m[phase] for m in measurements]
+        print(f"{phase:<24}{statistics.median(values):>10.3f}{min(values):>10.3f}{max(values):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
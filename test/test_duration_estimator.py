@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from tno.essim_adapter.model.duration_estimator import DurationEstimator, PhaseModel, solve, submit_features
+
+
+def test_solve():
+    # The pivot of the first column is in the last row
+    a = [[1.0, 2.0, 1.0], [2.0, 5.0, 2.0], [3.0, 2.0, 6.0]]
+    x = [1.0, -2.0, 0.5]
+    b = [sum(a_ij * x_j for a_ij, x_j in zip(row, x)) for row in a]
+    assert solve(a, b) == pytest.approx(x)
+    assert a[0] == [1.0, 2.0, 1.0]
+
+
+def test_phase_model_learns_a_power_law():
+    model = PhaseModel(forgetting=1.0, ridge=1e-9)
+    for hours in (10, 100, 1000, 5000, 8760):
+        for kpi_modules in (0, 1, 3):
+            model.add({"hours": hours, "kpi_modules": kpi_modules}, 0.5 * (1 + hours))
+    assert model.samples == 15
+    assert model.predict({"hours": 2000, "kpi_modules": 2}) == pytest.approx(0.5 * 2001, rel=1e-3)
+
+
+def test_phase_model_mean():
+    model = PhaseModel(forgetting=1.0)
+    model.add({}, 10)
+    model.add({}, 1000)
+    assert model.mean() == pytest.approx(100)
+
+
+def test_estimates_start_once_every_phase_was_seen(tmp_path):
+    estimator = DurationEstimator(str(tmp_path / "history.jsonl"), history_size=10, min_samples=3)
+    assert estimator.estimate({"hours": 10}) is None
+    estimator.record("run", {"hours": 10}, {"simulation": 20})
+    assert estimator.estimate({"hours": 10}, ["simulation"]) == pytest.approx(20)
+    assert estimator.estimate({"hours": 10}) is None
+
+
+def test_history_is_learned_again(tmp_path):
+    history = tmp_path / "history.jsonl"
+    estimator = DurationEstimator(str(history), history_size=2, min_samples=1)
+    for i, duration in enumerate((1000, 10, 10)):
+        estimator.record(f"run-{i}", {"hours": 10}, {"simulation": duration}, queue_wait=1)
+    records = [json.loads(line) for line in history.read_text().splitlines()]
+    assert [r["model_run_id"] for r in records] == ["run-0", "run-1", "run-2"]
+    assert records[0]["queue_wait"] == 1
+
+    # Only the last history_size runs are learned
+    restarted = DurationEstimator(str(history), history_size=2, min_samples=5)
+    assert restarted.phases["simulation"].samples == 2
+    assert restarted.estimate({}, ["simulation"]) == pytest.approx(10)
+
+
+def test_submit_features():
+    features = submit_features({"startDate": "2019-01-01T00:00:00+0100", "endDate": "2019-01-01T23:00:00+0100",
+                                "kpiModule": {"modules": [{"id": "a"}, {"id": "b"}]}})
+    assert features == {"kpi_modules": 2.0, "hours": 24.0}
+    assert submit_features({}) == {"kpi_modules": 0.0}
@@ -0,0 +1,92 @@
+import os
+
+import pytest
+from esdl import esdl
+from esdl.esdl_handler import EnergySystemHandler
+from pyecore.ecore import EReference
+
+from benchmarks import synthetic
+from tno.essim_adapter.model.esdl_index import ESDLIndex
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def traversal(esh: EnergySystemHandler):
+    """The profiles as load_profiles_from_influxdb collected them before ESDLIndex, one walk per type."""
+    port_profiles = []
+    for p in esh.get_all_instances_of_type(esdl.Port):
+        for prof in p.profile:
+            if isinstance(prof, esdl.ProfileReference):
+                prof = prof.reference
+            if isinstance(prof, esdl.InfluxDBProfile):
+                port_profiles.append((p.eContainer().id, p.id, prof.id))
+
+    cost_information_profiles = []
+    for a in esh.get_all_instances_of_type(esdl.Asset):
+        if a.costInformation:
+            for ci_attr in a.costInformation.eClass.eAllStructuralFeatures():
+                if isinstance(ci_attr, EReference):
+                    referred_obj = a.costInformation.eGet(ci_attr)
+                    if isinstance(referred_obj, esdl.InfluxDBProfile):
+                        cost_information_profiles.append((a.id, ci_attr.name, referred_obj.id))
+
+    carrier_cost_profiles = [(c.id, c.cost.id) for c in esh.get_all_instances_of_type(esdl.Carrier)
+                             if isinstance(c.cost, esdl.InfluxDBProfile)]
+
+    environmental_profiles = []
+    for ep in esh.get_all_instances_of_type(esdl.EnvironmentalProfiles):
+        for ep_attr in ep.eClass.eAllStructuralFeatures():
+            if isinstance(ep_attr, EReference):
+                referred_obj = ep.eGet(ep_attr)
+                if isinstance(referred_obj, esdl.InfluxDBProfile):
+                    environmental_profiles.append((ep_attr.name, referred_obj.id))
+
+    return {
+        "influxdb_profiles": sorted(p.id for p in esh.get_all_instances_of_type(esdl.InfluxDBProfile)),
+        "port_profiles": sorted(port_profiles),
+        "cost_information_profiles": sorted(cost_information_profiles),
+        "carrier_cost_profiles": sorted(carrier_cost_profiles),
+        "environmental_profiles": sorted(environmental_profiles),
+    }
+
+
+def indexed(index: ESDLIndex):
+    return {
+        "influxdb_profiles": sorted(p.id for p in index.influxdb_profiles),
+        "port_profiles": sorted((a.id, p.id, prof.id) for a, p, prof in index.port_profiles),
+        "cost_information_profiles": sorted((a.id, name, prof.id) for a, name, prof in index.cost_information_profiles),
+        "carrier_cost_profiles": sorted((c.id, prof.id) for c, prof in index.carrier_cost_profiles),
+        "environmental_profiles": sorted((name, prof.id) for name, prof in index.environmental_profiles),
+    }
+
+
+def synthetic_system():
+    esh = EnergySystemHandler()
+    es = esh.load_from_string(synthetic.energy_system(30))
+    # A port referring to a profile defined elsewhere
+    port = esh.get_by_id("port_1")
+    port.profile.append(esdl.ProfileReference(id="reference", reference=esh.get_by_id("carrier_cost_0")))
+    return esh, es
+
+
+def test_same_profiles_as_the_type_traversals():
+    esh, es = synthetic_system()
+    expected = traversal(esh)
+    assert all(expected.values())
+    assert indexed(ESDLIndex(es)) == expected
+
+
+@pytest.mark.parametrize("file_name", ["Tholen-simple v04-26kW.esdl", "Hybrid HeatPump.esdl"])
+def test_same_profiles_for_the_example_esdls(file_name):
+    esh = EnergySystemHandler()
+    es = esh.load_file(os.path.join(TEST_DIR, file_name))
+    assert indexed(ESDLIndex(es)) == traversal(esh)
+
+
+def test_lookups():
+    esh, es = synthetic_system()
+    index = ESDLIndex(es)
+    assert index.get("asset_3") is esh.get_by_id("asset_3")
+    assert {a.id for a in index.instances_of_type(esdl.Asset)} == \
+        {a.id for a in esh.get_all_instances_of_type(esdl.Asset)}
+    assert index.instances_of_type(esdl.Asset) is index.instances_of_type(esdl.Asset)
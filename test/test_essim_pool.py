@@ -0,0 +1,101 @@
+import pytest
+import requests
+
+from tno.essim_adapter.model import essim as essim_module
+from tno.essim_adapter.model.essim import ESSIM
+from tno.essim_adapter.model.essim_pool import ESSIMEnginePool
+from tno.essim_adapter.model.run_control import RunControl
+from tno.essim_adapter.types import ModelState
+
+
+def pool(*urls):
+    return ESSIMEnginePool(list(urls), health_check_interval=0, busy_backoff=60)
+
+
+def test_least_outstanding_engine_is_acquired():
+    p = pool("http://a", "http://b")
+    first, second = p.acquire(), p.acquire()
+    assert {first.url, second.url} == {"http://a", "http://b"}
+    p.release(first)
+    assert p.acquire() is first
+    assert first.outstanding == 1 and second.outstanding == 1
+
+
+def test_busy_and_failed_engines_leave_the_rotation():
+    p = pool("http://a", "http://b")
+    a, b = p.get("http://a"), p.get("http://b")
+    p.mark_busy(p.acquire())
+    assert p.acquire() is b
+    p.mark_failed(b)
+    assert not b.healthy and b.outstanding == 0
+    assert p.acquire() is None
+    assert not p.all_failed()
+    p.mark_failed(a, release=False)
+    assert p.all_failed()
+
+
+def test_release_never_goes_negative():
+    p = pool("http://a")
+    engine = p.acquire()
+    p.release(engine)
+    p.release(engine)
+    assert engine.outstanding == 0
+
+
+def test_any_url_without_engines_is_a_configuration_error():
+    assert pool("http://a").any_url() == "http://a"
+    with pytest.raises(RuntimeError, match="No ESSIM engines configured"):
+        pool().any_url()
+
+
+class Response:
+    status_code = 201
+
+    def json(self):
+        return {"id": "simulation"}
+
+
+def start(monkeypatch, p, post):
+    monkeypatch.setattr(essim_module, "essim_pool", p)
+    monkeypatch.setattr(essim_module.requests, "post", post)
+    return ESSIM.start_essim(None, None, "run", RunControl(), essim_post_body={})
+
+
+def test_start_moves_on_to_the_next_engine_if_one_cannot_be_reached(monkeypatch):
+    posted = []
+
+    def post(url, **kwargs):
+        posted.append(url)
+        if len(posted) == 1:
+            raise requests.exceptions.ConnectionError("refused")
+        return Response()
+
+    info, simulation_id, engine = start(monkeypatch, pool("http://a", "http://b"), post)
+    assert info.state == ModelState.RUNNING and simulation_id == "simulation"
+    assert len(posted) == 2 and posted[0] != posted[1] and engine.url == posted[1]
+
+
+def test_start_is_not_sent_again_after_a_timeout(monkeypatch):
+    posted = []
+
+    def post(url, **kwargs):
+        posted.append(url)
+        raise requests.exceptions.ReadTimeout("timed out")
+
+    p = pool("http://a", "http://b")
+    info, simulation_id, engine = start(monkeypatch, p, post)
+    assert info.state == ModelState.ERROR and simulation_id is None
+    assert len(posted) == 1
+    assert all(e.healthy and e.outstanding == 0 for e in p.engines)
+
+
+def test_start_fails_once_every_engine_failed(monkeypatch):
+    def post(url, **kwargs):
+        raise requests.exceptions.ConnectionError("refused")
+
+    info, _, _ = start(monkeypatch, pool("http://a", "http://b"), post)
+    assert info.state == ModelState.ERROR
+    assert info.reason == "All ESSIM engines failed"
+
+    info, _, _ = start(monkeypatch, pool(), post)
+    assert info.reason.startswith("No ESSIM engines configured")
@@ -0,0 +1,43 @@
+from io import BytesIO
+
+import pytest
+
+from tno.essim_adapter.model.kpi_table import kpi_columns, kpi_parquet, pyarrow
+
+RESULT = [
+    {
+        "id": "TotalEnergyProductionID",
+        "calc_status": "Success",
+        "kpi": [
+            {"Area": [{"Name": "Production", "Unit": "J", "Values": [
+                {"carrier": "Electricity", "value": 10},
+                {"carrier": "Heat", "value": 2.5},
+            ]}]},
+            {"Building": [{"Name": "Self-sufficiency", "Unit": "%", "Values": 80}]},
+        ],
+    },
+    {"id": "FailedID", "calc_status": "Error"},
+]
+
+
+def test_a_row_per_value():
+    columns = kpi_columns("run", RESULT)
+    rows = list(zip(*(columns[name] for name in ("kpi_module", "level", "name", "carrier", "value", "unit"))))
+    assert rows == [
+        ("TotalEnergyProductionID", "Area", "Production", "Electricity", 10.0, "J"),
+        ("TotalEnergyProductionID", "Area", "Production", "Heat", 2.5, "J"),
+        ("TotalEnergyProductionID", "Building", "Self-sufficiency", None, 80.0, "%"),
+    ]
+    assert columns["model_run_id"] == ["run"] * 3
+
+
+def test_no_rows_without_kpis():
+    assert all(not values for values in kpi_columns("run", []).values())
+
+
+@pytest.mark.skipif(pyarrow is None, reason="requires the pyarrow package")
+def test_parquet_round_trip():
+    table = pyarrow.parquet.read_table(BytesIO(kpi_parquet("run", RESULT)))
+    assert table.num_rows == 3
+    assert table.column("carrier").to_pylist() == ["Electricity", "Heat", None]
+    assert table.schema.field("value").type == pyarrow.float64()
@@ -0,0 +1,37 @@
+import logging
+import queue
+import threading
+
+from tno.shared.log import AsyncLogHandler
+
+
+def record(msg):
+    return logging.LogRecord("tno.test", logging.INFO, __file__, 1, msg, None, None)
+
+
+def test_every_long_value_is_truncated():
+    handler = AsyncLogHandler(queue.Queue(), max_message_length=10)
+    prepared = handler.prepare(record({"event": "e" * 20, "kpis": [1] * 20, "esdl": b"x" * 20, "count": 12345}))
+    assert prepared.msg["event"] == "e" * 10 + "... [10 characters truncated]"
+    assert prepared.msg["kpis"].startswith("[1, 1, 1, ")
+    assert prepared.msg["kpis"].endswith("characters truncated]")
+    assert prepared.msg["esdl"] == "x" * 10 + "... [10 characters truncated]"
+    assert prepared.msg["count"] == 12345
+
+
+def test_dropped_records_are_counted_across_threads():
+    handler = AsyncLogHandler(queue.Queue(maxsize=1), max_message_length=0)
+    handler.enqueue(record({"event": "fills the queue"}))
+
+    def drop():
+        for _ in range(1000):
+            handler.enqueue(record({"event": "dropped"}))
+
+    threads = [threading.Thread(target=drop) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert handler.prepare(record({"event": "next"})).msg["dropped_log_records"] == 8000
+    assert "dropped_log_records" not in handler.prepare(record({"event": "after"})).msg
@@ -0,0 +1,48 @@
+import pytest
+
+from tno.essim_adapter.model.poll_scheduler import AdaptivePollScheduler
+
+
+def scheduler():
+    return AdaptivePollScheduler(min_interval=1, max_interval=60, eta_fraction=0.5, backoff=2)
+
+
+def test_interval_follows_the_estimated_completion():
+    s = scheduler()
+    assert s.observe(0.0, now=0) == 2
+    # 10% in 10s, 90s to go
+    assert s.observe(0.1, now=10) == pytest.approx(45)
+    assert s.eta(now=10) == pytest.approx(90)
+    # Converges on the completion time
+    assert s.observe(0.9, now=90) == pytest.approx(5)
+
+
+def test_backs_off_without_progress_but_not_past_the_completion():
+    s = scheduler()
+    assert [s.observe(None, now=t) for t in range(4)] == [2, 4, 8, 16]
+    assert s.observe(None, now=4) == 32
+    assert s.observe(None, now=5) == 60
+
+    s = scheduler()
+    s.observe(0.0, now=0)
+    s.observe(0.5, now=10)
+    assert s.observe(0.5, now=14) == pytest.approx(3)
+
+
+def test_progress_below_the_first_poll():
+    # KPI modules can restart, their progress then drops below the progress seen at the first poll
+    s = scheduler()
+    s.observe(0.5, now=0)
+    s.observe(0.1, now=5)
+    interval = s.observe(0.2, now=10)
+    assert 1 <= interval <= 60
+    assert s.eta(now=10) is None
+
+
+def test_intervals_are_clamped():
+    s = scheduler()
+    s.observe(0.0, now=0)
+    assert s.observe(0.99, now=1) == 1
+    s = scheduler()
+    s.observe(0.0, now=0)
+    assert s.observe(0.001, now=10) == 60
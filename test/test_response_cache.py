@@ -0,0 +1,71 @@
+import gzip
+import json
+
+from flask import Flask
+
+from tno.essim_adapter.apis.response_cache import ResponseCache
+from tno.essim_adapter.types import ModelRunInfo, ModelState
+
+app = Flask(__name__)
+
+
+def respond(cache, info, **headers):
+    with app.test_request_context(headers=headers):
+        return cache.response(info)
+
+
+def test_etag_is_stable_and_matches_with_304():
+    cache = ResponseCache(max_size=10 ** 6, gzip_min_size=10 ** 6)
+    info = ModelRunInfo(model_run_id="run", state=ModelState.SUCCEEDED, result={"path": "a/KPIs.json"})
+    first = respond(cache, info)
+    assert first.status_code == 200
+    assert json.loads(first.get_data())["result"] == {"path": "a/KPIs.json"}
+    etag = first.headers["ETag"]
+    assert respond(cache, info).headers["ETag"] == etag
+
+    not_modified = respond(cache, info, **{"If-None-Match": etag})
+    assert not_modified.status_code == 304
+
+
+def test_new_outcome_gets_new_etag():
+    cache = ResponseCache(max_size=10 ** 6, gzip_min_size=10 ** 6)
+    running = ModelRunInfo(model_run_id="run", state=ModelState.RUNNING, result={"complete": False})
+    etag = respond(cache, running).headers["ETag"]
+    finished = ModelRunInfo(model_run_id="run", state=ModelState.SUCCEEDED, result={"complete": True})
+    response = respond(cache, finished, **{"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_large_responses_are_gzipped_for_clients_that_accept_it():
+    cache = ResponseCache(max_size=10 ** 6, gzip_min_size=100)
+    info = ModelRunInfo(model_run_id="run", state=ModelState.SUCCEEDED, result={"kpis": ["value"] * 100})
+    plain = respond(cache, info)
+    assert plain.content_encoding is None
+
+    compressed = respond(cache, info, **{"Accept-Encoding": "gzip"})
+    assert compressed.content_encoding == "gzip"
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    assert compressed.headers["ETag"] != plain.headers["ETag"]
+    assert respond(cache, info, **{"Accept-Encoding": "gzip", "If-None-Match": compressed.headers["ETag"]}
+                   ).status_code == 304
+
+
+def test_evicted_responses_keep_their_etag():
+    cache = ResponseCache(max_size=300, gzip_min_size=10 ** 6)
+    info = ModelRunInfo(model_run_id="run", state=ModelState.SUCCEEDED, result={"path": "a/KPIs.json"})
+    etag = respond(cache, info).headers["ETag"]
+    for i in range(10):
+        respond(cache, ModelRunInfo(model_run_id=f"other-{i}", state=ModelState.SUCCEEDED, result={"i": i}))
+    assert "run" not in cache._responses
+    assert respond(cache, info, **{"If-None-Match": etag}).status_code == 304
+
+
+def test_invalidate():
+    cache = ResponseCache(max_size=10 ** 6, gzip_min_size=10 ** 6)
+    info = ModelRunInfo(model_run_id="run", state=ModelState.SUCCEEDED, result={"path": "a/KPIs.json"})
+    respond(cache, info)
+    cache.invalidate("run")
+    cache.invalidate("unknown")
+    assert "run" not in cache._responses
+    assert cache._size == 0
@@ -0,0 +1,116 @@
+import time
+import uuid
+from concurrent.futures import Future
+
+from tno.essim_adapter import executor
+from tno.essim_adapter.model.retention import RunRetentionManager
+from tno.essim_adapter.types import ESSIMAdapterConfig, ModelRun, ModelRunInfo, ModelState
+
+
+class FakeModel:
+    """The parts of ESSIM the retention manager uses, with MinIO as a dict."""
+
+    def __init__(self, minio: bool = True):
+        self.model_run_dict = {}
+        self.run_controls = {}
+        self.minio_client = object() if minio else None
+        self.objects = {}
+
+    def save_to_minio(self, path, data, content_type=None):
+        self.objects[path] = data
+
+    def load_from_minio(self, path):
+        return self.objects[path]
+
+    def complete_run(self, model_run_id, model_run_info):
+        model_run = self.model_run_dict[model_run_id]
+        model_run.result = model_run_info.result
+        model_run.state = model_run_info.state
+        model_run.reason = model_run_info.reason
+        model_run.stored = True
+
+    def finish_run(self, result):
+        model_run_id = str(uuid.uuid4())
+        config = ESSIMAdapterConfig(essim_post_body={"user": "test"}, tag="sweep")
+        self.model_run_dict[model_run_id] = ModelRun(state=ModelState.RUNNING, config=config, result=None)
+        self.run_controls[model_run_id] = object()
+        future = Future()
+        future.set_result(ModelRunInfo(model_run_id=model_run_id, state=ModelState.SUCCEEDED, result=result))
+        executor.futures.add(model_run_id, future)
+        return model_run_id
+
+
+def manager(model, ttl=0, memory_budget=0):
+    return RunRetentionManager(model, ttl=ttl, memory_budget=memory_budget, spill_bucket="spill",
+                               check_interval=60)
+
+
+def test_nothing_is_evicted_when_disabled():
+    model = FakeModel()
+    model_run_id = model.finish_run({"kpis": [1, 2, 3]})
+    manager(model).enforce()
+    assert model_run_id in model.model_run_dict
+
+
+def test_evicted_after_ttl_and_reloaded():
+    model = FakeModel()
+    model_run_id = model.finish_run({"kpis": [1, 2, 3]})
+    retention = manager(model, ttl=0.01)
+    evicted = []
+    retention.on_evict = evicted.append
+    retention.enforce()
+    assert model_run_id in model.model_run_dict
+
+    time.sleep(0.02)
+    retention.enforce()
+    assert model_run_id not in model.model_run_dict
+    assert evicted == [model_run_id]
+    assert retention.status(model_run_id).state == ModelState.SUCCEEDED
+    assert retention.summaries[model_run_id].tag == "sweep"
+
+    reloaded = retention.results(model_run_id)
+    assert reloaded.state == ModelState.SUCCEEDED
+    assert reloaded.result == {"kpis": [1, 2, 3]}
+    # Reloaded once, then served from memory
+    model.objects.clear()
+    assert retention.results(model_run_id) is reloaded
+
+
+def test_least_recently_used_is_evicted_over_the_memory_budget():
+    model = FakeModel()
+    first = model.finish_run({"kpis": list(range(100))})
+    second = model.finish_run({"kpis": list(range(100))})
+    retention = manager(model, memory_budget=1)
+    retention.enforce()
+    assert first not in model.model_run_dict and second not in model.model_run_dict
+
+    third = model.finish_run({"kpis": list(range(100))})
+    fourth = model.finish_run({"kpis": []})
+    retention.memory_budget = 10 ** 6
+    retention.enforce()
+    retention.touch(third)
+    retention.memory_budget = retention._finished[third][1] + 1
+    retention.enforce()
+    assert third in model.model_run_dict
+    assert fourth not in model.model_run_dict
+
+
+def test_not_evicted_without_minio():
+    model = FakeModel(minio=False)
+    model_run_id = model.finish_run({"kpis": [1]})
+    retention = manager(model, memory_budget=1)
+    retention.enforce()
+    assert model_run_id in model.model_run_dict
+    assert model_run_id not in retention.summaries
+
+
+def test_forget():
+    model = FakeModel()
+    model_run_id = model.finish_run({"kpis": [1]})
+    retention = manager(model, memory_budget=1)
+    retention.enforce()
+    assert retention.forget(model_run_id)
+    assert not retention.forget(model_run_id)
+    # A run removed while a request was looking it up is unknown, not a KeyError
+    assert retention.status(model_run_id).state == ModelState.ERROR
+    assert retention.results(model_run_id).state == ModelState.ERROR
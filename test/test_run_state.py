@@ -0,0 +1,58 @@
+import json
+import os
+
+from tno.essim_adapter.model.run_state import RunStateStore
+
+
+def checkpoint(directory):
+    with open(os.path.join(directory, "run.json")) as f:
+        return json.load(f)
+
+
+def test_checkpoints_keep_earlier_fields(tmp_path):
+    store = RunStateStore(str(tmp_path))
+    store.save("run", "STARTING", simulation_id=None, engine_url="http://a")
+    store.save("run", "SIMULATING", simulation_id="simulation")
+    state = checkpoint(tmp_path)
+    assert state["phase"] == "SIMULATING"
+    assert state["simulation_id"] == "simulation" and state["engine_url"] == "http://a"
+    assert not os.path.exists(os.path.join(tmp_path, "run.json.tmp"))
+
+
+def test_remove_deletes_the_checkpoint_and_the_lock_file(tmp_path):
+    store = RunStateStore(str(tmp_path))
+    store.save("run", "SIMULATING")
+    store.remove("run")
+    assert os.listdir(tmp_path) == []
+    assert store.claim_orphans() == []
+
+
+def test_remove_without_a_checkpoint_file(tmp_path):
+    store = RunStateStore(str(tmp_path))
+    store.save("run", "SIMULATING")
+    os.remove(os.path.join(tmp_path, "run.json"))
+    store.remove("run")
+    assert os.listdir(tmp_path) == []
+
+
+def test_only_runs_without_an_owner_are_claimed(tmp_path):
+    owner = RunStateStore(str(tmp_path))
+    owner.save("run", "SIMULATING", simulation_id="simulation")
+    other = RunStateStore(str(tmp_path))
+    assert other.claim_orphans() == []
+
+    # The owner stops without finishing the run, which releases its lock
+    os.close(owner._locks.pop("run"))
+    claimed = other.claim_orphans()
+    assert [state["simulation_id"] for state in claimed] == ["simulation"]
+    # The run is now owned by the process that claimed it
+    assert RunStateStore(str(tmp_path)).claim_orphans() == []
+    other.remove("run")
+    assert os.listdir(tmp_path) == []
+
+
+def test_disabled_without_a_directory():
+    store = RunStateStore("")
+    store.save("run", "SIMULATING")
+    store.remove("run")
+    assert store.claim_orphans() == []
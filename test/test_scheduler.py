@@ -0,0 +1,119 @@
+import time
+
+import pytest
+
+from tno.essim_adapter.model.scheduler import QueueFull, RunScheduler
+
+
+class Control:
+    def __init__(self, deadline=None):
+        self.stop_reason = None
+        self.deadline = deadline
+        self.callbacks = []
+
+    def on_cancel(self, callback):
+        self.callbacks.append(callback)
+
+    def cancel(self):
+        self.stop_reason = "Cancelled on request"
+        for callback in self.callbacks:
+            callback()
+
+
+class Run:
+    def __init__(self, name, deadline=None):
+        self.name = name
+        self.control = Control(deadline)
+
+
+def scheduler(slots=1, tenant_max_workers=0, max_queue_length=0, tenant_max_queue_length=0):
+    started, stopped = [], []
+    s = RunScheduler(slots=slots, tenant_max_workers=tenant_max_workers, max_queue_length=max_queue_length,
+                     tenant_max_queue_length=tenant_max_queue_length, retry_after=7,
+                     on_slot=lambda run: started.append(run.name), on_stopped=lambda run: stopped.append(run.name))
+    return s, started, stopped
+
+
+def test_tenants_take_turns():
+    s, started, _ = scheduler()
+    for name in ("sweep-1", "sweep-2", "sweep-3"):
+        s.submit(Run(name), "sweep")
+    s.submit(Run("single-1"), "single")
+    assert started == ["sweep-1"]
+
+    s.release("sweep")
+    s.release("single")
+    s.release("sweep")
+    assert started == ["sweep-1", "single-1", "sweep-2", "sweep-3"]
+
+
+def test_higher_priority_starts_first():
+    s, started, _ = scheduler()
+    s.submit(Run("running"), "a")
+    s.submit(Run("normal"), "a")
+    s.submit(Run("urgent"), "b", priority=5)
+    s.release("a")
+    assert started == ["running", "urgent"]
+
+
+def test_sort_key_orders_runs_of_the_same_priority():
+    s, started, _ = scheduler()
+    s.submit(Run("running"), "a")
+    s.submit(Run("long"), "a", sort_key=100.0)
+    s.submit(Run("short"), "a", sort_key=1.0)
+    s.release("a")
+    assert started == ["running", "short"]
+
+
+def test_tenant_max_workers():
+    s, started, _ = scheduler(slots=3, tenant_max_workers=2)
+    for i in range(3):
+        s.submit(Run(f"a-{i}"), "a")
+    assert started == ["a-0", "a-1"]
+    s.submit(Run("b-0"), "b")
+    assert started == ["a-0", "a-1", "b-0"]
+    s.release("a")
+    assert started[-1] == "a-2"
+
+
+def test_stopped_runs_leave_the_queue():
+    s, started, stopped = scheduler()
+    s.submit(Run("running"), "a")
+    cancelled = Run("cancelled")
+    s.submit(cancelled, "a")
+    s.submit(Run("next"), "a")
+    cancelled.control.cancel()
+    s.schedule()
+    assert stopped == ["cancelled"]
+    assert s.queue_length() == 1
+    s.release("a")
+    assert started == ["running", "next"]
+
+
+def test_runs_past_their_deadline_are_reaped_while_queued():
+    s, started, stopped = scheduler()
+    s.submit(Run("running"), "a")
+    s.submit(Run("expiring", deadline=time.time() + 0.05), "a")
+    s.submit(Run("next"), "a")
+    for _ in range(100):
+        if stopped:
+            break
+        time.sleep(0.01)
+    assert stopped == ["expiring"]
+    assert s.queue_length() == 1
+    s.release("a")
+    assert started == ["running", "next"]
+
+
+def test_queue_limits():
+    s, _, _ = scheduler(max_queue_length=3, tenant_max_queue_length=2)
+    s.submit(Run("running"), "a")
+    s.submit(Run("a-1"), "a")
+    s.submit(Run("a-2"), "a")
+    with pytest.raises(QueueFull) as e:
+        s.check_capacity("a")
+    assert e.value.retry_after == 7
+    s.check_capacity("b")
+    s.submit(Run("b-1"), "b")
+    with pytest.raises(QueueFull):
+        s.check_capacity("c")
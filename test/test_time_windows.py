@@ -0,0 +1,111 @@
+import pytest
+
+from tno.essim_adapter.model.time_windows import KPIMergeRules, merge_kpi_results, split_time_windows
+
+
+def test_split_covers_every_time_step_once():
+    windows = split_time_windows("2019-01-01T00:00:00+0100", "2019-01-01T09:00:00+0100", 3)
+    assert windows == [
+        ("2019-01-01T00:00:00+0100", "2019-01-01T02:00:00+0100", 3),
+        ("2019-01-01T03:00:00+0100", "2019-01-01T05:00:00+0100", 3),
+        ("2019-01-01T06:00:00+0100", "2019-01-01T09:00:00+0100", 4),
+    ]
+
+
+def test_split_into_more_windows_than_time_steps():
+    windows = split_time_windows("2019-01-01T00:00:00+0100", "2019-01-01T01:00:00+0100", 5)
+    assert [steps for _, _, steps in windows] == [1, 1]
+    assert windows[0][0] == windows[0][1] == "2019-01-01T00:00:00+0100"
+
+
+def test_split_a_single_time_step():
+    assert split_time_windows("2019-01-01T00:00:00+0100", "2019-01-01T00:00:00+0100", 3) == [
+        ("2019-01-01T00:00:00+0100", "2019-01-01T00:00:00+0100", 1)]
+
+
+def test_split_a_year():
+    windows = split_time_windows("2019-01-01T00:00:00+0100", "2019-12-31T23:00:00+0100", 12)
+    assert len(windows) == 12
+    assert sum(steps for _, _, steps in windows) == 8760
+    assert windows[0][0] == "2019-01-01T00:00:00+0100"
+    assert windows[-1][1] == "2019-12-31T23:00:00+0100"
+
+
+def test_split_rejects_invalid_dates():
+    with pytest.raises(ValueError):
+        split_time_windows("2019-01-01", "2019-01-02", 2)
+
+
+def test_default_rules():
+    rules = KPIMergeRules({})
+    assert rules.rule("module", "Production", "JOULE") == "sum"
+    assert rules.rule("module", "Self-sufficiency", "PERCENTAGE") == "mean"
+
+
+def test_configured_rules():
+    ratio = {"ratio": ["Local", "Demand"], "scale": 100}
+    rules = KPIMergeRules({"A": "max", "B": {"default": "min", "kpis": {"Self-sufficiency": ratio}}})
+    assert rules.rule("A", "Production", "JOULE") == "max"
+    assert rules.rule("B", "Production", "PERCENTAGE") == "min"
+    assert rules.rule("B", "Self-sufficiency", "PERCENTAGE") == ratio
+
+
+def test_invalid_rules_setting(monkeypatch):
+    monkeypatch.setenv("KPI_MERGE_RULES", "{not json")
+    assert KPIMergeRules.from_settings().rules == {}
+
+
+def kpi(name, unit, values):
+    return {"Name": name, "Unit": unit, "Values": values}
+
+
+def module(module_id, *kpis, status="Success"):
+    result = {"id": module_id, "name": module_id, "descr": "", "calc_status": status}
+    if status == "Success":
+        result["kpi"] = [{"total": list(kpis)}]
+    return result
+
+
+def merged_values(results, module_id):
+    merged = next(m for m in results if m["id"] == module_id)
+    return {selection["Name"]: selection["Values"] for selection in merged["kpi"][0]["total"]}
+
+
+def test_merge_sums_and_weighs_means():
+    windows = [
+        [module("A", kpi("Production", "JOULE", 10), kpi("Share", "PERCENTAGE", 50))],
+        [module("A", kpi("Production", "JOULE", 30), kpi("Share", "PERCENTAGE", 100))],
+    ]
+    values = merged_values(merge_kpi_results(windows, [3, 1], KPIMergeRules({})), "A")
+    assert values == {"Production": 40, "Share": 62.5}
+
+
+def test_merge_values_per_carrier():
+    windows = [
+        [module("A", kpi("Production", "JOULE", [{"carrier": "Gas", "value": 1}]))],
+        [module("A", kpi("Production", "JOULE", [{"carrier": "Gas", "value": 2}, {"carrier": "Heat", "value": 5}]))],
+    ]
+    values = merged_values(merge_kpi_results(windows, [1, 1], KPIMergeRules({})), "A")
+    assert values["Production"] == [{"carrier": "Gas", "value": 3}, {"carrier": "Heat", "value": 5}]
+
+
+def test_merge_derives_ratios_from_merged_kpis():
+    rules = KPIMergeRules({"A": {"kpis": {"Self-sufficiency": {"ratio": ["Local", "Demand"], "scale": 100}}}})
+    windows = [
+        [module("A", kpi("Local", "JOULE", 10), kpi("Demand", "JOULE", 10),
+                kpi("Self-sufficiency", "PERCENTAGE", 100))],
+        [module("A", kpi("Local", "JOULE", 0), kpi("Demand", "JOULE", 30),
+                kpi("Self-sufficiency", "PERCENTAGE", 0))],
+    ]
+    values = merged_values(merge_kpi_results(windows, [1, 1], rules), "A")
+    assert values["Self-sufficiency"] == 25
+
+
+def test_merge_keeps_the_status_of_a_failed_module():
+    windows = [
+        [module("A", kpi("Production", "JOULE", 10)), module("B", kpi("Production", "JOULE", 1))],
+        [module("A", kpi("Production", "JOULE", 10)), module("B", status="Error")],
+    ]
+    results = merge_kpi_results(windows, [1, 1], KPIMergeRules({}))
+    assert [m["calc_status"] for m in results] == ["Success", "Error"]
+    assert "kpi" not in results[1]
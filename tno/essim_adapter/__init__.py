@@ -1,3 +1,5 @@
+import atexit
+
 from flask import Flask
 from flask_cors import CORS
 
@@ -7,14 +9,48 @@ from flask_executor import Executor
 
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-import requests
-
 from tno.essim_adapter.settings import EnvSettings
 
 api = Api()
 env = DotEnv()
 executor = Executor()
 
+# Set by gunicorn.conf.py when the app is preloaded in the gunicorn master. Threads do not survive a fork,
+# so the background services are then started in every worker by the post_fork hook instead.
+defer_background_services = False
+# Set by gunicorn.conf.py, which registers the instance with the MM Registry once from the master. The workers
+# publish their usage on it for the heartbeats.
+usage_board = None
+
+
+def start_background_services():
+    """Start the threads of this process: the KPI catalog refresh, resumed model runs and the MM Registry
+    heartbeat."""
+    from tno.essim_adapter.apis.model_api import essim
+    from tno.essim_adapter.model.kpi_catalog import kpi_catalog
+
+    # Load the KPI module catalog shared by all model runs
+    kpi_catalog.start()
+
+    # Re-attach to the simulations of the runs that were in progress when the adapter stopped
+    essim.resume_runs()
+
+    if usage_board is not None:
+        usage_board.start(essim.usage, EnvSettings.registry_heartbeat_interval())
+    elif EnvSettings.registry_endpoint():
+        from tno.essim_adapter.registry import RegistryClient
+
+        # Register adapter to MM Registry and keep it informed about our capacity
+        registry_client = RegistryClient(
+            endpoint=EnvSettings.registry_endpoint(),
+            adapter_uri=EnvSettings.adapter_uri(),
+            max_workers=EnvSettings.run_slots(),
+            heartbeat_interval=EnvSettings.registry_heartbeat_interval(),
+            usage=essim.usage,
+        )
+        registry_client.start()
+        atexit.register(registry_client.deregister)
+
 
 def create_app(object_name):
     """
@@ -45,18 +81,13 @@ def create_app(object_name):
     api.register_blueprint(status_api)
     api.register_blueprint(model_api)
 
-    if EnvSettings.registry_endpoint():
-        logger.info("Registering with MM Registry")
+    if EnvSettings.profiler_enabled():
+        from tno.essim_adapter.apis.admin import api as admin_api
 
-        # Register adapter to MM Registry
-        registry_data = {"uri": "http://mmvib-essim-adapter:9203", "used_workers": 0, "name": "ESSIM",
-                         "owner": "localhost", "version": "1.0", "max_workers": 1}
+        api.register_blueprint(admin_api)
 
-        try:
-            r = requests.post(EnvSettings.registry_endpoint(), json=registry_data)
-            r.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            print(e.response.text)
+    if not defer_background_services:
+        start_background_services()
 
     CORS(app, resources={r"/*": {"origins": "*"}})
 
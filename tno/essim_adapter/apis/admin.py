@@ -0,0 +1,45 @@
+from flask import Response, jsonify
+from flask_smorest import Blueprint
+from flask.views import MethodView
+from werkzeug.exceptions import Conflict
+from tno.essim_adapter.profiler import profiler
+from tno.essim_adapter.types import ProfilerOptions
+from tno.shared.log import get_logger
+
+logger = get_logger(__name__)
+
+api = Blueprint("admin", "admin", url_prefix="/admin")
+
+
+@api.route("/profiler")
+class Profile(MethodView):
+
+    @api.arguments(ProfilerOptions.Schema(), location="query")
+    def get(self, options: ProfilerOptions):
+        """The samples of the current or last profile as collapsed stacks."""
+        return Response(profiler.collapsed(options.role), mimetype="text/plain")
+
+
+@api.route("/profiler/start")
+class StartProfiler(MethodView):
+
+    @api.arguments(ProfilerOptions.Schema(), location="query")
+    def post(self, options: ProfilerOptions):
+        if not profiler.start(options.interval, options.duration):
+            raise Conflict("The profiler is running already")
+        return jsonify(profiler.status())
+
+
+@api.route("/profiler/stop")
+class StopProfiler(MethodView):
+
+    def post(self):
+        profiler.stop()
+        return jsonify(profiler.status())
+
+
+@api.route("/profiler/status")
+class ProfilerStatus(MethodView):
+
+    def get(self):
+        return jsonify(profiler.status())
@@ -1,17 +1,43 @@
+import dataclasses
+from typing import List
+
 from flask import jsonify
 from flask_smorest import Blueprint
 from flask.views import MethodView
+from werkzeug.exceptions import BadRequest, TooManyRequests
 from tno.shared.log import get_logger
-from tno.essim_adapter.types import ModelRunInfo, ESSIMAdapterConfig
+from tno.essim_adapter.types import ModelRunInfo, ModelRunQuery, ESSIMAdapterConfig
 from tno.essim_adapter.model.essim import ESSIM
+from tno.essim_adapter.model.scheduler import QueueFull
+from tno.essim_adapter.apis.response_cache import ResponseCache
 
 
 essim = ESSIM()
+result_responses = ResponseCache.from_settings()
+essim.retention.on_evict = result_responses.invalidate
 
 logger = get_logger(__name__)
 
 api = Blueprint("model", "model", url_prefix="/model")
 
+MODEL_RUN_INFO_FIELDS = [f.name for f in dataclasses.fields(ModelRunInfo)]
+
+
+def check_query(query: ModelRunQuery):
+    if query.model_run_ids is None and query.tag is None:
+        raise BadRequest("Give the model_run_ids or the tag of the model runs")
+    unknown = [f for f in query.include or [] if f not in MODEL_RUN_INFO_FIELDS]
+    if unknown:
+        raise BadRequest(f"Unknown fields {', '.join(unknown)}, choose from {', '.join(MODEL_RUN_INFO_FIELDS)}")
+
+
+def project(infos: List[ModelRunInfo], include: List[str]):
+    """Only the requested fields of every ModelRunInfo, the model_run_id is always included."""
+    if include is None:
+        return infos
+    return [{f: getattr(info, f) for f in MODEL_RUN_INFO_FIELDS if f == "model_run_id" or f in include}
+            for info in infos]
+
 
 @api.route("/request")
 class Request(MethodView):
@@ -37,7 +63,10 @@ class Run(MethodView):
 
     @api.response(200, ModelRunInfo.Schema())
     def get(self, model_run_id: str):
-        res = essim.run(model_run_id=model_run_id)
+        try:
+            res = essim.run(model_run_id=model_run_id)
+        except QueueFull as e:
+            raise TooManyRequests(str(e), retry_after=e.retry_after)
         return jsonify(res)
 
 
@@ -50,12 +79,41 @@ class Status(MethodView):
         return jsonify(res)
 
 
+@api.route("/status")
+class BatchStatus(MethodView):
+
+    @api.arguments(ModelRunQuery.Schema())
+    @api.response(200, ModelRunInfo.Schema(many=True))
+    def post(self, query: ModelRunQuery):
+        check_query(query)
+        return jsonify(project(essim.batch_status(query), query.include))
+
+
 @api.route("/results/<model_run_id>")
 class Results(MethodView):
 
     @api.response(200, ModelRunInfo.Schema())
     def get(self, model_run_id: str):
         res = essim.results(model_run_id=model_run_id)
+        return result_responses.response(res)
+
+
+@api.route("/results")
+class BatchResults(MethodView):
+
+    @api.arguments(ModelRunQuery.Schema())
+    @api.response(200, ModelRunInfo.Schema(many=True))
+    def post(self, query: ModelRunQuery):
+        check_query(query)
+        return jsonify(project(essim.batch_results(query), query.include))
+
+
+@api.route("/cancel/<model_run_id>")
+class Cancel(MethodView):
+
+    @api.response(200, ModelRunInfo.Schema())
+    def get(self, model_run_id: str):
+        res = essim.cancel(model_run_id=model_run_id)
         return jsonify(res)
 
 
@@ -65,4 +123,5 @@ class Remove(MethodView):
     @api.response(200, ModelRunInfo.Schema())
     def get(self, model_run_id: str):
         essim.remove(model_run_id=model_run_id)
+        result_responses.invalidate(model_run_id)
         return "REMOVED!", 200
@@ -0,0 +1,106 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from flask import Response, jsonify, request
+
+from tno.essim_adapter.settings import EnvSettings
+from tno.essim_adapter.types import ModelRunInfo
+
+
+class CachedResponse:
+    def __init__(self, model_run_info: ModelRunInfo, body: bytes):
+        # The outcome the body was serialized from, see ResponseCache.matches()
+        self.state = model_run_info.state
+        self.reason = model_run_info.reason
+        self.result = model_run_info.result
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.gzipped: Optional[bytes] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + len(self.gzipped or b"")
+
+
+class ResponseCache:
+    """The serialized JSON responses of model runs, so fetching the same results again costs no serialization.
+
+    A cached response is reused as long as the run's state, reason and result object are the same. Results are
+    replaced, never changed in place, once they are visible, so that identifies the version of a run's outcome.
+    Responses carry an ETag, a request with a matching If-None-Match gets a 304 without a body. Responses of
+    at least gzip_min_size bytes are gzip compressed for clients that accept it, compressed once per version.
+    """
+
+    def __init__(self, max_size: int, gzip_min_size: int):
+        self.max_size = max_size
+        self.gzip_min_size = gzip_min_size
+        self._responses: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def from_settings():
+        return ResponseCache(
+            max_size=EnvSettings.response_cache_size() * 1024 * 1024,
+            gzip_min_size=EnvSettings.response_gzip_min_size(),
+        )
+
+    @staticmethod
+    def matches(cached: CachedResponse, model_run_info: ModelRunInfo) -> bool:
+        return cached.state == model_run_info.state and cached.reason == model_run_info.reason \
+            and cached.result is model_run_info.result
+
+    def _get(self, model_run_info: ModelRunInfo) -> CachedResponse:
+        model_run_id = model_run_info.model_run_id
+        with self._lock:
+            cached = self._responses.get(model_run_id)
+            if cached is not None and self.matches(cached, model_run_info):
+                self._responses.move_to_end(model_run_id)
+                return cached
+
+        cached = CachedResponse(model_run_info, jsonify(model_run_info).get_data())
+        self._store(model_run_id, cached)
+        return cached
+
+    def _store(self, model_run_id: str, cached: CachedResponse):
+        with self._lock:
+            previous = self._responses.pop(model_run_id, None)
+            if previous is not None:
+                self._size -= previous.size
+            self._responses[model_run_id] = cached
+            self._size += cached.size
+            while self._size > self.max_size and self._responses:
+                _, evicted = self._responses.popitem(last=False)
+                self._size -= evicted.size
+
+    def invalidate(self, model_run_id: str):
+        """Drop the cached response of a run that was removed or evicted."""
+        with self._lock:
+            cached = self._responses.pop(model_run_id, None)
+            if cached is not None:
+                self._size -= cached.size
+
+    def response(self, model_run_info: ModelRunInfo) -> Response:
+        """The response with a ModelRunInfo, conditional on the request's If-None-Match."""
+        cached = self._get(model_run_info)
+        body, etag = cached.body, cached.etag
+        compress = len(body) >= self.gzip_min_size and "gzip" in request.accept_encodings
+        if compress:
+            if cached.gzipped is None:
+                gzipped = gzip.compress(body, compresslevel=6)
+                with self._lock:
+                    if cached.gzipped is None:
+                        cached.gzipped = gzipped
+                        if self._responses.get(model_run_info.model_run_id) is cached:
+                            self._size += len(gzipped)
+            body, etag = cached.gzipped, f"{etag}-gzip"
+
+        response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+        response.vary.add("Accept-Encoding")
+        if compress:
+            response.content_encoding = "gzip"
+        return response.make_conditional(request)
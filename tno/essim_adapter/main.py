@@ -22,11 +22,6 @@ logger = get_logger("tno.flask_rest_api.main")
 app = create_app("tno.essim_adapter.settings.%sConfig" % EnvSettings.env().capitalize())
 
 
-@app.before_request
-def before_request():
-    print(request)
-
-
 @app.after_request
 def after_request(response):
     timestamp = strftime("[%Y-%b-%d %H:%M]")
@@ -0,0 +1,74 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import aiohttp
+
+from tno.shared.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class AsyncRunEngine:
+    """Supervises model runs as coroutines on a single event loop, running in a thread next to the Flask app.
+
+    Waiting runs only cost a coroutine instead of a thread. All ESSIM requests share one aiohttp session.
+    MinIO and InfluxDB only have blocking clients, their calls are handed to a small bounded thread pool
+    through run_blocking(), so they never block the event loop.
+    """
+
+    def __init__(self, max_concurrent_runs: int, io_workers: int, request_timeout: float):
+        self.max_concurrent_runs = max_concurrent_runs
+        self.io_workers = io_workers
+        self.request_timeout = request_timeout
+
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._io_executor: Optional[ThreadPoolExecutor] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._run_slots: Optional[asyncio.Semaphore] = None
+
+    def start(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._io_executor = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="async-io")
+            self._thread = threading.Thread(target=self._run_loop, name="async-run-engine", daemon=True)
+            self._thread.start()
+            logger.info("Started asyncio run engine")
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def submit(self, coroutine_function, *args, **kwargs) -> Future:
+        """Schedule coroutine_function(*args, **kwargs) on the event loop, limited to max_concurrent_runs at a time.
+
+        Returns a concurrent.futures.Future, so it can be stored and queried like an executor future.
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self._limited(coroutine_function, *args, **kwargs), self._loop)
+
+    async def _limited(self, coroutine_function, *args, **kwargs):
+        if self._run_slots is None:
+            self._run_slots = asyncio.Semaphore(self.max_concurrent_runs)
+        async with self._run_slots:
+            return await coroutine_function(*args, **kwargs)
+
+    def session(self) -> aiohttp.ClientSession:
+        """The shared HTTP session, only to be used from coroutines running on the engine's event loop."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=0),
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            )
+        return self._session
+
+    async def run_blocking(self, fn, *args, **kwargs):
+        """Run a blocking call (MinIO, InfluxDB, ESDL processing) in the engine's I/O thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(self._io_executor,
+                                                                functools.partial(fn, *args, **kwargs))
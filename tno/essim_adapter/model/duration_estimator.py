@@ -0,0 +1,207 @@
+import json
+import math
+import os
+import threading
+from datetime import datetime
+from time import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from tno.essim_adapter.model.time_windows import ESSIM_DATETIME_FORMAT, ESSIM_TIME_STEP
+from tno.essim_adapter.settings import EnvSettings
+from tno.shared.log import get_logger
+
+logger = get_logger(__name__)
+
+# Phases of a run whose duration is predicted, the time a run waits in the queue depends on the other runs
+ESTIMATED_PHASES = ("fetch", "start", "simulation", "kpi", "post_process")
+FEATURES = ("hours", "esdl_kb", "assets", "profiles", "kpi_modules")
+# Weight of the older runs relative to the next one, so the estimates follow changes of the ESSIM engines
+FORGETTING_FACTOR = 0.98
+# Regularization of the coefficients, keeps the first estimates close to the mean duration
+RIDGE = 1.0
+
+
+def submit_features(essim_post_body: Dict[str, Any]) -> Dict[str, float]:
+    """The features of a run that are known without its input ESDL: simulated hours and KPI modules."""
+    features = {"kpi_modules": float(len((essim_post_body.get("kpiModule") or {}).get("modules") or []))}
+    try:
+        start = datetime.strptime(essim_post_body["startDate"], ESSIM_DATETIME_FORMAT)
+        end = datetime.strptime(essim_post_body["endDate"], ESSIM_DATETIME_FORMAT)
+        features["hours"] = max(0.0, (end - start) / ESSIM_TIME_STEP + 1)
+    except (KeyError, TypeError, ValueError):
+        pass
+    return features
+
+
+def esdl_features(esdl: bytes) -> Dict[str, float]:
+    """Size, assets and profiles of an ESDL, counted in the XML rather than parsed."""
+    return {
+        "esdl_kb": len(esdl) / 1024,
+        "assets": float(esdl.count(b"<asset ")),
+        "profiles": float(esdl.count(b"<profile ")),
+    }
+
+
+def solve(a: List[List[float]], b: List[float]) -> List[float]:
+    """Solve a x = b by Gaussian elimination with partial pivoting, a is positive definite."""
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(col + 1, n):
+            factor = m[r][col] / m[col][col]
+            for c in range(col, n + 1):
+                m[r][c] -= factor * m[col][c]
+    x = [0.0] * n
+    for r in reversed(range(n)):
+        x[r] = (m[r][n] - sum(m[r][c] * x[c] for c in range(r + 1, n))) / m[r][r]
+    return x
+
+
+class PhaseModel:
+    """Online ridge regression of the log of a phase's duration on the log of the features.
+
+    log(duration) is linear in log(1 + feature), i.e. the duration is a product of powers of the features,
+    e.g. a simulation takes about twice as long for twice the hours. The sums of x xᵀ and x y are decayed by
+    the forgetting factor at every sample, and solved for the coefficients when an estimate is needed.
+    """
+
+    def __init__(self, forgetting: float = FORGETTING_FACTOR, ridge: float = RIDGE):
+        self.forgetting = forgetting
+        self.ridge = ridge
+        n = len(FEATURES) + 1
+        self.xx = [[0.0] * n for _ in range(n)]
+        self.xy = [0.0] * n
+        self.samples = 0
+        self._coefficients: Optional[List[float]] = None
+
+    @staticmethod
+    def inputs(features: Dict[str, float]) -> List[float]:
+        return [1.0] + [math.log1p(max(0.0, features.get(name, 0.0))) for name in FEATURES]
+
+    def add(self, features: Dict[str, float], duration: float):
+        x = self.inputs(features)
+        y = math.log(max(duration, 0.01))
+        for i, xi in enumerate(x):
+            row = self.xx[i]
+            for j, xj in enumerate(x):
+                row[j] = self.forgetting * row[j] + xi * xj
+            self.xy[i] = self.forgetting * self.xy[i] + xi * y
+        self.samples += 1
+        self._coefficients = None
+
+    def mean(self) -> float:
+        # The intercept row holds the decayed sum of the samples and of their log durations
+        return math.exp(self.xy[0] / self.xx[0][0])
+
+    def predict(self, features: Dict[str, float]) -> float:
+        if self._coefficients is None:
+            # The intercept is not regularized
+            a = [[v + (self.ridge if i == j and i else 0.0) for j, v in enumerate(row)]
+                 for i, row in enumerate(self.xx)]
+            self._coefficients = solve(a, self.xy)
+        x = self.inputs(features)
+        return math.exp(sum(c * xi for c, xi in zip(self._coefficients, x)))
+
+
+class DurationEstimator:
+    """Estimates how long the phases of a model run take, learned from the runs that finished before.
+
+    Every finished run records the durations of its phases together with its features: the simulated hours,
+    the number of KPI modules, and the size, assets and profiles of its input ESDL. Runs are appended to the
+    history file and the last history_size runs are learned again at startup. A phase is estimated by the mean
+    of its durations until min_samples runs went through it, by a PhaseModel after that. Features that are not
+    known yet, e.g. of the ESDL before it is fetched, are assumed to be the mean of the runs seen.
+    """
+
+    def __init__(self, history_file: str, history_size: int, min_samples: int):
+        self.history_file = history_file
+        self.history_size = history_size
+        self.min_samples = min_samples
+        self.phases: Dict[str, PhaseModel] = {phase: PhaseModel() for phase in ESTIMATED_PHASES}
+        self._feature_sums: Dict[str, float] = {name: 0.0 for name in FEATURES}
+        self._feature_counts: Dict[str, int] = {name: 0 for name in FEATURES}
+        self._lock = threading.Lock()
+        self.load()
+
+    @staticmethod
+    def from_settings():
+        return DurationEstimator(
+            history_file=EnvSettings.run_history_file(),
+            history_size=EnvSettings.run_history_size(),
+            min_samples=EnvSettings.duration_min_samples(),
+        )
+
+    def load(self):
+        if not self.history_file or not os.path.exists(self.history_file):
+            return
+        try:
+            with open(self.history_file) as f:
+                lines = f.readlines()
+        except OSError as e:
+            logger.warning(f"Cannot read the run history {self.history_file}: {e}")
+            return
+
+        records = []
+        for line in lines[-self.history_size:]:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        for record in records:
+            self.learn(record.get("features") or {}, record.get("durations") or {})
+        if len(lines) > 2 * self.history_size:
+            # Keep the file from growing without bounds
+            self._write(records, "w")
+        logger.info(f"Learned the durations of {len(records)} runs from {self.history_file}")
+
+    def _write(self, records: List[Dict[str, Any]], mode: str):
+        try:
+            with open(self.history_file, mode) as f:
+                f.write("".join(json.dumps(record) + "\n" for record in records))
+        except OSError as e:
+            logger.warning(f"Cannot write the run history {self.history_file}: {e}")
+
+    def learn(self, features: Dict[str, float], durations: Dict[str, float]):
+        with self._lock:
+            for name in FEATURES:
+                if name in features:
+                    self._feature_sums[name] += features[name]
+                    self._feature_counts[name] += 1
+            for phase, duration in durations.items():
+                if phase in self.phases:
+                    self.phases[phase].add(self.complete(features), duration)
+
+    def record(self, model_run_id: str, features: Dict[str, float], durations: Dict[str, float],
+               queue_wait: Optional[float] = None):
+        """Learn from a finished run and add it to the history."""
+        self.learn(features, durations)
+        if self.history_file:
+            # Runs finishing at the same time must not interleave their lines in the history
+            with self._lock:
+                self._write([{
+                    "model_run_id": model_run_id,
+                    "finished_at": time(),
+                    "features": features,
+                    "durations": durations,
+                    "queue_wait": queue_wait,
+                }], "a")
+
+    def complete(self, features: Dict[str, float]) -> Dict[str, float]:
+        """The features with the missing ones filled in by the mean of the runs seen."""
+        return {name: features[name] if name in features else
+                self._feature_sums[name] / self._feature_counts[name] if self._feature_counts[name] else 0.0
+                for name in FEATURES}
+
+    def estimate(self, features: Dict[str, float], phases: Iterable[str] = ESTIMATED_PHASES) -> Optional[float]:
+        """Estimated seconds the given phases take, None until every one of them was seen once."""
+        with self._lock:
+            features = self.complete(features)
+            total = 0.0
+            for phase in phases:
+                model = self.phases[phase]
+                if not model.samples:
+                    return None
+                total += model.mean() if model.samples < self.min_samples else model.predict(features)
+            return total
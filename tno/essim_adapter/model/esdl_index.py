@@ -0,0 +1,105 @@
+from typing import Dict, List, Tuple, Type
+
+import esdl
+from pyecore.ecore import EClass, EObject, EReference
+
+# Reflective feature lists per EClass, computing them walks all super types, so they are shared by all indexes
+_containment_features: Dict[EClass, List[Tuple[str, bool]]] = {}
+_reference_features: Dict[EClass, List[str]] = {}
+
+
+def containment_features(eclass: EClass) -> List[Tuple[str, bool]]:
+    """(name, many) of the containment references of an EClass."""
+    features = _containment_features.get(eclass)
+    if features is None:
+        features = [(f.name, f.many) for f in eclass.eAllReferences() if f.containment and not f.derived]
+        _containment_features[eclass] = features
+    return features
+
+
+def reference_features(eclass: EClass) -> List[str]:
+    """Names of the single valued references of an EClass, the features that can refer to a profile."""
+    features = _reference_features.get(eclass)
+    if features is None:
+        features = [f.name for f in eclass.eAllStructuralFeatures() if isinstance(f, EReference) and not f.many]
+        _reference_features[eclass] = features
+    return features
+
+
+class ESDLIndex:
+    """Index of an energy system, built in a single traversal of its containment tree.
+
+    Besides the objects by id and by type, it collects every place an InfluxDB profile is attached:
+    asset ports, asset cost information, carrier costs and environmental profiles.
+    """
+
+    def __init__(self, energy_system: esdl.EnergySystem):
+        self.energy_system = energy_system
+        self.by_id: Dict[str, EObject] = {}
+        self.by_type: Dict[Type, List[EObject]] = {}
+
+        self.influxdb_profiles: List[esdl.InfluxDBProfile] = []
+        # (asset, port, profile)
+        self.port_profiles: List[Tuple[esdl.Asset, esdl.Port, esdl.InfluxDBProfile]] = []
+        # (asset, cost information type, profile)
+        self.cost_information_profiles: List[Tuple[esdl.Asset, str, esdl.InfluxDBProfile]] = []
+        # (carrier, profile)
+        self.carrier_cost_profiles: List[Tuple[esdl.Carrier, esdl.InfluxDBProfile]] = []
+        # (environmental profile type, profile)
+        self.environmental_profiles: List[Tuple[str, esdl.InfluxDBProfile]] = []
+
+        self._instances_of_type: Dict[Type, List[EObject]] = {}
+        self._build()
+
+    def _build(self):
+        stack = [self.energy_system]
+        while stack:
+            obj = stack.pop()
+            self._add(obj)
+            for name, many in containment_features(obj.eClass):
+                value = getattr(obj, name)
+                if many:
+                    stack.extend(reversed([child for child in value if child is not None]))
+                elif value is not None:
+                    stack.append(value)
+
+    def _add(self, obj: EObject):
+        self.by_type.setdefault(type(obj), []).append(obj)
+        object_id = getattr(obj, "id", None)
+        if object_id:
+            self.by_id[object_id] = obj
+
+        if isinstance(obj, esdl.InfluxDBProfile):
+            self.influxdb_profiles.append(obj)
+        elif isinstance(obj, esdl.Port):
+            for profile in obj.profile:
+                if isinstance(profile, esdl.ProfileReference):
+                    profile = profile.reference
+                if isinstance(profile, esdl.InfluxDBProfile):
+                    self.port_profiles.append((obj.eContainer(), obj, profile))
+        elif isinstance(obj, esdl.Asset):
+            cost_information = obj.costInformation
+            if cost_information:
+                for name in reference_features(cost_information.eClass):
+                    profile = getattr(cost_information, name)
+                    if isinstance(profile, esdl.InfluxDBProfile):
+                        self.cost_information_profiles.append((obj, name, profile))
+        elif isinstance(obj, esdl.Carrier):
+            if isinstance(obj.cost, esdl.InfluxDBProfile):
+                self.carrier_cost_profiles.append((obj, obj.cost))
+        elif isinstance(obj, esdl.EnvironmentalProfiles):
+            for name in reference_features(obj.eClass):
+                profile = getattr(obj, name)
+                if isinstance(profile, esdl.InfluxDBProfile):
+                    self.environmental_profiles.append((name, profile))
+
+    def get(self, object_id: str) -> EObject:
+        return self.by_id.get(object_id)
+
+    def instances_of_type(self, esdl_type: Type) -> List[EObject]:
+        """All objects of an ESDL type or its subtypes, like EnergySystemHandler.get_all_instances_of_type()."""
+        instances = self._instances_of_type.get(esdl_type)
+        if instances is None:
+            instances = [obj for cls, objects in self.by_type.items() if issubclass(cls, esdl_type) for obj in objects]
+            self._instances_of_type[esdl_type] = instances
+        return instances
@@ -0,0 +1,111 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from uuid import uuid4
+
+import esdl
+import esdl.esdl_handler
+
+from tno.essim_adapter.settings import EnvSettings
+
+
+def add_kpis(es: esdl.EnergySystem, result):
+    """Add the KPIs calculated by the ESSIM KPI modules to the main area of the energy system."""
+    kpi_list = []
+
+    # Quick 'hack' to ease mapping to ESDL types
+    kpi_unit_mapping = {
+        "PERCENTAGE": "PERCENT"
+    }
+
+    for essim_result in result:
+        kpi_id = essim_result["id"]
+        kpi_description = essim_result["descr"]
+
+        # KPI modules that failed have no results
+        for kpi_result in essim_result.get("kpi", []):
+            for kpi_level in kpi_result:
+                for kpi_selection in kpi_result[kpi_level]:
+                    kpi_name = kpi_selection["Name"]
+                    kpi_unit = kpi_selection["Unit"].upper()
+                    if kpi_unit in kpi_unit_mapping:
+                        kpi_unit = kpi_unit_mapping[kpi_unit]
+                    kpi_unit_enum = esdl.UnitEnum.from_string(kpi_unit)
+                    kpi_unit = esdl.QuantityAndUnitType(id=str(uuid4()), unit=kpi_unit_enum)
+                    kpi_values = kpi_selection["Values"]
+
+                    if type(kpi_values) == list:
+                        for item in kpi_values:
+                            kpi_sub_name = kpi_name + " - " + item["carrier"]
+                            kpi_sub_unit = esdl.QuantityAndUnitType(
+                                unit=kpi_unit_enum, description=item["carrier"]
+                            )
+                            kpi_list.append(
+                                esdl.DoubleKPI(
+                                    id=str(uuid4()),
+                                    name=kpi_sub_name,
+                                    quantityAndUnit=kpi_sub_unit,
+                                    value=float(item["value"]),
+                                )
+                            )
+                    else:
+                        kpi_list.append(
+                            esdl.DoubleKPI(
+                                id=str(uuid4()),
+                                name=kpi_name,
+                                quantityAndUnit=kpi_unit,
+                                value=float(kpi_values),
+                            )
+                        )
+
+    kpis = esdl.KPIs(id=kpi_id, description=kpi_description, kpi=kpi_list)
+    es.instance.items[0].area.KPIs = kpis
+
+
+def attach_kpis(input_esdl: bytes, result) -> bytes:
+    """Parse an ESDL, add the KPIs and serialize it again. Bytes in and bytes out, so it can run in another process."""
+    esh = esdl.esdl_handler.EnergySystemHandler()
+    es: esdl.EnergySystem = esh.load_from_string(input_esdl.decode('UTF-8'))
+    add_kpis(es, result)
+    return esh.to_string().encode('utf-8')
+
+
+class ESDLProcessPool:
+    """Runs CPU-bound ESDL work, parsing, adding KPIs and serializing, in separate processes.
+
+    pyecore is pure Python, while a large ESDL is processed the GIL would otherwise stall all other threads of
+    the adapter, including the ones answering status requests. Work is passed as bytes in and bytes out.
+    Worker processes are started by a forkserver that preloads the ESDL metamodel, as forking a process
+    with running threads is not safe. A size of 0 runs everything in the calling thread.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # A pool inherited from the gunicorn master can not be used by a worker, every process has its own
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                if "forkserver" in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context("forkserver")
+                    context.set_forkserver_preload([__name__])
+                else:
+                    context = multiprocessing.get_context("spawn")
+                self._executor = ProcessPoolExecutor(max_workers=self.size, mp_context=context)
+                self._pid = os.getpid()
+                atexit.register(self._executor.shutdown, wait=False)
+            return self._executor
+
+    def run(self, fn, *args):
+        if self.size <= 0:
+            return fn(*args)
+        return self._get_executor().submit(fn, *args).result()
+
+
+esdl_process_pool = ESDLProcessPool(size=EnvSettings.esdl_process_pool_size())
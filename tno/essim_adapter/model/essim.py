@@ -1,135 +1,401 @@
+import asyncio
 import base64
+import dataclasses
 import json
 import requests
+import threading
+from typing import Dict, List, Optional, Set, Tuple
 from datetime import datetime
-from time import sleep, time
+from time import time
 
+import aiohttp
 from esdl import esdl
 from esdl.esdl_handler import EnergySystemHandler
 
+from tno.essim_adapter.model.async_engine import AsyncRunEngine
+from tno.essim_adapter.model.duration_estimator import (ESTIMATED_PHASES, DurationEstimator, esdl_features,
+                                                        submit_features)
+from tno.essim_adapter.model.essim_pool import ESSIM_HEADERS, ESSIMEngine, essim_pool
+from tno.essim_adapter.model.kpi_catalog import kpi_catalog
 from tno.essim_adapter.model.model import Model, ModelState
+from tno.essim_adapter.model.pipeline import PipelineRun, RunPipeline
+from tno.essim_adapter.model.poll_scheduler import AdaptivePollScheduler
+from tno.essim_adapter.model.retention import RunRetentionManager
+from tno.essim_adapter.model.run_control import RunControl
+from tno.essim_adapter.model.run_state import RunStateStore
+from tno.essim_adapter.model.scheduler import RunScheduler, run_tenant
+from tno.essim_adapter.model.time_windows import KPIMergeRules, merge_kpi_results, split_time_windows
+from tno.essim_adapter.model.timeseries_export import TimeSeriesExporter
 from tno.essim_adapter.settings import EnvSettings
-from tno.essim_adapter.types import ESSIMAdapterConfig, ModelRunInfo, MonitorKPIResult
+from tno.essim_adapter.types import ESSIMAdapterConfig, ModelRun, ModelRunInfo, ModelRunQuery, MonitorKPIResult
 from tno.essim_adapter import executor
 from tno.shared.log import get_logger
 
 logger = get_logger(__name__)
 
-ESSIM_URL = EnvSettings.essim_url()
-ESSIM_HEADERS = {'Content-Type': 'application/json', 'Accept': 'application/json'}
-PROGRESS_UPDATE_INTERVAL = 1
+KPI_CALCULATING_STATES = ('Not yet started', 'Calculating')
+
+async_engine = AsyncRunEngine(
+    max_concurrent_runs=EnvSettings.async_max_concurrent_runs(),
+    io_workers=EnvSettings.async_io_workers(),
+    request_timeout=EnvSettings.essim_request_timeout(),
+)
+
+
+class StartAttempts:
+    """The decisions of starting a simulation on one of the ESSIM engines, shared by start_essim() and
+    async_start_essim(), which only do the requests and the waiting."""
+
+    def __init__(self, model_run_id, control: RunControl):
+        self.model_run_id = model_run_id
+        self.control = control
+        control.enter_phase("start")
+
+    def next_engine(self) -> Tuple[Optional[ESSIMEngine], Optional[ModelRunInfo]]:
+        """The engine to offer the simulation to next, no engine to wait for one, or the ModelRunInfo of a run
+        that has to stop."""
+        if self.control.stop_reason:
+            return None, ESSIM.stopped(self.model_run_id, self.control)
+        engine = essim_pool.acquire()
+        if engine is None:
+            if essim_pool.all_failed():
+                return None, ESSIM.no_engine_available(self.model_run_id)
+            logger.info('All ESSIM engines are busy or unavailable. Waiting for one to become available...')
+            return None, None
+        logger.info(f'Trying to start ESSIM on {engine.url}...')
+        return engine, None
+
+    def answered(self, engine: ESSIMEngine, status_code, response):
+        """The (ModelRunInfo, simulation_id, engine) of a final answer, None to offer it to another engine."""
+        started = ESSIM.handle_start_response(engine, status_code, response, self.model_run_id)
+        if started is None:
+            return None
+        start_essim_info, simulation_id = started
+        return start_essim_info, simulation_id, (engine if simulation_id else None)
+
+    def failed(self, engine: ESSIMEngine, e, reached: bool):
+        """Like answered(), for a request that got no answer."""
+        failed = ESSIM.handle_start_error(engine, e, self.model_run_id, reached)
+        return None if failed is None else (failed, None, None)
+
+
+class SimulationMonitor:
+    """The decisions of polling the status of a simulation, shared by monitor_essim_progress() and
+    async_monitor_essim_progress(), which only do the requests and the waiting."""
+
+    phase = "simulation"
+    monitored = "ESSIM"
+    api_error = 'ESSIM progress monitoring API error'
+
+    def __init__(self, model_run_id, essim_url, control: RunControl):
+        self.model_run_id = model_run_id
+        self.essim_url = essim_url
+        self.poll_scheduler = AdaptivePollScheduler()
+        logger.info(f"Start monitoring {self.monitored} progress...")
+        control.enter_phase(self.phase)
+
+    def lost_connection(self, e) -> ModelRunInfo:
+        return ESSIM.lost_connection(self.essim_url, self.model_run_id, self.api_error, e)
+
+    def observe(self, status_code, response) -> Tuple[Optional[ModelRunInfo], float]:
+        """The final ModelRunInfo, or None and the seconds to wait before the next poll."""
+        monitor_essim_progress_info, progress = ESSIM.handle_status_response(status_code, response,
+                                                                             self.model_run_id)
+        if monitor_essim_progress_info is not None:
+            logger.info(f'Simulation monitoring finished after {self.poll_scheduler.polls + 1} status polls')
+            return monitor_essim_progress_info, 0.0
+        return None, self.poll_scheduler.observe(progress)
+
+
+class KPIMonitor(SimulationMonitor):
+    """Like SimulationMonitor, for the KPI modules. publish is called with the KPI results whenever another
+    KPI module finished."""
+
+    phase = "kpi"
+    monitored = "KPI"
+    api_error = 'Monitor KPI modules API error'
+
+    def __init__(self, model_run_id, essim_url, control: RunControl, publish=None):
+        super().__init__(model_run_id, essim_url, control)
+        self.publish = publish
+        self.finished_modules = set()
+
+    def observe(self, status_code, response) -> Tuple[Optional[ModelRunInfo], float]:
+        monitor_kpi_progress_info, kpis_info = ESSIM.handle_kpi_response(status_code, response, self.model_run_id)
+        if monitor_kpi_progress_info is not None:
+            logger.info(f'KPI monitoring finished after {self.poll_scheduler.polls + 1} polls')
+            return monitor_kpi_progress_info, 0.0
+
+        # Publish a new partial result set whenever another KPI module finished
+        if self.publish and ESSIM.finished_kpi_modules(kpis_info) != self.finished_modules:
+            self.finished_modules = ESSIM.finished_kpi_modules(kpis_info)
+            self.publish(kpis_info.results)
+        return None, self.poll_scheduler.observe(kpis_info.progress)
 
 
 class ESSIM(Model):
 
-    def start_essim(self, config: ESSIMAdapterConfig, model_run_id):
+    def __init__(self):
+        super().__init__()
+        self._usage_lock = threading.Lock()
+        self._queued_runs = 0
+        self._in_flight_runs = 0
+        # The runs holding a run slot, time windows included
+        self._active_runs: Set[PipelineRun] = set()
+        self.run_controls: Dict[str, RunControl] = {}
+        self.retention = RunRetentionManager.from_settings(self)
+        self.run_state = RunStateStore.from_settings()
+        self.kpi_merge_rules = KPIMergeRules.from_settings()
+        self.timeseries_exporter = TimeSeriesExporter.from_settings(self)
+        self.duration_estimator = DurationEstimator.from_settings()
+
+        # A run holds one of the run slots of its engine from the moment it leaves the queue until its KPIs are
+        # calculated, the scheduler decides which queued run gets the next one
+        self.scheduler = RunScheduler.from_settings(on_slot=self.start_queued_run, on_stopped=self.dispatch_run)
+        queue_size = EnvSettings.pipeline_queue_size()
+        self.pipeline = RunPipeline([
+            ("fetch", self.fetch_stage, EnvSettings.pipeline_workers("fetch"), 0),
+            ("attach", self.attach_stage, EnvSettings.pipeline_workers("submit"), 0),
+            ("submit", self.submit_stage, EnvSettings.pipeline_workers("submit"), queue_size),
+            ("simulation", self.simulation_stage, EnvSettings.max_workers(), 0),
+            ("kpi", self.kpi_stage, EnvSettings.max_workers(), 0),
+            ("post_process", self.post_process_stage, EnvSettings.pipeline_workers("post_process"), queue_size),
+            ("export", self.export_stage, EnvSettings.pipeline_workers("export"), queue_size),
+            ("upload", self.upload_stage, EnvSettings.pipeline_workers("upload"), queue_size),
+        ], on_finish=self.release_run)
+
+    def usage(self):
+        with self._usage_lock:
+            return {
+                "used_workers": self._in_flight_runs,
+                "queue_length": self._queued_runs,
+            }
+
+    def essim_post_body(self, config: ESSIMAdapterConfig, features: Dict[str, float] = None):
         path = self.process_path(config.input_esdl_file_path, config.base_path)
         input_esdl_bytes = self.load_from_minio(path)
+        if features is not None:
+            features.update(esdl_features(input_esdl_bytes))
         input_esdl_b64_bytes = base64.b64encode(input_esdl_bytes)
         input_esdl_b64_string = input_esdl_b64_bytes.decode('utf-8')
 
-        essim_post_body = config.essim_post_body
+        # Copy the body, so the config of the run does not keep the base64 encoded ESDL in memory
+        essim_post_body = dict(config.essim_post_body)
         essim_post_body['esdlContents'] = input_esdl_b64_string
+        return essim_post_body
+
+    @staticmethod
+    def handle_start_response(engine, status_code, response, model_run_id):
+        """Interpret ESSIM's answer to a start request.
+
+        Returns a (ModelRunInfo, simulation_id) tuple when the start attempt is final, or None when the
+        simulation should be offered to another engine.
+        """
+        logger.debug(f'ESSIM start response: {status_code}')
+        if status_code == 201:
+            simulation_id = response['id']
+            logger.info(
+                'Successfully started ESSIM Simulation with id {id} on {url}'.format(id=simulation_id, url=engine.url))
+            return ModelRunInfo(
+                model_run_id=model_run_id,
+                state=ModelState.RUNNING,
+            ), simulation_id
+        elif status_code == 503:
+            essim_pool.mark_busy(engine)
+        elif status_code >= 500:
+            logger.warning(f'ESSIM engine {engine.url} returned {status_code}')
+            essim_pool.mark_failed(engine)
+        else:
+            essim_pool.release(engine)
+            logger.error(f'ESSIM Simulation failed because: {response["description"]}')
+            return ModelRunInfo(
+                model_run_id=model_run_id,
+                state=ModelState.ERROR,
+                reason=f'ESSIM Simulation failed because: {response["description"]}',
+            ), None
+        return None
+
+    @staticmethod
+    def handle_start_error(engine, e, model_run_id, reached: bool):
+        """Handle a start request that got no answer.
+
+        A request that never reached the engine is offered to another engine (returns None). A request that
+        reached it, e.g. and then timed out, may have started a simulation that starting it again elsewhere
+        would orphan, so the run fails.
+        """
+        if not reached:
+            logger.warning(f'Could not reach ESSIM engine {engine.url}: {e}')
+            essim_pool.mark_failed(engine)
+            return None
+        logger.error(f'Start request to ESSIM engine {engine.url} failed: {e}')
+        essim_pool.release(engine)
+        return ModelRunInfo(
+            model_run_id=model_run_id,
+            state=ModelState.ERROR,
+            reason=f'Could not start the ESSIM simulation on {engine.url}: {e}',
+        )
+
+    @staticmethod
+    def no_engine_available(model_run_id):
+        reason = 'All ESSIM engines failed' if essim_pool.engines else \
+            'No ESSIM engines configured, set ESSIM_URL or ESSIM_URLS'
+        logger.error(reason)
+        return ModelRunInfo(
+            model_run_id=model_run_id,
+            state=ModelState.ERROR,
+            reason=reason,
+        )
+
+    def start_essim(self, config: ESSIMAdapterConfig, model_run_id, control: RunControl = None,
+                    essim_post_body=None):
+        control = control or RunControl()
+        attempts = StartAttempts(model_run_id, control)
+        if essim_post_body is None:
+            essim_post_body = self.essim_post_body(config)
 
         while True:
-            logger.info('Trying to start ESSIM...')
-            r = requests.post(url=ESSIM_URL, data=json.dumps(essim_post_body), headers=ESSIM_HEADERS)
-            response = r.json()
-            status_code = r.status_code
-            print('start: ', status_code)
-            if status_code == 201:
-                simulation_id = response['id']
-                logger.info(
-                    'Successfully started ESSIM Simulation with id {id}'.format(id=simulation_id))
+            engine, stopped = attempts.next_engine()
+            if stopped is not None:
+                return stopped, None, None
+            if engine is None:
+                essim_pool.wait_for_engine(control.bounded(EnvSettings.essim_busy_backoff()))
+                continue
+
+            try:
+                r = requests.post(url=engine.url, data=json.dumps(essim_post_body), headers=ESSIM_HEADERS,
+                                  timeout=EnvSettings.essim_request_timeout())
+            except requests.exceptions.RequestException as e:
+                # A ConnectionError (including a connect timeout) means the request was never received
+                started = attempts.failed(engine, e, reached=not isinstance(e, requests.exceptions.ConnectionError))
+            else:
+                started = attempts.answered(engine, r.status_code, ESSIM.response_json(r))
+            if started is not None:
+                return started
+
+    @staticmethod
+    def response_json(r):
+        try:
+            return r.json()
+        except ValueError:
+            return {}
+
+    @staticmethod
+    def handle_status_response(status_code, response, model_run_id):
+        """Interpret an ESSIM simulation status response.
+
+        Returns a (ModelRunInfo, progress) tuple, the ModelRunInfo is None while the simulation is still running.
+        """
+        logger.debug(f'ESSIM status response: {status_code}')
+        if status_code == 200:
+            if response['State'] == 'RUNNING':
+                progress = float(response['Description'])
+                logger.info('{:.1f}% complete'.format(100 * progress))
+                return None, progress
+            elif response['State'] == 'COMPLETE':
+                logger.info('Simulation {}'.format(response['Description']))
                 return ModelRunInfo(
                     model_run_id=model_run_id,
-                    state=ModelState.RUNNING,
-                ), simulation_id
-            elif status_code == 503:
-                logger.info('The ESSIM Engine is busy. Retrying in 5 seconds...')
-                sleep(5)
-            else:
-                logger.error(f'ESSIM Simulation failed because: {response["description"]}')
+                    state=ModelState.RUNNING,       # for now keep RUNNING here, as KPIs still needs to be queried
+                ), 1.0
+            elif response['State'] == 'ERROR':
+                logger.error(f'ESSIM Simulation failed because: {response["Description"]}')
                 return ModelRunInfo(
                     model_run_id=model_run_id,
                     state=ModelState.ERROR,
-                    reason=f'ESSIM Simulation failed because: {response["description"]}',
+                    reason=f'ESSIM Simulation failed because: {response["Description"]}',
                 ), None
-
-    @staticmethod
-    def monitor_essim_progress(simulation_id, model_run_id):
-        if simulation_id is None:
-            logger.error('No simulation is started yet!')
+            return None, None
+        elif status_code == 404:
+            logger.error(response.get('Description'))
             return ModelRunInfo(
                 model_run_id=model_run_id,
                 state=ModelState.ERROR,
-                reason='No simulation is started yet!',
-            )
+                reason=f'ESSIM progress monitoring API error (404): {response.get("Description")}',
+            ), None
+        else:
+            logger.error(response.get('Description'))
+            return ModelRunInfo(
+                model_run_id=model_run_id,
+                state=ModelState.ERROR,
+                reason=f'ESSIM progress monitoring API error ({status_code}): {response.get("Description")}',
+            ), None
 
-        logger.info("Start monitoring ESSIM progress...")
-        status_path = f'{ESSIM_URL}/{simulation_id}/status'
-        while True:
-            r = requests.get(url=status_path, headers=ESSIM_HEADERS)
-            response = r.json()
-            status_code = r.status_code
-            print('monitor ', status_code)
-            if status_code == 200:
-                if response['State'] == 'RUNNING':
-                    logger.info('{:.1f}% complete'.format(100 * float(response['Description'])))
-                    sleep(PROGRESS_UPDATE_INTERVAL)
-                elif response['State'] == 'COMPLETE':
-                    logger.info('Simulation {}'.format(response['Description']))
-                    return ModelRunInfo(
-                        model_run_id=model_run_id,
-                        state=ModelState.RUNNING,       # for now keep RUNNING here, as KPIs still needs to be queried
-                    )
-                elif response['State'] == 'ERROR':
-                    logger.error(f'ESSIM Simulation failed because: {response["Description"]}')
-                    return ModelRunInfo(
-                        model_run_id=model_run_id,
-                        state=ModelState.ERROR,
-                        reason=f'ESSIM Simulation failed because: {response["Description"]}',
-                    )
-            elif status_code == 404:
-                logger.error(response['Description'])
-                return ModelRunInfo(
-                    model_run_id=model_run_id,
-                    state=ModelState.ERROR,
-                    reason=f'ESSIM progress monitoring API error (404): {response["Description"]}',
-                )
+    @staticmethod
+    def lost_connection(essim_url, model_run_id, reason, e):
+        logger.error(f'Lost connection to ESSIM engine {essim_url}: {e}')
+        essim_pool.mark_failed(essim_pool.get(essim_url), release=False)
+        return ModelRunInfo(
+            model_run_id=model_run_id,
+            state=ModelState.ERROR,
+            reason=f'{reason}: {e}',
+        )
+
+    @staticmethod
+    def stopped(model_run_id, control: RunControl):
+        logger.warning(f'Stopping model run {model_run_id}: {control.stop_reason}')
+        return ModelRunInfo(
+            model_run_id=model_run_id,
+            state=ModelState.ERROR,
+            reason=control.stop_reason,
+        )
+
+    @staticmethod
+    def cancel_simulation(essim_url, simulation_id):
+        """Ask ESSIM to stop a simulation, for engines that support cancelling simulations."""
+        try:
+            r = requests.delete(url=f'{essim_url}/{simulation_id}', headers=ESSIM_HEADERS,
+                                timeout=EnvSettings.essim_request_timeout())
+            if r.ok:
+                logger.info(f'Cancelled ESSIM simulation {simulation_id} on {essim_url}')
             else:
-                logger.error(response['Description'])
-                return ModelRunInfo(
-                    model_run_id=model_run_id,
-                    state=ModelState.ERROR,
-                    reason=f'ESSIM progress monitoring API error ({status_code}): {response["Description"]}',
-                )
+                logger.info(f'ESSIM engine {essim_url} did not cancel simulation {simulation_id} ({r.status_code})')
+        except requests.exceptions.RequestException as e:
+            logger.warning(f'Could not cancel ESSIM simulation {simulation_id} on {essim_url}: {e}')
+
+    @staticmethod
+    def no_simulation_started(model_run_id):
+        logger.error('No simulation is started yet!')
+        return ModelRunInfo(
+            model_run_id=model_run_id,
+            state=ModelState.ERROR,
+            reason='No simulation is started yet!',
+        )
 
     @staticmethod
-    def get_kpi_list():
-        kpi_list = []
+    def monitor_essim_progress(simulation_id, model_run_id, essim_url, control: RunControl = None):
+        if simulation_id is None:
+            return ESSIM.no_simulation_started(model_run_id)
 
-        status_path = f'{ESSIM_URL}/kpiModules'
-        r = requests.get(url=status_path, headers=ESSIM_HEADERS)
-        response = r.json()
-        status_code = r.status_code
+        control = control or RunControl()
+        monitor = SimulationMonitor(model_run_id, essim_url, control)
+        status_path = f'{essim_url}/{simulation_id}/status'
+        while True:
+            try:
+                r = requests.get(url=status_path, headers=ESSIM_HEADERS, timeout=EnvSettings.essim_request_timeout())
+            except requests.exceptions.RequestException as e:
+                return monitor.lost_connection(e)
 
-        if status_code == 200:
-            # only communicate unique KPI-modules (because they are deployed multiple times)
-            already_added_kpi_modules = []
-            for kpi in response:
-                if not kpi["calculator_id"] in already_added_kpi_modules:
-                    kpi_list.append({
-                        "id": kpi["calculator_id"],
-                        "name": kpi["title"],
-                        "descr": kpi["description"]
-                    })
-                    already_added_kpi_modules.append(kpi["calculator_id"])
-
-        return kpi_list
+            monitor_essim_progress_info, wait = monitor.observe(r.status_code, ESSIM.response_json(r))
+            if monitor_essim_progress_info is not None:
+                return monitor_essim_progress_info
+            if not control.sleep(wait):
+                return ESSIM.stopped(model_run_id, control)
 
     @staticmethod
-    def process_kpi_results(kpi_result_array, kpi_list):
+    def kpi_module_progress(kpi_info):
+        """Progress of a single KPI module as a fraction between 0 and 1."""
+        if kpi_info['calc_status'] == 'Not yet started':
+            return 0.0
+        if kpi_info['calc_status'] == 'Calculating':
+            try:
+                progress = float(kpi_info['progress'])
+            except (KeyError, TypeError, ValueError):
+                return 0.0
+            return progress / 100 if progress > 1 else progress
+        return 1.0
+
+    @staticmethod
+    def process_kpi_results(kpi_result_array, kpi_index):
         kpis_this_sim_run = []
         one_still_calculating = False
 
@@ -137,14 +403,12 @@ class ESSIM(Model):
             kpi_id = list(kpi_result_item.keys())[0]
             kpi_result = kpi_result_item[kpi_id]
 
+            kpi = kpi_index.get(kpi_id)
+
             kpi_info = dict()
             kpi_info['id'] = kpi_id
-            kpi_info['name'] = None
-            kpi_info['descr'] = None
-            for kpi in kpi_list:
-                if kpi['id'] == kpi_id:
-                    kpi_info['name'] = kpi['name']
-                    kpi_info['descr'] = kpi['descr']
+            kpi_info['name'] = kpi['name'] if kpi else None
+            kpi_info['descr'] = kpi['descr'] if kpi else None
 
             kpi_info['calc_status'] = kpi_result['status']
             if kpi_info['calc_status'] == 'Not yet started':
@@ -159,78 +423,552 @@ class ESSIM(Model):
 
             kpis_this_sim_run.append(kpi_info)
 
+        progress = None
+        if kpis_this_sim_run:
+            progress = sum(ESSIM.kpi_module_progress(k) for k in kpis_this_sim_run) / len(kpis_this_sim_run)
+
         return MonitorKPIResult(
             still_calculating=one_still_calculating,
-            results=kpis_this_sim_run
+            results=kpis_this_sim_run,
+            progress=progress
         )
 
+    def publish_partial_kpi_results(self, model_run_id, kpi_results):
+        """Make the KPI modules that already finished (successfully or not) available through results().
+
+        Only while the run calculates KPIs: once it finished, its result is where the KPIs are stored (path).
+        """
+        if model_run_id in self.model_run_dict:
+            self.model_run_dict[model_run_id].result = {
+                "complete": False,
+                "kpi_modules": {kpi['id']: kpi['calc_status'] for kpi in kpi_results},
+                "kpis": [kpi for kpi in kpi_results if kpi['calc_status'] not in KPI_CALCULATING_STATES],
+            }
+
     @staticmethod
-    def monitor_kpi_progress(simulation_id, model_run_id):
-        if simulation_id is None:
-            logger.error('No simulation is started yet!')
+    def handle_kpi_response(status_code, response, model_run_id):
+        """Interpret an ESSIM KPI response.
+
+        Returns a (ModelRunInfo, MonitorKPIResult) tuple, the ModelRunInfo is None while KPI modules are still
+        calculating.
+        """
+        logger.debug(f'ESSIM KPI response: {status_code}')
+        if status_code == 200:
+            kpis_info = ESSIM.process_kpi_results(response, kpi_catalog.index())
+            if kpis_info.still_calculating:
+                return None, kpis_info
+
+            logger.info('KPI modules finished')
+            return ModelRunInfo(
+                model_run_id=model_run_id,
+                state=ModelState.SUCCEEDED,
+                result=kpis_info.results
+            ), kpis_info
+        else:
+            logger.error(f'Monitor KPI modules API error ({status_code})')
             return ModelRunInfo(
                 model_run_id=model_run_id,
                 state=ModelState.ERROR,
-                reason='No simulation is started yet!',
+                reason=f'Monitor KPI modules API error ({status_code})',
+            ), None
+
+    @staticmethod
+    def finished_kpi_modules(kpis_info: MonitorKPIResult):
+        return {kpi['id'] for kpi in kpis_info.results if kpi['calc_status'] not in KPI_CALCULATING_STATES}
+
+    @staticmethod
+    def monitor_kpi_progress(simulation_id, model_run_id, essim_url, publish=None, control: RunControl = None):
+        if simulation_id is None:
+            return ESSIM.no_simulation_started(model_run_id)
+
+        control = control or RunControl()
+        monitor = KPIMonitor(model_run_id, essim_url, control, publish)
+        kpi_path = f'{essim_url}/{simulation_id}/kpi'
+        while True:
+            try:
+                r = requests.get(url=kpi_path, headers=ESSIM_HEADERS, timeout=EnvSettings.essim_request_timeout())
+            except requests.exceptions.RequestException as e:
+                return monitor.lost_connection(e)
+
+            monitor_kpi_progress_info, wait = monitor.observe(r.status_code, ESSIM.response_json(r))
+            if monitor_kpi_progress_info is not None:
+                return monitor_kpi_progress_info
+            if not control.sleep(wait):
+                return ESSIM.stopped(model_run_id, control)
+
+    def fetch_stage(self, run: PipelineRun):
+        # A run that was cancelled while it was queued is already resolved, cancel() took it off the queue
+        if not run.future.set_running_or_notify_cancel():
+            return None
+        logger.debug(f"Threaded run: {run.model_run_id}")
+        if run.control.stop_reason:
+            run.info = ESSIM.stopped(run.model_run_id, run.control)
+            return None
+
+        run.control.enter_phase("fetch")
+        run.essim_post_body = self.essim_post_body(run.config, run.features)
+        if run.parent is None:
+            # Estimate again, now the ESDL is known
+            remaining = self.duration_estimator.estimate(run.features, self.run_phases(run)[1:])
+            self.set_eta(run, time() + remaining if remaining is not None else None)
+        return "submit"
+
+    def queue_run(self, run: PipelineRun):
+        run.tenant = run_tenant(run.config)
+        run.control.enter_phase("queue")
+        self.scheduler.submit(run, run.tenant, run.config.priority or 0, self.queue_order_key(run))
+
+    @staticmethod
+    def run_phases(run: PipelineRun) -> List[str]:
+        """The estimated phases a run goes through, see DurationEstimator."""
+        phases = [] if run.windows else ["start", "simulation", "kpi"]
+        if phases and EnvSettings.run_engine() != "async":
+            # The async engine loads the input ESDL in the start phase
+            phases.insert(0, "fetch")
+        if run.parent is None:
+            phases.append("post_process")
+        return phases
+
+    def estimate_duration(self, run: PipelineRun) -> Optional[float]:
+        """Estimated seconds from the moment a run gets a run slot until it finished."""
+        run.features = run.features or submit_features(run.config.essim_post_body)
+        duration = self.duration_estimator.estimate(run.features, self.run_phases(run))
+        if run.windows and duration is not None:
+            # The time windows are simulated concurrently
+            windows = [window.estimated_duration for window in run.windows]
+            duration = duration + max(windows) if None not in windows else None
+        return duration
+
+    def queue_order_key(self, run: PipelineRun) -> float:
+        """Sorts the queued runs of a tenant with the same priority, see QUEUE_ORDER."""
+        order = EnvSettings.queue_order()
+        if order == "sjf":
+            # Runs without an estimate yet go after the runs with one
+            return run.estimated_duration if run.estimated_duration is not None else float("inf")
+        if order == "deadline":
+            # The latest moment the run can start and still finish before its deadline
+            deadline = run.config.deadline or run.control.run_deadline
+            if deadline is None:
+                return float("inf")
+            return deadline - (run.estimated_duration or 0.0)
+        return 0.0
+
+    def estimate_eta(self, run: PipelineRun) -> Optional[float]:
+        """When a run that was just queued will probably finish: after the work of the runs in flight and the
+        queued runs of at least its priority is spread over the run slots, and its own estimated duration."""
+        if run.estimated_duration is None:
+            return None
+        now = time()
+        priority, key = run.config.priority or 0, self.queue_order_key(run)
+        work = sum(r.estimated_duration or 0.0 for r in self.scheduler.queued_runs()
+                   if r is not run and r.parent is not run and ((r.config.priority or 0) > priority or (
+                       (r.config.priority or 0) == priority and self.queue_order_key(r) <= key)))
+        with self._usage_lock:
+            # A model run split into time windows counts once, with the ETA of the whole run
+            active = {r.parent or r for r in self._active_runs}
+        for r in active:
+            model_run = self.model_run_dict.get(r.model_run_id)
+            if r is not run and model_run is not None and model_run.eta and not model_run.stored:
+                work += max(0.0, model_run.eta - now)
+        return now + work / max(1, self.scheduler.slots) + run.estimated_duration
+
+    def set_eta(self, run: PipelineRun, eta: Optional[float]):
+        model_run = self.model_run_dict.get(run.model_run_id)
+        if model_run is not None:
+            model_run.eta = eta
+
+    def record_durations(self, run: PipelineRun):
+        # The phases of a resumed run before the restart are not known
+        if run.resume_stage is not None or run.info is None:
+            return
+        control = run.control
+        if run.info.state == ModelState.SUCCEEDED:
+            control.finish_phase()
+        durations = {phase: d for phase, d in control.phase_durations.items() if phase in ESTIMATED_PHASES}
+        if durations:
+            self.duration_estimator.record(run.model_run_id, run.features, durations,
+                                           control.phase_durations.get("queue"))
+
+    def start_queued_run(self, run: PipelineRun):
+        """Start a run that got a run slot from the scheduler."""
+        with self._usage_lock:
+            if not run.control.cancelled:
+                self._queued_runs -= 1
+                self._in_flight_runs += 1
+                run.control.started = True
+                run.holds_run_slot = True
+                self._active_runs.add(run)
+        if not run.holds_run_slot:
+            # Cancelled while the slot was handed to it, cancel() already took it off the queue
+            self.scheduler.release(run.tenant)
+        elif run.parent is None and run.estimated_duration is not None:
+            self.set_eta(run, time() + run.estimated_duration)
+        self.dispatch_run(run)
+
+    def dispatch_run(self, run: PipelineRun):
+        """Hand a run that left the queue to its engine. A run without a run slot only stops there."""
+        if run.simulation_id:
+            # Resumed with a simulation on ESSIM
+            self.pipeline.resume(run, "attach")
+        elif EnvSettings.run_engine() == "async":
+            async_engine.submit(self.async_run, run)
+        else:
+            self.pipeline.start(run)
+
+    def release_run_slot(self, run: PipelineRun):
+        if run.holds_run_slot:
+            run.holds_run_slot = False
+            with self._usage_lock:
+                self._in_flight_runs -= 1
+                self._active_runs.discard(run)
+            self.scheduler.release(run.tenant)
+
+    def submit_stage(self, run: PipelineRun):
+        # start ESSIM run, the run sticks to the engine that accepted it for status and KPI polling
+        essim_post_body, run.essim_post_body = run.essim_post_body, None
+        run.info, run.simulation_id, run.engine = self.start_essim(run.config, run.model_run_id, run.control,
+                                                                   essim_post_body)
+        if run.info.state != ModelState.RUNNING:
+            return None
+        self.checkpoint(run, "simulation", simulation_id=run.simulation_id, engine_url=run.engine.url)
+        return "simulation"
+
+    def attach_stage(self, run: PipelineRun):
+        """Continue a resumed run that already has a simulation on ESSIM."""
+        if not run.future.set_running_or_notify_cancel():
+            return None
+        if not run.holds_run_slot:
+            run.info = ESSIM.stopped(run.model_run_id, run.control)
+            return None
+        return run.resume_stage
+
+    def simulation_stage(self, run: PipelineRun):
+        run.info = ESSIM.monitor_essim_progress(run.simulation_id, run.model_run_id, run.engine.url, run.control)
+        if run.info.state == ModelState.ERROR:
+            return None
+        self.checkpoint(run, "kpi")
+        return "kpi"
+
+    def kpi_stage(self, run: PipelineRun):
+        try:
+            run.info = ESSIM.monitor_kpi_progress(
+                run.simulation_id, run.model_run_id, run.engine.url,
+                publish=lambda kpi_results: self.publish_partial_kpi_results(run.model_run_id, kpi_results),
+                control=run.control
             )
+        finally:
+            # Free the engine and the run slot for the next run before the results are processed
+            self.release_simulation(run)
+        # The results of a time window are merged with the other windows of its run first
+        if run.info.state != ModelState.SUCCEEDED or run.parent is not None:
+            return None
+        run.control.enter_phase("post_process")
+        self.checkpoint(run, "post_process")
+        return "post_process"
+
+    def post_process_stage(self, run: PipelineRun):
+        if self.minio_client and run.model_run_id in self.model_run_dict:
+            run.output_esdl = self.create_output_esdl(run.model_run_id, run.info.result)
+        return "export" if EnvSettings.timeseries_export() else "upload"
+
+    def export_stage(self, run: PipelineRun):
+        simulation_ids = [w.simulation_id for w in run.windows if w.simulation_id] if run.windows \
+            else [run.simulation_id]
+        if self.minio_client and run.model_run_id in self.model_run_dict and all(simulation_ids):
+            # The time series are an addition to the KPIs, the run succeeds without them
+            try:
+                timeseries_path = self.timeseries_exporter.export(run.config, simulation_ids)
+                if timeseries_path:
+                    run.artifacts["timeseries_path"] = timeseries_path
+            except Exception as e:
+                logger.error(f"Could not export the time series of model run {run.model_run_id}: {e!r}")
+        return "upload"
+
+    def upload_stage(self, run: PipelineRun):
+        output_esdl, run.output_esdl = run.output_esdl, None
+        self.complete_run(run.model_run_id, run.info, output_esdl, run.artifacts)
+        return None
+
+    def release_simulation(self, run: PipelineRun):
+        if run.engine is not None:
+            if run.control.stop_reason:
+                ESSIM.cancel_simulation(run.engine.url, run.simulation_id)
+            essim_pool.release(run.engine)
+            run.engine = None
+        self.release_run_slot(run)
 
-        logger.info("Retrieving KPI list...")
-        kpi_list = ESSIM.get_kpi_list()  # contains id, name and description
+    def release_run(self, run: PipelineRun):
+        self.release_simulation(run)
+        self.record_durations(run)
+        self.run_state.remove(run.model_run_id)
+        with self._usage_lock:
+            # Stopped before it was submitted, e.g. past its deadline or without an input ESDL. cancel() takes
+            # the runs it cancels off the queue itself, except the time windows of a run.
+            if not run.control.started and (run.parent is not None or not run.control.cancelled):
+                self._queued_runs -= 1
+        if run.parent is not None:
+            self.join_time_window(run)
 
-        logger.info("Start monitoring KPI progress...")
-        kpi_path = f'{ESSIM_URL}/{simulation_id}/kpi'
+    def checkpoint(self, run: PipelineRun, phase: str, **fields):
+        # A run split into time windows is only checkpointed as a whole, it starts over when resumed
+        if run.parent is None:
+            self.run_state.save(run.model_run_id, phase, **fields)
+
+    @staticmethod
+    def time_windows(config: ESSIMAdapterConfig):
+        if not config.time_windows or config.time_windows < 2:
+            return []
+        try:
+            return split_time_windows(config.essim_post_body["startDate"], config.essim_post_body["endDate"],
+                                      config.time_windows)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Cannot split the simulation period into time windows, simulating it at once: {e!r}")
+            return []
+
+    def split_run(self, run: PipelineRun, windows):
+        """Create a run for every time window, each with its own simulation, the run itself only waits for them."""
+        run.future.set_running_or_notify_cancel()
+        run.control.started = True
+        run.windows_pending = len(windows)
+        for i, (start_date, end_date, steps) in enumerate(windows):
+            essim_post_body = dict(run.config.essim_post_body, startDate=start_date, endDate=end_date)
+            if "simulationDescription" in essim_post_body:
+                essim_post_body["simulationDescription"] += f" (time window {i + 1}/{len(windows)})"
+            window = PipelineRun(f"{run.model_run_id}-{i + 1}",
+                                 dataclasses.replace(run.config, essim_post_body=essim_post_body, time_windows=None),
+                                 run.control.child())
+            window.parent = run
+            window.weight = steps
+            run.windows.append(window)
+        logger.info(f"Split model run {run.model_run_id} into {len(windows)} time windows")
+        return run.windows
+
+    def join_time_window(self, window: PipelineRun):
+        run = window.parent
+        if window.info is None or window.info.state != ModelState.SUCCEEDED:
+            # The run failed, stop the simulations of the other windows
+            for other in run.windows:
+                if other is not window:
+                    other.control.cancel(f"Time window {window.model_run_id} failed")
+
+        with self._usage_lock:
+            run.windows_pending -= 1
+            if run.windows_pending:
+                return
+
+        failed_windows = [w for w in run.windows if w.info is None or w.info.state != ModelState.SUCCEEDED]
+        if failed_windows:
+            # Report the window that failed first, not the ones cancelled because of it
+            failed = next((w for w in failed_windows if not w.control.cancelled), failed_windows[0])
+            run.info = ModelRunInfo(
+                model_run_id=run.model_run_id,
+                state=ModelState.ERROR,
+                reason=f"Time window {failed.model_run_id} failed: {failed.info.reason if failed.info else None}",
+            )
+            self.pipeline.finish(run)
+            return
+
+        try:
+            result = merge_kpi_results([w.info.result for w in run.windows], [w.weight for w in run.windows],
+                                       self.kpi_merge_rules)
+        except Exception as e:
+            logger.exception(f"Could not merge the KPIs of the time windows of model run {run.model_run_id}")
+            run.info = ModelRunInfo(
+                model_run_id=run.model_run_id,
+                state=ModelState.ERROR,
+                reason=f"Could not merge the KPIs of the time windows: {e}",
+            )
+            self.pipeline.finish(run)
+            return
+
+        run.info = ModelRunInfo(model_run_id=run.model_run_id, state=ModelState.SUCCEEDED, result=result)
+        run.control.enter_phase("post_process")
+        self.pipeline.resume(run, "post_process")
+
+    async def async_start_essim(self, config: ESSIMAdapterConfig, model_run_id, control: RunControl = None,
+                                features: Dict[str, float] = None):
+        control = control or RunControl()
+        attempts = StartAttempts(model_run_id, control)
+        essim_post_body = await async_engine.run_blocking(self.essim_post_body, config, features)
+        data = json.dumps(essim_post_body)
 
         while True:
-            r = requests.get(url=kpi_path, headers=ESSIM_HEADERS)
-            response = r.json()
-            status_code = r.status_code
-            print('kpi ', status_code)
-            if status_code == 200:
-                kpis_info = ESSIM.process_kpi_results(response, kpi_list)
-
-                if kpis_info.still_calculating:
-                    # logger.info(kpis_info.results)
-                    sleep(PROGRESS_UPDATE_INTERVAL)
-                else:
-                    logger.info('KPI modules finished')
-                    return ModelRunInfo(
-                        model_run_id=model_run_id,
-                        state=ModelState.SUCCEEDED,
-                        result=kpis_info.results
-                    )
+            engine, stopped = attempts.next_engine()
+            if stopped is not None:
+                return stopped, None, None
+            if engine is None:
+                await control.async_sleep(EnvSettings.essim_busy_backoff())
+                continue
+
+            try:
+                async with async_engine.session().post(url=engine.url, data=data, headers=ESSIM_HEADERS) as r:
+                    status_code = r.status
+                    response = await ESSIM.async_response_json(r)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # Timeouts are connection errors in aiohttp too, but the request may have been received
+                reached = isinstance(e, asyncio.TimeoutError) or not isinstance(e, aiohttp.ClientConnectionError)
+                started = attempts.failed(engine, e, reached)
             else:
-                logger.error(f'Monitor KPI modules API error ({status_code})')
-                return ModelRunInfo(
-                    model_run_id=model_run_id,
-                    state=ModelState.ERROR,
-                    reason=f'Monitor KPI modules API error ({status_code})',
-                )
+                started = attempts.answered(engine, status_code, response)
+            if started is not None:
+                return started
+
+    @staticmethod
+    async def async_response_json(r):
+        try:
+            return await r.json(content_type=None)
+        except ValueError:
+            return {}
+
+    @staticmethod
+    async def async_monitor_essim_progress(simulation_id, model_run_id, essim_url, control: RunControl = None):
+        if simulation_id is None:
+            return ESSIM.no_simulation_started(model_run_id)
+
+        control = control or RunControl()
+        monitor = SimulationMonitor(model_run_id, essim_url, control)
+        status_path = f'{essim_url}/{simulation_id}/status'
+        while True:
+            try:
+                async with async_engine.session().get(url=status_path, headers=ESSIM_HEADERS) as r:
+                    status_code = r.status
+                    response = await ESSIM.async_response_json(r)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                return monitor.lost_connection(e)
+
+            monitor_essim_progress_info, wait = monitor.observe(status_code, response)
+            if monitor_essim_progress_info is not None:
+                return monitor_essim_progress_info
+            if not await control.async_sleep(wait):
+                return ESSIM.stopped(model_run_id, control)
+
+    @staticmethod
+    async def async_monitor_kpi_progress(simulation_id, model_run_id, essim_url, publish=None,
+                                         control: RunControl = None):
+        if simulation_id is None:
+            return ESSIM.no_simulation_started(model_run_id)
+
+        control = control or RunControl()
+        monitor = KPIMonitor(model_run_id, essim_url, control, publish)
+        kpi_path = f'{essim_url}/{simulation_id}/kpi'
+        while True:
+            try:
+                async with async_engine.session().get(url=kpi_path, headers=ESSIM_HEADERS) as r:
+                    status_code = r.status
+                    response = await ESSIM.async_response_json(r)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                return monitor.lost_connection(e)
+
+            monitor_kpi_progress_info, wait = monitor.observe(status_code, response)
+            if monitor_kpi_progress_info is not None:
+                return monitor_kpi_progress_info
+            if not await control.async_sleep(wait):
+                return ESSIM.stopped(model_run_id, control)
+
+    async def async_run(self, run: PipelineRun):
+        control = run.control
+        if not run.future.set_running_or_notify_cancel() or not run.holds_run_slot:
+            # Cancelled or past its deadline while it was queued
+            run.info = ESSIM.stopped(run.model_run_id, control)
+            await async_engine.run_blocking(self.pipeline.finish, run)
+            return
+
+        try:
+            run.info = await self._async_run(run)
+        except Exception as e:
+            logger.exception(f"Model run {run.model_run_id} failed")
+            run.info = ModelRunInfo(
+                model_run_id=run.model_run_id,
+                state=ModelState.ERROR,
+                reason=f"Model run failed: {e}",
+            )
+        finally:
+            self.release_run_slot(run)
+
+        # The results of a time window are merged with the other windows of its run first
+        if run.info.state != ModelState.SUCCEEDED or run.parent is not None:
+            await async_engine.run_blocking(self.pipeline.finish, run)
+            return
+        # The results are processed and uploaded by the pipeline threads, the event loop moves on to the next run
+        control.enter_phase("post_process")
+        await async_engine.run_blocking(self.checkpoint, run, "post_process")
+        await async_engine.run_blocking(self.pipeline.resume, run, "post_process")
 
-    def threaded_run(self, model_run_id, config):
-        print("Threaded_run:", config)
+    async def _async_run(self, run: PipelineRun):
+        model_run_id, config, control = run.model_run_id, run.config, run.control
+        logger.debug(f"Async run: {model_run_id}")
 
-        # start ESSIM run
-        start_essim_info, simulation_id = self.start_essim(config, model_run_id)
-        if start_essim_info.state == ModelState.RUNNING:
+        # start ESSIM run, the run sticks to the engine that accepted it for status and KPI polling
+        start_essim_info, simulation_id, engine = await self.async_start_essim(config, model_run_id, control,
+                                                                               run.features)
+        if start_essim_info.state != ModelState.RUNNING:
+            return start_essim_info
+        run.simulation_id = simulation_id
+        await async_engine.run_blocking(self.checkpoint, run, "simulation", simulation_id=simulation_id,
+                                        engine_url=engine.url)
+
+        try:
             # monitor ESSIM progress
-            monitor_essim_progress_info = ESSIM.monitor_essim_progress(simulation_id, model_run_id)
+            monitor_essim_progress_info = await ESSIM.async_monitor_essim_progress(
+                simulation_id, model_run_id, engine.url, control)
             if monitor_essim_progress_info.state == ModelState.ERROR:
                 return monitor_essim_progress_info
-        else:
-            return start_essim_info
 
-        # Monitor KPI progress
-        monitor_kpi_progress_info = ESSIM.monitor_kpi_progress(simulation_id, model_run_id)
+            # Monitor KPI progress
+            await async_engine.run_blocking(self.checkpoint, run, "kpi")
+            monitor_kpi_progress_info = await ESSIM.async_monitor_kpi_progress(
+                simulation_id, model_run_id, engine.url,
+                publish=lambda kpi_results: self.publish_partial_kpi_results(model_run_id, kpi_results),
+                control=control
+            )
+        finally:
+            if control.stop_reason:
+                await async_engine.run_blocking(ESSIM.cancel_simulation, engine.url, simulation_id)
+            essim_pool.release(engine)
         return monitor_kpi_progress_info
 
+    def complete_run(self, model_run_id, model_run_info: ModelRunInfo, output_esdl: bytes = None,
+                     artifacts: Dict[str, str] = None):
+        """Record the outcome of a finished run, storing the results of a successful run once."""
+        model_run = self.model_run_dict.get(model_run_id)
+        if model_run is None or model_run.stored:
+            return
+
+        if model_run_info.state == ModelState.SUCCEEDED:
+            model_run.result = model_run_info.result
+            self.upload_result(model_run_id, model_run_info.result, output_esdl, artifacts)
+        else:
+            model_run.result = {}
+        # Only now, status() reports the run as finished before its future is, once the results are stored
+        model_run.state = model_run_info.state
+        model_run.reason = model_run_info.reason
+        model_run.stored = True
+
     def run(self, model_run_id: str):
+        model_run = self.model_run_dict.get(model_run_id)
+        if model_run is not None and model_run.config is not None:
+            # Raises QueueFull, the run stays READY so it can be started again later
+            self.scheduler.check_capacity(run_tenant(model_run.config),
+                                          max(1, len(self.time_windows(model_run.config))))
         res = Model.run(self, model_run_id=model_run_id)
 
         if model_run_id in self.model_run_dict:
             config: ESSIMAdapterConfig = self.model_run_dict[model_run_id].config
 
-            executor.submit_stored(model_run_id, self.threaded_run, model_run_id, config)
+            control = RunControl.from_settings()
+            self.run_controls[model_run_id] = control
+            self.retention.start()
+
+            config_state = ESSIMAdapterConfig.Schema().dump(config)
+            config_state["essim_post_body"].pop("esdlContents", None)
+            self.run_state.save(model_run_id, "queued", config=config_state, created_at=control.created_at)
+
+            # The future of the run resolves once its results are uploaded
+            run = PipelineRun(model_run_id, config, control)
+            executor.futures.add(model_run_id, run.future)
+            self.start_run(run)
             res.state = ModelState.RUNNING
+            res.eta = self.model_run_dict[model_run_id].eta = self.estimate_eta(run)
             return res
         else:
             return ModelRunInfo(
@@ -239,35 +977,143 @@ class ESSIM(Model):
                 reason="Error in ESSIM.run(): model_run_id unknown"
             )
 
-    def status(self, model_run_id: str):
-        if model_run_id in self.model_run_dict:
-            if not executor.futures.done(model_run_id):
-                print("executor.futures._state: ", executor.futures._state(model_run_id))
-                return ModelRunInfo(
-                    state=self.model_run_dict[model_run_id].state,
-                    model_run_id=model_run_id,
-                )
+    def start_run(self, run: PipelineRun):
+        windows = self.time_windows(run.config)
+        runs = self.split_run(run, windows) if len(windows) > 1 else [run]
+        for window in run.windows:
+            window.estimated_duration = self.estimate_duration(window)
+        run.estimated_duration = self.estimate_duration(run)
+        with self._usage_lock:
+            self._queued_runs += len(runs)
+        for r in runs:
+            self.queue_run(r)
+
+    def resume_runs(self):
+        """Pick up the runs that were in progress when the adapter, or another worker, stopped.
+
+        Runs with a simulation on ESSIM are re-attached to its status and KPI endpoints, KPIs that were already
+        calculated are fetched again for post-processing. Runs that were not submitted yet start over.
+        """
+        for state in self.run_state.claim_orphans():
+            model_run_id = state["model_run_id"]
+            config = ESSIMAdapterConfig.Schema().load(state["config"])
+            logger.info(f"Resuming model run {model_run_id} in phase {state['phase']}")
+
+            self.model_run_dict[model_run_id] = ModelRun(state=ModelState.RUNNING, config=config, result=None)
+            control = RunControl.from_settings(created_at=state.get("created_at"))
+            self.run_controls[model_run_id] = control
+            self.retention.start()
+
+            run = PipelineRun(model_run_id, config, control)
+            executor.futures.add(model_run_id, run.future)
+            if state.get("simulation_id"):
+                with self._usage_lock:
+                    self._queued_runs += 1
+                run.simulation_id = state["simulation_id"]
+                run.engine = essim_pool.attach(state["engine_url"])
+                run.resume_stage = "simulation" if state["phase"] == "simulation" else "kpi"
+                run.estimated_duration = self.estimate_duration(run)
+                self.queue_run(run)
             else:
-                print("executor.futures._state: ", executor.futures._state(model_run_id))   # FINISHED
-                future = executor.futures.pop(model_run_id)
-                executor.futures.add(model_run_id, future)   # Put it back on again, so it can be retreived in results
-                model_run_info = future.result()
-                if model_run_info.result is not None:
-                    print(model_run_info.result)
-                else:
-                    logger.warning("No result in model_run_info variable")
-                return model_run_info
-        else:
+                self.start_run(run)
+
+    def cancel(self, model_run_id: str):
+        # A finished run can be evicted meanwhile, so it is looked up once
+        model_run = self.model_run_dict.get(model_run_id)
+        if model_run is None:
             return ModelRunInfo(
                 model_run_id=model_run_id,
                 state=ModelState.ERROR,
-                reason="Error in ESSIM.status(): model_run_id unknown"
+                reason="Error in ESSIM.cancel(): model_run_id unknown"
+            )
+
+        control = self.run_controls.get(model_run_id)
+        # A run whose KPIs are calculated is only storing its results
+        if control is None or executor.futures.done(model_run_id) is not False or control.phase == "post_process":
+            return ModelRunInfo(
+                model_run_id=model_run_id,
+                state=model_run.state,
+                reason="Model run is not running"
             )
 
+        logger.info(f"Cancelling model run {model_run_id}")
+        stopped = False
+        with self._usage_lock:
+            control.cancel()
+            # A run that did not start yet is taken off the queue right away, a running run
+            # stops polling and releases its worker as soon as it notices the cancellation
+            if not control.started:
+                self._queued_runs -= 1
+                stopped = executor.futures.cancel(model_run_id)
+                if stopped:
+                    executor.futures.pop(model_run_id)
+        # Take it off the scheduler's queue too
+        self.scheduler.schedule()
+        model_run.reason = control.stop_reason
+        if stopped:
+            self.complete_run(model_run_id, ESSIM.stopped(model_run_id, control))
+        # A running run stays RUNNING until its worker stopped, its future then resolves with the reason
+        return ModelRunInfo(
+            model_run_id=model_run_id,
+            state=model_run.state,
+            reason=model_run.reason,
+        )
+
+    def remove(self, model_run_id: str):
+        # Stop a run that is still in progress before forgetting about it
+        self.cancel(model_run_id)
+        with self.retention.lock:
+            if model_run_id not in self.model_run_dict and self.retention.forget(model_run_id):
+                return ModelRunInfo(
+                    model_run_id=model_run_id,
+                    state=ModelState.UNKNOWN,
+                )
+            executor.futures.pop(model_run_id)
+            self.run_controls.pop(model_run_id, None)
+            return Model.remove(self, model_run_id=model_run_id)
+
+    def status(self, model_run_id: str):
+        self.retention.touch(model_run_id)
+        # The retention sweep must not evict the run between the checks and the reads below
+        with self.retention.lock:
+            if model_run_id in self.model_run_dict:
+                if not executor.futures.done(model_run_id):
+                    return ModelRunInfo(
+                        state=self.model_run_dict[model_run_id].state,
+                        model_run_id=model_run_id,
+                        reason=self.model_run_dict[model_run_id].reason,
+                        eta=self.model_run_dict[model_run_id].eta,
+                    )
+                else:
+                    future = executor.futures.pop(model_run_id)
+                    # Put it back on again, so it can be retreived in results
+                    executor.futures.add(model_run_id, future)
+                    model_run_info = future.result()
+                    if model_run_info.result is None:
+                        logger.warning("No result in model_run_info variable")
+                    return model_run_info
+            elif model_run_id in self.retention.summaries:
+                return self.retention.status(model_run_id)
+            else:
+                return ModelRunInfo(
+                    model_run_id=model_run_id,
+                    state=ModelState.ERROR,
+                    reason="Error in ESSIM.status(): model_run_id unknown"
+                )
+
     def process_results(self, result):
         return json.dumps(result)
 
     def results(self, model_run_id: str):
+        # The retention sweep must not evict the run between the checks and the reads below, reloading an
+        # evicted run from the object store is done outside the lock
+        with self.retention.lock:
+            if model_run_id in self.model_run_dict or model_run_id not in self.retention.summaries:
+                return self._results(model_run_id)
+        return self.retention.results(model_run_id)
+
+    def _results(self, model_run_id: str):
+        self.retention.touch(model_run_id)
 
         # Issue: if status already runs executor.future.pop, future does not exist anymore
         if executor.futures.done(model_run_id):
@@ -276,18 +1122,10 @@ class ESSIM(Model):
                 future = executor.futures.pop(model_run_id)
                 model_run_info = future.result()
 
-                if model_run_info.result is not None:
-                    print(model_run_info.result)
-                else:
+                if model_run_info.result is None:
                     logger.warning("No result in model_run_info variable")
 
-                self.model_run_dict[model_run_id].state = model_run_info.state
-
-                if model_run_info.state == ModelState.SUCCEEDED:
-                    self.model_run_dict[model_run_id].result = model_run_info.result
-                    Model.store_result(self, model_run_id=model_run_id, result=model_run_info.result)
-                else:
-                    self.model_run_dict[model_run_id].result = {}
+                self.complete_run(model_run_id, model_run_info)
 
                 return Model.results(self, model_run_id=model_run_id)
             else:
@@ -298,3 +1136,30 @@ class ESSIM(Model):
                 )
         else:
             return Model.results(self, model_run_id=model_run_id)
+
+    def select_runs(self, model_run_ids: Optional[List[str]] = None, tag: Optional[str] = None) -> List[str]:
+        """The given runs, or all known runs, with the given tag if one is given. Evicted runs are included."""
+        if model_run_ids is None:
+            model_run_ids = list(self.model_run_dict) + [i for i in list(self.retention.summaries)
+                                                         if i not in self.model_run_dict]
+        if tag is None:
+            return model_run_ids
+
+        def run_tag(model_run_id):
+            model_run = self.model_run_dict.get(model_run_id)
+            if model_run is not None:
+                return model_run.config.tag if model_run.config else None
+            summary = self.retention.summaries.get(model_run_id)
+            return summary.tag if summary else None
+
+        return [model_run_id for model_run_id in model_run_ids if run_tag(model_run_id) == tag]
+
+    def batch_status(self, query: ModelRunQuery) -> List[ModelRunInfo]:
+        return [self.status(model_run_id) for model_run_id in self.select_runs(query.model_run_ids, query.tag)]
+
+    def batch_results(self, query: ModelRunQuery) -> List[ModelRunInfo]:
+        # Evicted runs are only reloaded from the object store if their result is requested
+        if query.include is None or "result" in query.include:
+            return [self.results(model_run_id) for model_run_id in self.select_runs(query.model_run_ids, query.tag)]
+        return [self.retention.status(model_run_id) if model_run_id in self.retention.summaries
+                else self.results(model_run_id) for model_run_id in self.select_runs(query.model_run_ids, query.tag)]
@@ -0,0 +1,153 @@
+import threading
+from time import sleep, time
+from typing import List, Optional
+
+import requests
+
+from tno.essim_adapter.settings import EnvSettings
+from tno.shared.log import get_logger
+
+logger = get_logger(__name__)
+
+ESSIM_HEADERS = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+ESSIM_HEALTH_CHECK_TIMEOUT = 5
+
+
+class ESSIMEngine:
+    """A single ESSIM engine, identified by its simulation endpoint URL."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True
+        self.busy_until = 0.0
+        self.outstanding = 0
+
+    def is_available(self, now: float) -> bool:
+        return self.healthy and now >= self.busy_until
+
+    def __repr__(self):
+        return f"ESSIMEngine({self.url}, healthy={self.healthy}, outstanding={self.outstanding})"
+
+
+class ESSIMEnginePool:
+    """Routes simulations over a pool of ESSIM engines.
+
+    New simulations go to the available engine with the least outstanding simulations. An engine that
+    answers 503 is taken out of rotation for the busy backoff period, an engine that fails is taken out
+    of rotation until the background health check sees it responding again.
+    """
+
+    def __init__(self, urls: List[str], health_check_interval: float, busy_backoff: float):
+        self.engines = [ESSIMEngine(url) for url in urls]
+        self.health_check_interval = health_check_interval
+        self.busy_backoff = busy_backoff
+
+        self._lock = threading.Lock()
+        self._engine_released = threading.Condition(self._lock)
+        self._health_check_thread = None
+
+    def get(self, url: str) -> Optional[ESSIMEngine]:
+        for engine in self.engines:
+            if engine.url == url:
+                return engine
+        return None
+
+    def acquire(self) -> Optional[ESSIMEngine]:
+        """Reserve the least loaded available engine, or return None if all engines are busy or down."""
+        self.start_health_checks()
+        with self._lock:
+            now = time()
+            available = [engine for engine in self.engines if engine.is_available(now)]
+            if not available:
+                return None
+            engine = min(available, key=lambda e: e.outstanding)
+            engine.outstanding += 1
+            return engine
+
+    def attach(self, url: str) -> ESSIMEngine:
+        """Reserve the engine a simulation already runs on, e.g. when resuming a run after a restart."""
+        with self._lock:
+            engine = self.get(url)
+            if engine is None:
+                # No longer configured, the run is still followed up on the engine outside of the pool
+                return ESSIMEngine(url)
+            engine.outstanding += 1
+            return engine
+
+    def release(self, engine: ESSIMEngine):
+        with self._lock:
+            engine.outstanding = max(0, engine.outstanding - 1)
+            self._engine_released.notify_all()
+
+    def mark_busy(self, engine: ESSIMEngine):
+        logger.info(f"ESSIM engine {engine.url} is busy, taking it out of rotation for {self.busy_backoff}s")
+        with self._lock:
+            engine.busy_until = time() + self.busy_backoff
+            engine.outstanding = max(0, engine.outstanding - 1)
+
+    def mark_failed(self, engine: Optional[ESSIMEngine], release: bool = True):
+        if engine is None:
+            return
+        logger.warning(f"ESSIM engine {engine.url} failed, taking it out of rotation")
+        with self._lock:
+            engine.healthy = False
+            if release:
+                engine.outstanding = max(0, engine.outstanding - 1)
+
+    def all_failed(self) -> bool:
+        """True if no engine is left in rotation until a health check sees it responding again."""
+        with self._lock:
+            return not any(engine.healthy for engine in self.engines)
+
+    def wait_for_engine(self, timeout: float):
+        """Block until an engine is released or the timeout expires."""
+        with self._lock:
+            self._engine_released.wait(timeout)
+
+    def any_url(self) -> str:
+        """URL of a healthy engine, for requests that are not bound to a simulation."""
+        if not self.engines:
+            raise RuntimeError("No ESSIM engines configured, set ESSIM_URL or ESSIM_URLS")
+        for engine in self.engines:
+            if engine.healthy:
+                return engine.url
+        return self.engines[0].url
+
+    @staticmethod
+    def probe(engine: ESSIMEngine) -> bool:
+        try:
+            r = requests.get(url=f"{engine.url}/kpiModules", timeout=ESSIM_HEALTH_CHECK_TIMEOUT)
+            return r.status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def check_health(self):
+        for engine in self.engines:
+            healthy = self.probe(engine)
+            with self._lock:
+                if healthy and not engine.healthy:
+                    logger.info(f"ESSIM engine {engine.url} is healthy again, putting it back in rotation")
+                    self._engine_released.notify_all()
+                elif not healthy and engine.healthy:
+                    logger.warning(f"ESSIM engine {engine.url} failed its health check")
+                engine.healthy = healthy
+
+    def _health_check_loop(self):
+        while True:
+            sleep(self.health_check_interval)
+            self.check_health()
+
+    def start_health_checks(self):
+        with self._lock:
+            if self._health_check_thread is None and self.health_check_interval > 0:
+                self._health_check_thread = threading.Thread(
+                    target=self._health_check_loop, name="essim-health-check", daemon=True
+                )
+                self._health_check_thread.start()
+
+
+essim_pool = ESSIMEnginePool(
+    urls=EnvSettings.essim_urls(),
+    health_check_interval=EnvSettings.essim_health_check_interval(),
+    busy_backoff=EnvSettings.essim_busy_backoff(),
+)
@@ -0,0 +1,95 @@
+import threading
+from time import sleep, time
+from typing import Any, Dict, Optional
+
+import requests
+
+from tno.essim_adapter.model.essim_pool import ESSIM_HEADERS, essim_pool
+from tno.essim_adapter.settings import EnvSettings
+from tno.shared.log import get_logger
+
+logger = get_logger(__name__)
+
+KPI_CATALOG_REQUEST_TIMEOUT = 10
+
+
+class KPICatalog:
+    """The KPI modules known to ESSIM, indexed by calculator_id and shared by all model runs.
+
+    The catalog is loaded once and refreshed in the background every TTL seconds, so processing KPI
+    results does not need any extra request to ESSIM.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.modules: Dict[str, Dict[str, Any]] = {}
+        self.loaded_at: Optional[float] = None
+        self.attempted_at: Optional[float] = None
+
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+
+    @staticmethod
+    def fetch(essim_url: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        try:
+            r = requests.get(url=f'{essim_url}/kpiModules', headers=ESSIM_HEADERS,
+                             timeout=KPI_CATALOG_REQUEST_TIMEOUT)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f'Could not retrieve KPI modules from {essim_url}: {e}')
+            return None
+        if r.status_code != 200:
+            logger.warning(f'Could not retrieve KPI modules from {essim_url} ({r.status_code})')
+            return None
+
+        # KPI modules can be deployed multiple times, only keep one entry per calculator_id
+        modules = dict()
+        try:
+            for kpi in r.json():
+                if kpi["calculator_id"] not in modules:
+                    modules[kpi["calculator_id"]] = {
+                        "id": kpi["calculator_id"],
+                        "name": kpi["title"],
+                        "descr": kpi["description"]
+                    }
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f'Invalid list of KPI modules from {essim_url}: {e!r}')
+            return None
+        return modules
+
+    def load(self):
+        self.attempted_at = time()
+        modules = self.fetch(essim_pool.any_url())
+        if modules is not None:
+            # Replace the whole index at once, so readers never see a half updated catalog
+            self.modules = modules
+            self.loaded_at = time()
+            logger.info(f'Loaded {len(modules)} KPI modules')
+
+    def index(self) -> Dict[str, Dict[str, Any]]:
+        """The calculator_id -> KPI module index, loaded on first use if the background load did not finish yet."""
+        if self.loaded_at is None:
+            with self._lock:
+                retry_after = (self.attempted_at or 0) + EnvSettings.essim_busy_backoff()
+                if self.loaded_at is None and time() >= retry_after:
+                    self.load()
+        return self.modules
+
+    def _refresh_loop(self):
+        while True:
+            try:
+                self.load()
+            except Exception:
+                logger.exception('Could not refresh the KPI module catalog')
+            wait = self.ttl if self.loaded_at is not None else min(self.ttl, EnvSettings.essim_busy_backoff())
+            sleep(wait)
+
+    def start(self):
+        """Load the catalog in the background and keep refreshing it every TTL seconds."""
+        with self._lock:
+            if self._refresh_thread is None:
+                self._refresh_thread = threading.Thread(target=self._refresh_loop, name="kpi-catalog-refresh",
+                                                        daemon=True)
+                self._refresh_thread.start()
+
+
+kpi_catalog = KPICatalog(ttl=EnvSettings.kpi_catalog_ttl())
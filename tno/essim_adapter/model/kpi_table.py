@@ -0,0 +1,61 @@
+from io import BytesIO
+from typing import Any, Dict, List
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+PARQUET_CONTENT_TYPE = "application/vnd.apache.parquet"
+
+
+def kpi_columns(model_run_id: str, result: List[Dict[str, Any]]) -> Dict[str, list]:
+    """The KPI results of a run as columns, with a row per (run, KPI module, level, name, carrier) value.
+
+    KPIs with a single value have no carrier. KPI modules that failed have no rows.
+    """
+    columns = {name: [] for name in ("model_run_id", "kpi_module", "level", "name", "carrier", "value", "unit")}
+
+    def add(kpi_module, level, name, carrier, value, unit):
+        columns["model_run_id"].append(model_run_id)
+        columns["kpi_module"].append(kpi_module)
+        columns["level"].append(level)
+        columns["name"].append(name)
+        columns["carrier"].append(carrier)
+        columns["value"].append(float(value))
+        columns["unit"].append(unit)
+
+    for essim_result in result:
+        for kpi_result in essim_result.get("kpi", []):
+            for kpi_level, kpi_selections in kpi_result.items():
+                for kpi_selection in kpi_selections:
+                    values = kpi_selection["Values"]
+                    if isinstance(values, list):
+                        for item in values:
+                            add(essim_result["id"], kpi_level, kpi_selection["Name"], item["carrier"], item["value"],
+                                kpi_selection["Unit"])
+                    else:
+                        add(essim_result["id"], kpi_level, kpi_selection["Name"], None, values, kpi_selection["Unit"])
+    return columns
+
+
+def kpi_parquet(model_run_id: str, result: List[Dict[str, Any]]) -> bytes:
+    """The KPI results of a run as a Parquet file, see kpi_columns()."""
+    if pyarrow is None:
+        raise RuntimeError("Exporting KPIs to Parquet requires the pyarrow package")
+
+    schema = pyarrow.schema([
+        ("model_run_id", pyarrow.string()),
+        ("kpi_module", pyarrow.string()),
+        ("level", pyarrow.string()),
+        ("name", pyarrow.string()),
+        ("carrier", pyarrow.string()),
+        ("value", pyarrow.float64()),
+        ("unit", pyarrow.string()),
+    ])
+    table = pyarrow.table(kpi_columns(model_run_id, result), schema=schema)
+    buffer = BytesIO()
+    # Parquet compresses its columns itself, repeated values like the run and module are dictionary encoded
+    pyarrow.parquet.write_table(table, buffer, compression="zstd")
+    return buffer.getvalue()
@@ -1,11 +1,12 @@
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
 from io import BytesIO
-from typing import Dict
+from typing import Dict, Optional, Tuple
 from uuid import uuid4
 
-import json
-import sys
+import gzip
+import os
+import threading
 
 import esdl
 import esdl.esdl_handler
@@ -13,12 +14,19 @@ import pytz
 from influxdb import InfluxDBClient
 
 from minio import Minio
-from pyecore.ecore import EReference
 
+from tno.essim_adapter.model.esdl_index import ESDLIndex
+from tno.essim_adapter.model.esdl_processing import add_kpis, attach_kpis, esdl_process_pool
+from tno.essim_adapter.model.kpi_table import PARQUET_CONTENT_TYPE, kpi_parquet, pyarrow
 from tno.essim_adapter.settings import EnvSettings
 from tno.essim_adapter.types import ModelRun, ModelState, ModelRunInfo, ProfileInfo, AssetPortProfileInfo, \
     AssetCostInformationProfileInfo, EnvironmentalProfileInfo, InfluxDBProfilesInfo, CarrierCostInfo, InfluxDBInfo
-from tno.shared.log import get_logger
+from tno.shared.log import debug_enabled, get_logger
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 logger = get_logger(__name__)
 
@@ -28,21 +36,46 @@ INFLUXDB_QUERY_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 utc = pytz.timezone("UTC")
 
 
+def preload_esdl_metamodel():
+    """Initialize the ESDL metamodel and its (de)serializers by a round trip of an empty energy system.
+
+    Called in the gunicorn master when the app is preloaded, so all workers share the initialized metamodel.
+    """
+    esh = esdl.esdl_handler.EnergySystemHandler()
+    esh.create_empty_energy_system("preload")
+    esdl.esdl_handler.EnergySystemHandler().load_from_string(esh.to_string())
+
+
 class Model(ABC):
     def __init__(self):
         self.model_run_dict: Dict[str, ModelRun] = {}
 
-        self.minio_client = None
-        if EnvSettings.minio_endpoint():
-            logger.info(f"Connecting to Minio Object Store at {EnvSettings.minio_endpoint()}")
-            self.minio_client = Minio(
-                endpoint=EnvSettings.minio_endpoint(),
-                secure=EnvSettings.minio_secure(),
-                access_key=EnvSettings.minio_access_key(),
-                secret_key=EnvSettings.minio_secret_key()
-            )
-        else:
-            logger.info("No Minio Object Store configured")
+        # The MinIO client is created on first use in each process, so it is never shared by forked workers
+        self._minio_client = None
+        self._minio_client_pid = None
+        self._minio_client_lock = threading.Lock()
+
+    @property
+    def minio_client(self):
+        if not EnvSettings.minio_endpoint():
+            return self._minio_client
+        if self._minio_client is None or self._minio_client_pid != os.getpid():
+            with self._minio_client_lock:
+                if self._minio_client is None or self._minio_client_pid != os.getpid():
+                    logger.info(f"Connecting to Minio Object Store at {EnvSettings.minio_endpoint()}")
+                    self._minio_client = Minio(
+                        endpoint=EnvSettings.minio_endpoint(),
+                        secure=EnvSettings.minio_secure(),
+                        access_key=EnvSettings.minio_access_key(),
+                        secret_key=EnvSettings.minio_secret_key()
+                    )
+                    self._minio_client_pid = os.getpid()
+        return self._minio_client
+
+    @minio_client.setter
+    def minio_client(self, minio_client):
+        self._minio_client = minio_client
+        self._minio_client_pid = os.getpid()
 
     def request(self):
         model_run_id = str(uuid4())
@@ -78,10 +111,61 @@ class Model(ABC):
 
         response = self.minio_client.get_object(bucket, rest_of_path)
         if response:
-            return response.data
+            try:
+                # Read the object as stored, it is decoded below only if it was stored compressed
+                return self.decompress(response.read(decode_content=False), response.headers.get("Content-Encoding"))
+            finally:
+                response.close()
+                response.release_conn()
         else:
             return None
 
+    @staticmethod
+    def compress(data: bytes) -> Tuple[bytes, Optional[str]]:
+        """Compress an artifact as configured by ARTIFACT_COMPRESSION, returns the data and its Content-Encoding."""
+        encoding = EnvSettings.artifact_compression()
+        level = EnvSettings.artifact_compression_level()
+        if encoding == "gzip":
+            return gzip.compress(data, compresslevel=6 if level is None else level), "gzip"
+        if encoding == "zstd":
+            if zstandard is not None:
+                return zstandard.ZstdCompressor(level=3 if level is None else level).compress(data), "zstd"
+            logger.warning("ARTIFACT_COMPRESSION is zstd, but the zstandard package is not installed. "
+                           "Storing uncompressed")
+        return data, None
+
+    @staticmethod
+    def decompress(data: bytes, encoding: Optional[str]) -> bytes:
+        """Decode an object by its Content-Encoding, objects stored without one are returned as they are."""
+        if encoding == "gzip":
+            return gzip.decompress(data)
+        if encoding == "zstd":
+            if zstandard is None:
+                raise RuntimeError("Object is zstd compressed, but the zstandard package is not installed")
+            return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+        return data
+
+    def save_to_minio(self, path, data: bytes, content_type="application/octet-stream", compress: bool = True):
+        bucket = path.split("/")[0]
+        rest_of_path = "/".join(path.split("/")[1:])
+
+        if not self.minio_client.bucket_exists(bucket):
+            self.minio_client.make_bucket(bucket)
+
+        data, encoding = self.compress(data) if compress else (data, None)
+        self.minio_client.put_object(bucket, rest_of_path, BytesIO(data), len(data), content_type=content_type,
+                                     metadata={"Content-Encoding": encoding} if encoding else None)
+
+    def save_file_to_minio(self, path, file_path: str, content_type="application/octet-stream"):
+        """Upload a file from disk, streaming it instead of reading it into memory."""
+        bucket = path.split("/")[0]
+        rest_of_path = "/".join(path.split("/")[1:])
+
+        if not self.minio_client.bucket_exists(bucket):
+            self.minio_client.make_bucket(bucket)
+
+        self.minio_client.fput_object(bucket, rest_of_path, file_path, content_type=content_type)
+
     @staticmethod
     def connect_to_influxdb(esdl_influxdb_profile: esdl.InfluxDBProfile):
         use_ssl = esdl_influxdb_profile.host.startswith('https')
@@ -156,87 +240,58 @@ class Model(ABC):
                                  str(self.model_run_dict[model_run_id].config.base_path))
 
         esh = esdl.esdl_handler.EnergySystemHandler()
-
-        bucket = path.split("/")[0]
-        rest_of_path = "/".join(path.split("/")[1:])
-
-        response = self.minio_client.get_object(bucket, rest_of_path)
-        es: esdl.EnergySystem = esh.load_from_string(response.data.decode('UTF-8'))
+        es: esdl.EnergySystem = esh.load_from_string(self.load_from_minio(path).decode('UTF-8'))
+        esdl_index = ESDLIndex(es)
 
         # Collect all values for all InfluxDBProfiles in the ESDL
-        influxdb_profiles = esh.get_all_instances_of_type(esdl.InfluxDBProfile)
         influxdb_profiles_dict = dict()
-        for ip in influxdb_profiles:
+        for ip in esdl_index.influxdb_profiles:
             influxdb_profiles_dict[ip.id] = self.query_esdl_influxdb_profile(ip)
 
         # Collect information about profiles attached to asset ports
         asset_port_profiles_dict = dict()
-        ports = esh.get_all_instances_of_type(esdl.Port)
-        for p in ports:
-            for prof in p.profile:
-                if isinstance(prof, esdl.ProfileReference):
-                    prof = prof.reference
-                if isinstance(prof, esdl.InfluxDBProfile):
-                    asset = p.eContainer()
-                    if asset.id + p.id in asset_port_profiles_dict:
-                        asset_port_profiles_dict[asset.id + p.id].profile_info.append(influxdb_profiles_dict[prof.id])
-                    else:
-                        asset_port_profiles_dict[asset.id + p.id] = (
-                            AssetPortProfileInfo(
-                                asset_id=asset.id,
-                                port_id=p.id,
-                                profile_info=[influxdb_profiles_dict[prof.id]]
-                            )
-                        )
+        for asset, p, prof in esdl_index.port_profiles:
+            if asset.id + p.id in asset_port_profiles_dict:
+                asset_port_profiles_dict[asset.id + p.id].profile_info.append(influxdb_profiles_dict[prof.id])
+            else:
+                asset_port_profiles_dict[asset.id + p.id] = (
+                    AssetPortProfileInfo(
+                        asset_id=asset.id,
+                        port_id=p.id,
+                        profile_info=[influxdb_profiles_dict[prof.id]]
+                    )
+                )
 
         # Collect information about cost information profiles of assets
         asset_cost_profiles_list = list()
-        assets = esh.get_all_instances_of_type(esdl.Asset)
-        for a in assets:
-            if a.costInformation:
-                for ci_attr in a.costInformation.eClass.eAllStructuralFeatures():
-                    if isinstance(ci_attr, EReference):
-                        referred_obj = a.costInformation.eGet(ci_attr)
-
-                        if isinstance(referred_obj, esdl.InfluxDBProfile):
-                            ref_name = ci_attr.name
-                            asset_cost_profiles_list.append(
-                                AssetCostInformationProfileInfo(
-                                    asset_id=a.id,
-                                    cost_information_type=ref_name,
-                                    profile_info=influxdb_profiles_dict[referred_obj.id]
-                                )
-                            )
+        for a, ref_name, referred_obj in esdl_index.cost_information_profiles:
+            asset_cost_profiles_list.append(
+                AssetCostInformationProfileInfo(
+                    asset_id=a.id,
+                    cost_information_type=ref_name,
+                    profile_info=influxdb_profiles_dict[referred_obj.id]
+                )
+            )
 
         # Collect information about carrier cost profiles
         carrier_cost_profiles_list = list()
-        carrier_list = esh.get_all_instances_of_type(esdl.Carrier)
-        for c in carrier_list:
-            if c.cost:
-                if isinstance(c.cost, esdl.InfluxDBProfile):
-                    carrier_cost_profiles_list.append(
-                        CarrierCostInfo(
-                            carrier_id=c.id,
-                            profile_info=influxdb_profiles_dict[c.cost.id]
-                        )
-                    )
+        for c, cost_profile in esdl_index.carrier_cost_profiles:
+            carrier_cost_profiles_list.append(
+                CarrierCostInfo(
+                    carrier_id=c.id,
+                    profile_info=influxdb_profiles_dict[cost_profile.id]
+                )
+            )
 
         # Collect information about environmental profiles
         environmental_profiles_list = list()
-        environmental_profiles = esh.get_all_instances_of_type(esdl.EnvironmentalProfiles)
-        for ep in environmental_profiles:
-            for ep_attr in ep.eClass.eAllStructuralFeatures():
-                if isinstance(ep_attr, EReference):
-                    referred_obj = ep.eGet(ep_attr)
-
-                    if isinstance(referred_obj, esdl.InfluxDBProfile):
-                        ref_name = ep_attr.name
-                        environmental_profiles_list.append(
-                            EnvironmentalProfileInfo(
-                                environmental_profile_type=ref_name,
-                                profile_info=influxdb_profiles_dict[referred_obj.id]
-                            )
-                        )
+        for ref_name, referred_obj in esdl_index.environmental_profiles:
+            environmental_profiles_list.append(
+                EnvironmentalProfileInfo(
+                    environmental_profile_type=ref_name,
+                    profile_info=influxdb_profiles_dict[referred_obj.id]
+                )
+            )
 
         return InfluxDBProfilesInfo(
             asset_port_profiles_dict=asset_port_profiles_dict,
@@ -304,110 +359,74 @@ class Model(ABC):
         path = str(self.model_run_dict[model_run_id].config.input_esdl_file_path)
 
         esh = esdl.esdl_handler.EnergySystemHandler()
+        es: esdl.EnergySystem = esh.load_from_string(self.load_from_minio(path).decode('UTF-8'))
 
-        bucket = path.split("/")[0]
-        rest_of_path = "/".join(path.split("/")[1:])
+        add_kpis(es, result)
 
-        response = self.minio_client.get_object(bucket, rest_of_path)
-        es: esdl.EnergySystem = esh.load_from_string(response.data.decode('UTF-8'))
-
-        kpi_list = []
-
-        # Quick 'hack' to ease mapping to ESDL types
-        kpi_unit_mapping = {
-            "PERCENTAGE": "PERCENT"
-        }
-
-        for essim_result in result:
-            kpi_id = essim_result["id"]
-            kpi_description = essim_result["descr"]
-
-            for kpi_result in essim_result["kpi"]:
-                for kpi_level in kpi_result:
-                    for kpi_selection in kpi_result[kpi_level]:
-                        kpi_name = kpi_selection["Name"]
-                        kpi_unit = kpi_selection["Unit"].upper()
-                        if kpi_unit in kpi_unit_mapping:
-                            kpi_unit = kpi_unit_mapping[kpi_unit]
-                        kpi_unit_enum = esdl.UnitEnum.from_string(kpi_unit)
-                        kpi_unit = esdl.QuantityAndUnitType(id=str(uuid4()), unit=kpi_unit_enum)
-                        kpi_values = kpi_selection["Values"]
-
-                        if type(kpi_values) == list:
-                            for item in kpi_values:
-                                kpi_sub_name = kpi_name + " - " + item["carrier"]
-                                kpi_sub_unit = esdl.QuantityAndUnitType(
-                                    unit=kpi_unit_enum, description=item["carrier"]
-                                )
-                                kpi_list.append(
-                                    esdl.DoubleKPI(
-                                        id=str(uuid4()),
-                                        name=kpi_sub_name,
-                                        quantityAndUnit=kpi_sub_unit,
-                                        value=float(item["value"]),
-                                    )
-                                )
-                        else:
-                            kpi_list.append(
-                                esdl.DoubleKPI(
-                                    id=str(uuid4()),
-                                    name=kpi_name,
-                                    quantityAndUnit=kpi_unit,
-                                    value=float(kpi_values),
-                                )
-                            )
-
-        kpis = esdl.KPIs(id=kpi_id, description=kpi_description, kpi=kpi_list)
-        es.instance.items[0].area.KPIs = kpis
-
-        logger.debug("ESDL-KPI String: " + str(esh.to_string()))
+        if debug_enabled(__name__):
+            logger.debug("ESDL-KPI String: " + str(esh.to_string()))
 
         return esh
 
-    def store_result(self, model_run_id: str, result):
-        if model_run_id in self.model_run_dict:
-            res = self.process_results(result)
-
-            if self.minio_client:
-
-                # Log output
+    def create_output_esdl(self, model_run_id: str, result) -> bytes:
+        """The input ESDL with the KPIs added, parsing and serializing happens in the ESDL process pool."""
+        input_esdl = self.load_from_minio(str(self.model_run_dict[model_run_id].config.input_esdl_file_path))
+        output_esdl = esdl_process_pool.run(attach_kpis, input_esdl, result)
+        if debug_enabled(__name__):
+            logger.debug("ESDL-KPI String: " + output_esdl.decode('utf-8'))
+        return output_esdl
+
+    def upload_result(self, model_run_id: str, result, output_esdl: Optional[bytes] = None,
+                      artifacts: Optional[Dict[str, str]] = None):
+        """Store the KPIs and the output ESDL (created here if not given) in MinIO, or keep the KPIs in memory
+        when no MinIO is configured. The paths of other artifacts that were already stored are added to the
+        result."""
+        res = self.process_results(result)
+
+        if self.minio_client:
+
+            # Log output
+            if debug_enabled(__name__):
                 logger.debug("KPI Output: " + str(result))
 
-                # Generate ESSIM KPIs
-                content = BytesIO(bytes(res, 'ascii'))
-                base_path = self.model_run_dict[model_run_id].config.base_path
-                path = self.process_path(self.model_run_dict[model_run_id].config.output_file_path, base_path)
-                bucket = path.split("/")[0]
-                rest_of_path = "/".join(path.split("/")[1:])
-
-                if not self.minio_client.bucket_exists(bucket):
-                    self.minio_client.make_bucket(bucket)
-
-                self.minio_client.put_object(bucket, rest_of_path, content, content.getbuffer().nbytes)
-                self.model_run_dict[model_run_id].result = {
-                    "path": path
-                }
-
-                # Process ESDL file
-                esh = self.post_process_results(model_run_id, result)
-
-                # now save it to MinIO
-                path = self.process_path(str(self.model_run_dict[model_run_id].config.output_esdl_file_path), str(self.model_run_dict[model_run_id].config.base_path))
-                bucket = path.split("/")[0]
-                rest_of_path = "/".join(path.split("/")[1:])
+            if output_esdl is None:
+                output_esdl = self.create_output_esdl(model_run_id, result)
+
+            # Generate ESSIM KPIs
+            base_path = self.model_run_dict[model_run_id].config.base_path
+            path = self.process_path(self.model_run_dict[model_run_id].config.output_file_path, base_path)
+            self.save_to_minio(path, bytes(res, 'ascii'), content_type="application/json")
+            # Assigned once complete, results are replaced and never changed once visible (see ResponseCache)
+            run_result = {
+                "path": path
+            }
+
+            # The same KPIs as a table next to them, for analyses over many runs
+            if EnvSettings.kpi_parquet_export():
+                if pyarrow is not None:
+                    table_path = os.path.splitext(path)[0] + ".parquet"
+                    self.save_to_minio(table_path, kpi_parquet(model_run_id, result),
+                                       content_type=PARQUET_CONTENT_TYPE, compress=False)
+                    run_result["table_path"] = table_path
+                else:
+                    logger.warning("KPI_PARQUET_EXPORT is enabled, but the pyarrow package is not installed")
+
+            run_result.update(artifacts or {})
+
+            # now save the ESDL file to MinIO
+            path = self.process_path(str(self.model_run_dict[model_run_id].config.output_esdl_file_path), str(self.model_run_dict[model_run_id].config.base_path))
+            self.save_to_minio(path, output_esdl, content_type="application/xml")
+            logger.info("ESSIM data saved to MinIO")
+            self.model_run_dict[model_run_id].result = run_result
 
-                content = BytesIO(bytes(esh.to_string(), 'ascii'))
-
-                if not self.minio_client.bucket_exists(bucket):
-                    self.minio_client.make_bucket(bucket)
-
-                self.minio_client.put_object(bucket, rest_of_path, content, content.getbuffer().nbytes)
-                logger.info("ESSIM data saved to MinIO")
+        else:
+            self.model_run_dict[model_run_id].result = {
+                "result": res
+            }
 
-            else:
-                self.model_run_dict[model_run_id].result = {
-                    "result": res
-                }
+    def store_result(self, model_run_id: str, result):
+        if model_run_id in self.model_run_dict:
+            self.upload_result(model_run_id, result)
             return ModelRunInfo(
                 model_run_id=model_run_id,
                 state=ModelState.SUCCEEDED,
@@ -455,6 +474,7 @@ class Model(ABC):
                 state=self.model_run_dict[model_run_id].state,
                 model_run_id=model_run_id,
                 result=self.model_run_dict[model_run_id].result,
+                reason=self.model_run_dict[model_run_id].reason,
             )
         else:
             return ModelRunInfo(
@@ -0,0 +1,115 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from tno.essim_adapter.model.run_control import RunControl
+from tno.essim_adapter.types import ModelRunInfo, ModelState
+from tno.shared.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class PipelineRun:
+    """A model run travelling through the pipeline, with the state handed from one stage to the next."""
+
+    def __init__(self, model_run_id: str, config, control: RunControl):
+        self.model_run_id = model_run_id
+        self.config = config
+        self.control = control
+        # Resolved with the final ModelRunInfo once the run left the pipeline, including the upload of its results
+        self.future = Future()
+        self.stage: Optional[str] = None
+
+        self.info: Optional[ModelRunInfo] = None
+        self.essim_post_body: Optional[Dict[str, Any]] = None
+        self.simulation_id: Optional[str] = None
+        self.engine = None
+        self.output_esdl: Optional[bytes] = None
+        # Paths of the artifacts stored before the upload stage, added to the result of the run
+        self.artifacts: Dict[str, str] = {}
+        # Workflow the run is scheduled under, see run_tenant()
+        self.tenant: Optional[str] = None
+        self.holds_run_slot = False
+        # Features and estimated duration of the run, see DurationEstimator
+        self.features: Dict[str, float] = {}
+        self.estimated_duration: Optional[float] = None
+        # Stage a resumed run continues at once it has a run slot again
+        self.resume_stage: Optional[str] = None
+
+        # A run split into time windows waits for the runs of its windows, which refer to it as their parent
+        self.parent: Optional["PipelineRun"] = None
+        self.windows: List["PipelineRun"] = []
+        self.windows_pending = 0
+        self.weight = 1
+
+
+class PipelineStage:
+    """A worker pool with a bounded queue. Submitting to a full stage waits, which slows down the stage before it."""
+
+    def __init__(self, name: str, fn: Callable[[PipelineRun], Optional[str]], workers: int, queue_size: int):
+        self.name = name
+        self.fn = fn
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"pipeline-{name}")
+        # A queue_size of 0 leaves the queue unbounded
+        self.slots = threading.BoundedSemaphore(workers + queue_size) if queue_size else None
+
+    def submit(self, fn, *args):
+        if self.slots is not None:
+            self.slots.acquire()
+        future = self.executor.submit(fn, *args)
+        if self.slots is not None:
+            future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+
+class RunPipeline:
+    """Executes model runs as a sequence of stages, each with its own worker pool and queue.
+
+    A stage function takes the PipelineRun and returns the name of the next stage, or None when the run is
+    finished. Runs in different stages proceed independently, so e.g. the ESDL post-processing of one run
+    overlaps with the simulation of the next. When a run leaves the pipeline on_finish is called and its
+    future is resolved with run.info.
+    """
+
+    def __init__(self, stages: List[Tuple[str, Callable[[PipelineRun], Optional[str]], int, int]],
+                 on_finish: Callable[[PipelineRun], None]):
+        self.stages: Dict[str, PipelineStage] = {
+            name: PipelineStage(name, fn, workers, queue_size) for name, fn, workers, queue_size in stages
+        }
+        self.first_stage = stages[0][0]
+        self.on_finish = on_finish
+
+    def start(self, run: PipelineRun):
+        self.resume(run, self.first_stage)
+
+    def resume(self, run: PipelineRun, stage: str):
+        """Continue a run at the given stage, e.g. after its simulation was supervised elsewhere."""
+        self.stages[stage].submit(self._execute, stage, run)
+
+    def _execute(self, stage: str, run: PipelineRun):
+        run.stage = stage
+        try:
+            next_stage = self.stages[stage].fn(run)
+        except Exception as e:
+            logger.exception(f"Model run {run.model_run_id} failed in pipeline stage {stage}")
+            run.info = ModelRunInfo(
+                model_run_id=run.model_run_id,
+                state=ModelState.ERROR,
+                reason=f"Model run failed in stage {stage}: {e}",
+            )
+            next_stage = None
+
+        if next_stage is None:
+            self.finish(run)
+        else:
+            self.resume(run, next_stage)
+
+    def finish(self, run: PipelineRun):
+        """Take a run out of the pipeline and resolve its future with run.info."""
+        run.stage = None
+        try:
+            self.on_finish(run)
+        finally:
+            # The future of a run that was cancelled while it was queued is already done
+            if not run.future.done():
+                run.future.set_result(run.info)
@@ -0,0 +1,71 @@
+from time import sleep, time
+from typing import Optional
+
+from tno.essim_adapter.settings import EnvSettings
+
+
+class AdaptivePollScheduler:
+    """Decides how long to wait before the next progress poll of a simulation or its KPI modules.
+
+    The time to completion is estimated from the progress rate observed since the first poll. The next
+    poll is scheduled after a fraction of that estimate, so polls are sparse during long simulations and
+    converge on the expected completion time. While progress is not reported, or does not change, the
+    interval backs off exponentially, but never past the estimated completion time. Intervals are always
+    kept between the configured minimum and maximum.
+    """
+
+    def __init__(self, min_interval: float = None, max_interval: float = None, eta_fraction: float = 0.5,
+                 backoff: float = 1.5):
+        self.min_interval = EnvSettings.poll_min_interval() if min_interval is None else min_interval
+        self.max_interval = EnvSettings.poll_max_interval() if max_interval is None else max_interval
+        self.eta_fraction = eta_fraction
+        self.backoff = backoff
+
+        self.polls = 0
+        self.interval = self.min_interval
+        self._first_observation = None
+        self._last_progress = None
+        self._expected_completion = None
+
+    def _clamp(self, interval: float) -> float:
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    def eta(self, now: float = None) -> Optional[float]:
+        """Estimated number of seconds until completion, if the progress rate is known."""
+        if self._expected_completion is None:
+            return None
+        now = time() if now is None else now
+        return max(0.0, self._expected_completion - now)
+
+    def observe(self, progress: Optional[float], now: float = None) -> float:
+        """Record the progress (0..1) reported by a poll and return the interval until the next poll."""
+        now = time() if now is None else now
+        self.polls += 1
+
+        if progress is None:
+            self.interval = self._clamp(self.interval * self.backoff)
+            return self.interval
+
+        if self._first_observation is None:
+            self._first_observation = (now, progress)
+
+        first_time, first_progress = self._first_observation
+        if self._last_progress is not None and progress > self._last_progress and now > first_time:
+            rate = (progress - first_progress) / (now - first_time)
+            if rate > 0:
+                self._expected_completion = now + (1.0 - progress) / rate
+            eta = self.eta(now)
+            # Progress can be lower than at the first poll (e.g. when KPI modules restart), then there is no rate yet
+            self.interval = self._clamp(eta * self.eta_fraction if eta is not None else self.interval * self.backoff)
+        else:
+            interval = self.interval * self.backoff
+            eta = self.eta(now)
+            if eta is not None:
+                interval = min(interval, eta * self.eta_fraction)
+            self.interval = self._clamp(interval)
+
+        self._last_progress = progress
+        return self.interval
+
+    def wait(self, progress: Optional[float]):
+        sleep(self.observe(progress))
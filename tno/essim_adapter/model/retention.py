@@ -0,0 +1,216 @@
+import json
+import threading
+from collections import OrderedDict
+from time import sleep, time
+from typing import Callable, Dict, Optional
+
+from tno.essim_adapter import executor
+from tno.essim_adapter.settings import EnvSettings
+from tno.essim_adapter.types import ModelRunInfo, ModelState, RunSummary
+from tno.shared.log import get_logger
+
+logger = get_logger(__name__)
+
+# Evicted runs whose reloaded results are kept, for clients fetching the same results repeatedly
+RELOADED_RUNS_CACHED = 32
+
+
+class RunRetentionManager:
+    """Keeps the memory used by finished model runs bounded.
+
+    Finished runs are evicted once they are older than the TTL, or, least recently accessed first, when the
+    estimated size of all finished runs in memory exceeds the memory budget. A TTL or budget of 0 disables it.
+    An evicted run only leaves a compact RunSummary behind. Its full ModelRunInfo is spilled to MinIO first,
+    so results() can reload it on demand. A run that cannot be spilled is not evicted.
+    """
+
+    def __init__(self, model, ttl: float, memory_budget: float, spill_bucket: str, check_interval: float):
+        self.model = model
+        self.ttl = ttl
+        self.memory_budget = memory_budget
+        self.spill_bucket = spill_bucket
+        self.check_interval = check_interval
+
+        self.summaries: Dict[str, RunSummary] = {}
+        # model_run_id -> (finished_at, estimated size in bytes) of finished runs in memory, least recently used first
+        self._finished: "OrderedDict[str, tuple]" = OrderedDict()
+        self._reloaded: "OrderedDict[str, ModelRunInfo]" = OrderedDict()
+        # Held while a run is evicted, ESSIM holds it to read a run that could be evicted meanwhile
+        self.lock = threading.RLock()
+        self._sweep_thread = None
+        # Called with the model_run_id of every evicted run, e.g. to drop its cached responses
+        self.on_evict: Optional[Callable[[str], None]] = None
+
+    @staticmethod
+    def from_settings(model):
+        return RunRetentionManager(
+            model,
+            ttl=EnvSettings.retention_ttl(),
+            memory_budget=EnvSettings.retention_memory_budget() * 1024 * 1024,
+            spill_bucket=EnvSettings.retention_spill_bucket(),
+            check_interval=EnvSettings.retention_check_interval(),
+        )
+
+    def start(self):
+        with self.lock:
+            if self._sweep_thread is None:
+                self._sweep_thread = threading.Thread(target=self._sweep_loop, name="run-retention", daemon=True)
+                self._sweep_thread.start()
+
+    def _sweep_loop(self):
+        while True:
+            sleep(self.check_interval)
+            try:
+                self.enforce()
+            except Exception as e:
+                logger.error(f"Run retention sweep failed: {e}")
+
+    @staticmethod
+    def finished_run_info(model_run_id) -> Optional[ModelRunInfo]:
+        """The outcome of a run whose future is done, or None if it is still queued or running."""
+        if not executor.futures.done(model_run_id):
+            return None
+        try:
+            return executor.futures.result(model_run_id)
+        except BaseException as e:
+            return ModelRunInfo(model_run_id=model_run_id, state=ModelState.ERROR, reason=f"Model run failed: {e!r}")
+
+    def _is_finished(self, model_run_id) -> bool:
+        # Only runs that were started can finish, their future is gone after results() or a cancel while queued
+        return model_run_id in self.model.run_controls and executor.futures.done(model_run_id) is not False
+
+    def _estimate_size(self, model_run_id) -> int:
+        model_run = self.model.model_run_dict[model_run_id]
+        model_run_info = self.finished_run_info(model_run_id)
+        result = model_run_info.result if model_run_info is not None else model_run.result
+        config = model_run.config.essim_post_body if model_run.config else None
+        return len(json.dumps(config, default=str)) + len(json.dumps(result, default=str))
+
+    def touch(self, model_run_id):
+        with self.lock:
+            if model_run_id in self._finished:
+                self._finished.move_to_end(model_run_id)
+
+    def enforce(self):
+        """Record newly finished runs and evict the runs past their TTL or over the memory budget."""
+        now = time()
+        with self.lock:
+            for model_run_id in list(self.model.model_run_dict):
+                if model_run_id not in self._finished and self._is_finished(model_run_id):
+                    self._finished[model_run_id] = (now, self._estimate_size(model_run_id))
+
+            expired = [model_run_id for model_run_id, (finished_at, _) in self._finished.items()
+                       if self.ttl and now - finished_at >= self.ttl]
+            for model_run_id in expired:
+                self.evict(model_run_id)
+
+            used = sum(size for _, size in self._finished.values())
+            for model_run_id in list(self._finished):
+                if not self.memory_budget or used <= self.memory_budget:
+                    break
+                size = self._finished[model_run_id][1]
+                if self.evict(model_run_id):
+                    used -= size
+
+    def spill(self, model_run_info: ModelRunInfo) -> str:
+        path = f"{self.spill_bucket}/{model_run_info.model_run_id}.json"
+        self.model.save_to_minio(path, json.dumps({
+            "model_run_id": model_run_info.model_run_id,
+            "state": model_run_info.state,
+            "result": model_run_info.result,
+            "reason": model_run_info.reason,
+        }).encode('utf-8'), content_type="application/json")
+        return path
+
+    def evict(self, model_run_id) -> bool:
+        """Replace a finished run by its summary, returns False if it has to stay in memory for now."""
+        with self.lock:
+            model_run = self.model.model_run_dict.get(model_run_id)
+            if model_run is None:
+                self._finished.pop(model_run_id, None)
+                return False
+
+            # Results that were never fetched are stored now, so they are not lost with the run
+            model_run_info = self.finished_run_info(model_run_id)
+            if model_run_info is not None and not model_run.stored:
+                self.model.complete_run(model_run_id, model_run_info)
+            reason = model_run.reason or (model_run_info.reason if model_run_info else None)
+
+            if not self.model.minio_client:
+                return False
+            try:
+                spill_path = self.spill(ModelRunInfo(model_run_id=model_run_id, state=model_run.state,
+                                                     result=model_run.result, reason=reason))
+            except Exception as e:
+                logger.warning(f"Could not spill model run {model_run_id} to MinIO, keeping it in memory: {e}")
+                return False
+
+            result_path = model_run.result.get("path") if isinstance(model_run.result, dict) else None
+            self.summaries[model_run_id] = RunSummary(
+                state=model_run.state,
+                finished_at=self._finished.pop(model_run_id, (time(), 0))[0],
+                reason=reason,
+                result_path=result_path,
+                spill_path=spill_path,
+                tag=model_run.config.tag if model_run.config else None,
+            )
+            executor.futures.pop(model_run_id)
+            self.model.run_controls.pop(model_run_id, None)
+            del self.model.model_run_dict[model_run_id]
+            logger.info(f"Evicted finished model run {model_run_id} from memory, spilled to {spill_path}")
+        if self.on_evict is not None:
+            self.on_evict(model_run_id)
+        return True
+
+    def status(self, model_run_id) -> ModelRunInfo:
+        summary = self.summaries.get(model_run_id)
+        if summary is None:
+            return self.unknown(model_run_id)
+        return ModelRunInfo(model_run_id=model_run_id, state=summary.state, reason=summary.reason)
+
+    def results(self, model_run_id) -> ModelRunInfo:
+        """The full ModelRunInfo of an evicted run, reloaded from MinIO if it was spilled."""
+        summary = self.summaries.get(model_run_id)
+        if summary is None:
+            # Removed meanwhile
+            return self.unknown(model_run_id)
+        if summary.spill_path:
+            with self.lock:
+                if model_run_id in self._reloaded:
+                    self._reloaded.move_to_end(model_run_id)
+                    return self._reloaded[model_run_id]
+            try:
+                spilled = json.loads(self.model.load_from_minio(summary.spill_path))
+                model_run_info = ModelRunInfo(
+                    model_run_id=model_run_id,
+                    state=ModelState(spilled["state"]),
+                    result=spilled["result"],
+                    reason=spilled["reason"],
+                )
+                with self.lock:
+                    self._reloaded[model_run_id] = model_run_info
+                    if len(self._reloaded) > RELOADED_RUNS_CACHED:
+                        self._reloaded.popitem(last=False)
+                return model_run_info
+            except Exception as e:
+                logger.warning(f"Could not reload model run {model_run_id} from {summary.spill_path}: {e}")
+        return ModelRunInfo(
+            model_run_id=model_run_id,
+            state=summary.state,
+            result={"path": summary.result_path} if summary.result_path else None,
+            reason=summary.reason,
+        )
+
+    @staticmethod
+    def unknown(model_run_id) -> ModelRunInfo:
+        return ModelRunInfo(
+            model_run_id=model_run_id,
+            state=ModelState.ERROR,
+            reason="Error in RunRetentionManager: model_run_id unknown",
+        )
+
+    def forget(self, model_run_id) -> bool:
+        with self.lock:
+            self._finished.pop(model_run_id, None)
+            self._reloaded.pop(model_run_id, None)
+            return self.summaries.pop(model_run_id, None) is not None
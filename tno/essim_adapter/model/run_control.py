@@ -0,0 +1,132 @@
+import asyncio
+import threading
+from time import time
+from typing import Callable, Dict, List, Optional
+
+from tno.essim_adapter.settings import EnvSettings
+
+RUN_PHASES = ("start", "simulation", "kpi")
+
+
+class RunControl:
+    """Cancellation flag and deadlines of a single model run.
+
+    A run has an overall wall-clock deadline and a deadline per phase (waiting for an engine to accept
+    the simulation, the simulation itself and the KPI calculation). Poll loops wait through sleep() or
+    async_sleep(), which return early and report False as soon as the run is cancelled or past a deadline.
+    The time spent in every phase is kept in phase_durations, to learn how long runs take.
+    """
+
+    def __init__(self, run_timeout: float = 0, phase_timeouts: Dict[str, float] = None,
+                 created_at: Optional[float] = None):
+        self.created_at = created_at or time()
+        self.run_deadline = self.created_at + run_timeout if run_timeout else None
+        self.phase_timeouts = phase_timeouts or {}
+        self.phase: Optional[str] = None
+        self.phase_deadline: Optional[float] = None
+        self.phase_started_at: Optional[float] = None
+        self.phase_durations: Dict[str, float] = {}
+        self.started = False
+
+        self._cancelled = threading.Event()
+        self._cancel_reason: Optional[str] = None
+        self._children: List["RunControl"] = []
+        self._cancel_callbacks: List[Callable[[], None]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._async_event: Optional[asyncio.Event] = None
+
+    @staticmethod
+    def from_settings(created_at: Optional[float] = None):
+        return RunControl(
+            run_timeout=EnvSettings.run_timeout(),
+            phase_timeouts={phase: EnvSettings.phase_timeout(phase) for phase in RUN_PHASES},
+            created_at=created_at,
+        )
+
+    def enter_phase(self, phase: str):
+        self.finish_phase()
+        self.phase = phase
+        self.phase_started_at = time()
+        timeout = self.phase_timeouts.get(phase)
+        self.phase_deadline = self.phase_started_at + timeout if timeout else None
+
+    def finish_phase(self):
+        """Add the time spent in the current phase to its duration."""
+        if self.phase_started_at is not None:
+            duration = time() - self.phase_started_at
+            self.phase_durations[self.phase] = self.phase_durations.get(self.phase, 0.0) + duration
+            self.phase_started_at = None
+
+    def child(self) -> "RunControl":
+        """A control for a part of this run, with the same deadlines and cancelled together with this run."""
+        child = RunControl(phase_timeouts=self.phase_timeouts, created_at=self.created_at)
+        child.run_deadline = self.run_deadline
+        self._children.append(child)
+        if self.cancelled:
+            child.cancel(self._cancel_reason)
+        return child
+
+    def on_cancel(self, callback: Callable[[], None]):
+        """Call callback once the run is cancelled, right away if it already is."""
+        self._cancel_callbacks.append(callback)
+        if self.cancelled:
+            callback()
+
+    def cancel(self, reason: str = "Cancelled on request"):
+        self._cancel_reason = reason
+        self._cancelled.set()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._async_event.set)
+        for child in self._children:
+            child.cancel(reason)
+        for callback in list(self._cancel_callbacks):
+            callback()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def stop_reason(self) -> Optional[str]:
+        """Why the run has to stop, or None if it can continue."""
+        if self._cancelled.is_set():
+            return self._cancel_reason
+        now = time()
+        if self.run_deadline is not None and now >= self.run_deadline:
+            return f"Run exceeded its timeout of {int(self.run_deadline - self.created_at)}s"
+        if self.phase_deadline is not None and now >= self.phase_deadline:
+            return f"Run exceeded the timeout of the {self.phase} phase ({int(self.phase_timeouts[self.phase])}s)"
+        return None
+
+    @property
+    def deadline(self) -> Optional[float]:
+        """The first of the run and phase deadline, None if there is neither."""
+        deadlines = [d for d in (self.run_deadline, self.phase_deadline) if d is not None]
+        return min(deadlines) if deadlines else None
+
+    def bounded(self, seconds: float) -> float:
+        """Shorten a wait so it ends at the first deadline."""
+        deadline = self.deadline
+        if deadline is not None:
+            seconds = min(seconds, max(0.0, deadline - time()))
+        return seconds
+
+    def sleep(self, seconds: float) -> bool:
+        """Wait for at most the given number of seconds. Returns False if the run has to stop."""
+        if self.stop_reason is None:
+            self._cancelled.wait(self.bounded(seconds))
+        return self.stop_reason is None
+
+    async def async_sleep(self, seconds: float) -> bool:
+        """Like sleep(), for coroutines running on an event loop."""
+        if self._async_event is None:
+            self._async_event = asyncio.Event()
+            self._loop = asyncio.get_running_loop()
+            if self._cancelled.is_set():
+                self._async_event.set()
+        if self.stop_reason is None:
+            try:
+                await asyncio.wait_for(self._async_event.wait(), timeout=self.bounded(seconds))
+            except asyncio.TimeoutError:
+                pass
+        return self.stop_reason is None
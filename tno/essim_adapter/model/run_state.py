@@ -0,0 +1,125 @@
+import fcntl
+import json
+import os
+import threading
+from time import time
+from typing import Any, Dict, List, Optional
+
+from tno.essim_adapter.settings import EnvSettings
+from tno.shared.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class RunStateStore:
+    """Checkpoints of the model runs in progress, so they survive a restart of the adapter.
+
+    Every run has a JSON file in the state directory with its phase, the ESSIM simulation and engine it runs
+    on and its configuration (without the input ESDL). The file is rewritten at every phase transition and
+    removed when the run finished. The process executing a run holds an exclusive lock on its lock file, so
+    the runs of a stopped or killed process are recognized as orphans and can be claimed by another process.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._states: Dict[str, Dict[str, Any]] = {}
+        # model_run_id -> file descriptor of the lock file of the runs owned by this process
+        self._locks: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"Cannot use {self.directory} for run checkpoints, runs will not be resumed: {e}")
+                self.directory = ""
+
+    @staticmethod
+    def from_settings():
+        return RunStateStore(EnvSettings.run_state_dir())
+
+    def _path(self, model_run_id: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{model_run_id}.{extension}")
+
+    def _try_lock(self, model_run_id: str) -> Optional[int]:
+        fd = os.open(self._path(model_run_id, "lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    def save(self, model_run_id: str, phase: str, **fields):
+        """Checkpoint a run, fields that are not given keep the value of the previous checkpoint."""
+        if not self.directory:
+            return
+        with self._lock:
+            try:
+                if model_run_id not in self._locks:
+                    fd = self._try_lock(model_run_id)
+                    if fd is None:
+                        logger.warning(f"Model run {model_run_id} is checkpointed by another process")
+                        return
+                    self._locks[model_run_id] = fd
+
+                state = self._states.setdefault(model_run_id, {"model_run_id": model_run_id})
+                state.update(fields, phase=phase, updated_at=time())
+                # Write the checkpoint next to the old one and swap them, so a crash never leaves half a checkpoint
+                path = self._path(model_run_id, "json")
+                with open(path + ".tmp", "w") as f:
+                    json.dump(state, f)
+                os.replace(path + ".tmp", path)
+            except OSError as e:
+                logger.warning(f"Could not checkpoint model run {model_run_id}: {e}")
+
+    def remove(self, model_run_id: str):
+        if not self.directory:
+            return
+        with self._lock:
+            self._states.pop(model_run_id, None)
+            fd = self._locks.pop(model_run_id, None)
+            if fd is None:
+                return
+            # The checkpoint goes first, while the lock is still held, so no other process claims the run
+            self._unlink(self._path(model_run_id, "json"))
+            os.close(fd)
+            self._unlink(self._path(model_run_id, "lock"))
+
+    @staticmethod
+    def _unlink(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not remove {path}: {e}")
+
+    def claim_orphans(self) -> List[Dict[str, Any]]:
+        """Take over the checkpoints that no running process holds a lock on."""
+        if not self.directory:
+            return []
+        claimed = []
+        with self._lock:
+            for name in sorted(os.listdir(self.directory)):
+                model_run_id, extension = os.path.splitext(name)
+                if extension != ".json" or model_run_id in self._locks:
+                    continue
+                fd = self._try_lock(model_run_id)
+                if fd is None:
+                    continue
+                try:
+                    with open(self._path(model_run_id, "json")) as f:
+                        state = json.load(f)
+                except FileNotFoundError:
+                    # Finished by its owner in the meantime
+                    os.close(fd)
+                    continue
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping unreadable checkpoint of model run {model_run_id}: {e}")
+                    os.close(fd)
+                    continue
+                self._locks[model_run_id] = fd
+                self._states[model_run_id] = state
+                claimed.append(state)
+        return claimed
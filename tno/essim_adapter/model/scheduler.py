@@ -0,0 +1,197 @@
+import heapq
+import itertools
+import threading
+from time import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from tno.essim_adapter.settings import EnvSettings
+from tno.shared.log import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_TENANT = "default"
+
+
+class QueueFull(Exception):
+    """The queue cannot take more runs of a tenant, the client should retry after retry_after seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def run_tenant(config) -> str:
+    """The workflow a run belongs to: its tenant, or else its base_path."""
+    return config.tenant or config.base_path or DEFAULT_TENANT
+
+
+class RunScheduler:
+    """Hands out the run slots (MAX_WORKERS, or ASYNC_MAX_CONCURRENT_RUNS with the async engine) to the queued runs.
+
+    Runs are queued per tenant. The next slot goes to the queued run with the highest priority, among runs
+    of the same priority to the tenant with the fewest runs in flight, and the tenant served longest ago
+    if that is a tie. So a sweep of hundreds of runs takes turns with the single runs of other workflows
+    instead of going first. A tenant never has more than tenant_max_workers runs in flight. Runs of the same
+    priority start in the order of their sort key, see ESSIM.queue_order_key(), and of submission if equal.
+
+    on_slot(run) is called for a run that got a slot, on_stopped(run) for a queued run that was cancelled or
+    passed its deadline. Both are called outside the scheduler's lock. Queued runs are taken off the queue
+    when they are cancelled, and by a reaper thread when they pass their deadline, without scanning the queues.
+    """
+
+    def __init__(self, slots: int, tenant_max_workers: int, max_queue_length: int, tenant_max_queue_length: int,
+                 retry_after: int, on_slot: Callable, on_stopped: Callable):
+        self.slots = slots
+        self.tenant_max_workers = tenant_max_workers
+        self.max_queue_length = max_queue_length
+        self.tenant_max_queue_length = tenant_max_queue_length
+        self.retry_after = retry_after
+        self.on_slot = on_slot
+        self.on_stopped = on_stopped
+
+        # tenant -> heap of (-priority, sort key, sequence number, run)
+        self._queues: Dict[str, List[Tuple[int, float, int, object]]] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._last_served: Dict[str, float] = {}
+        self._used_slots = 0
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+        # run -> tenant of the queued runs
+        self._queued: Dict[object, str] = {}
+        # Queued runs that were cancelled or passed their deadline, taken off the queue by the next schedule()
+        self._stopped: Dict[object, None] = {}
+        # Heap of (deadline, sequence number, run) of the queued runs with a deadline
+        self._deadlines: List[Tuple[float, int, object]] = []
+        self._wakeup = threading.Condition(self._lock)
+        self._reaper_thread = None
+
+    @staticmethod
+    def from_settings(on_slot: Callable, on_stopped: Callable):
+        return RunScheduler(
+            slots=EnvSettings.run_slots(),
+            tenant_max_workers=EnvSettings.tenant_max_workers(),
+            max_queue_length=EnvSettings.max_queue_length(),
+            tenant_max_queue_length=EnvSettings.tenant_max_queue_length(),
+            retry_after=EnvSettings.queue_retry_after(),
+            on_slot=on_slot,
+            on_stopped=on_stopped,
+        )
+
+    def queue_length(self, tenant: Optional[str] = None) -> int:
+        with self._lock:
+            if tenant is not None:
+                return len(self._queues.get(tenant, []))
+            return sum(len(queue) for queue in self._queues.values())
+
+    def queued_runs(self) -> list:
+        with self._lock:
+            return [entry[3] for queue in self._queues.values() for entry in queue]
+
+    def check_capacity(self, tenant: str, count: int = 1):
+        """Raise QueueFull if queuing count more runs of the tenant would exceed a queue limit."""
+        with self._lock:
+            total = sum(len(queue) for queue in self._queues.values())
+            if self.max_queue_length and total + count > self.max_queue_length:
+                raise QueueFull(f"The queue is full ({total} runs)", self.retry_after)
+            queued = len(self._queues.get(tenant, []))
+            if self.tenant_max_queue_length and queued + count > self.tenant_max_queue_length:
+                raise QueueFull(f"The queue of {tenant} is full ({queued} runs)", self.retry_after)
+
+    def submit(self, run, tenant: str, priority: int = 0, sort_key: float = 0.0):
+        with self._lock:
+            sequence = next(self._sequence)
+            heapq.heappush(self._queues.setdefault(tenant, []), (-priority, sort_key, sequence, run))
+            self._queued[run] = tenant
+            deadline = run.control.deadline
+            if deadline is not None:
+                heapq.heappush(self._deadlines, (deadline, sequence, run))
+                self._start_reaper()
+                self._wakeup.notify()
+        run.control.on_cancel(lambda: self.stop(run))
+        self.schedule()
+
+    def stop(self, run):
+        """Take a cancelled run off the queue, the reaper thread hands it to on_stopped."""
+        with self._lock:
+            if run in self._queued:
+                self._stopped[run] = None
+                self._start_reaper()
+                self._wakeup.notify()
+
+    def _start_reaper(self):
+        if self._reaper_thread is None:
+            self._reaper_thread = threading.Thread(target=self._reap_loop, name="scheduler-reaper", daemon=True)
+            self._reaper_thread.start()
+
+    def _reap_loop(self):
+        while True:
+            with self._lock:
+                while not self._stopped and not (self._deadlines and self._deadlines[0][0] <= time()):
+                    self._wakeup.wait(self._deadlines[0][0] - time() if self._deadlines else None)
+            try:
+                self.schedule()
+            except Exception as e:
+                logger.exception(f"Reaping the stopped runs failed: {e}")
+
+    def release(self, tenant: str):
+        """Give back the slot of a run of the tenant and hand it to the next run."""
+        with self._lock:
+            self._used_slots -= 1
+            self._in_flight[tenant] -= 1
+            if not self._in_flight[tenant]:
+                del self._in_flight[tenant]
+        self.schedule()
+
+    def schedule(self):
+        """Take stopped runs off the queue and hand the free slots to the next runs."""
+        with self._lock:
+            stopped = self._take_stopped()
+            granted = []
+            while self._used_slots < self.slots:
+                tenant = self._next_tenant()
+                if tenant is None:
+                    break
+                _, _, _, run = heapq.heappop(self._queues[tenant])
+                if not self._queues[tenant]:
+                    del self._queues[tenant]
+                del self._queued[run]
+                self._used_slots += 1
+                self._in_flight[tenant] = self._in_flight.get(tenant, 0) + 1
+                self._last_served[tenant] = time()
+                granted.append(run)
+
+        for run in stopped:
+            self.on_stopped(run)
+        for run in granted:
+            self.on_slot(run)
+
+    def _take_stopped(self) -> list:
+        now = time()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, _, run = heapq.heappop(self._deadlines)
+            # Runs that left the queue before their deadline are skipped
+            if run in self._queued:
+                self._stopped[run] = None
+        if not self._stopped:
+            return []
+
+        stopped = list(self._stopped)
+        self._stopped.clear()
+        tenants = {self._queued.pop(run) for run in stopped}
+        for tenant in tenants:
+            waiting = [entry for entry in self._queues[tenant] if entry[3] in self._queued]
+            if waiting:
+                heapq.heapify(waiting)
+                self._queues[tenant] = waiting
+            else:
+                del self._queues[tenant]
+        return stopped
+
+    def _next_tenant(self) -> Optional[str]:
+        candidates = [
+            (queue[0][0], self._in_flight.get(tenant, 0), queue[0][1], self._last_served.get(tenant, 0.0), tenant)
+            for tenant, queue in self._queues.items()
+            if not self.tenant_max_workers or self._in_flight.get(tenant, 0) < self.tenant_max_workers
+        ]
+        return min(candidates)[4] if candidates else None
@@ -0,0 +1,186 @@
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple, Union
+
+from tno.essim_adapter.settings import EnvSettings
+from tno.shared.log import get_logger
+
+logger = get_logger(__name__)
+
+ESSIM_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S%z"
+ESSIM_TIME_STEP = timedelta(hours=1)
+PERCENTAGE_UNITS = ("PERCENTAGE", "PERCENT")
+MERGE_RULES = ("sum", "mean", "min", "max")
+
+
+def split_time_windows(start_date: str, end_date: str, count: int) -> List[Tuple[str, str, int]]:
+    """Split the hourly time steps from start_date up to and including end_date into at most count
+    contiguous windows. Returns the start, end and number of time steps of every window."""
+    start = datetime.strptime(start_date, ESSIM_DATETIME_FORMAT)
+    end = datetime.strptime(end_date, ESSIM_DATETIME_FORMAT)
+    steps = int((end - start) / ESSIM_TIME_STEP) + 1
+    count = max(1, min(count, steps))
+
+    windows = []
+    for i in range(count):
+        first = steps * i // count
+        last = steps * (i + 1) // count - 1
+        windows.append((
+            (start + first * ESSIM_TIME_STEP).strftime(ESSIM_DATETIME_FORMAT),
+            (start + last * ESSIM_TIME_STEP).strftime(ESSIM_DATETIME_FORMAT),
+            last - first + 1,
+        ))
+    return windows
+
+
+class KPIMergeRules:
+    """How the KPIs calculated for each time window are combined into the KPIs of the whole period.
+
+    Rules are configured per KPI module, as a single rule or with rules for individual KPIs, e.g.
+    {"TotalEnergyProductionID": "sum",
+     "SelfSufficiencyID": {"default": "mean", "kpis": {"Self-sufficiency": {"ratio": ["Local", "Demand"],
+                                                                            "scale": 100}}}}
+    sum, min and max combine the values of the windows, mean weighs them by the length of the windows.
+    A ratio is derived again from two merged KPIs of the same module, falling back to the mean. KPIs without
+    a rule are summed, except percentages, which are averaged.
+    """
+
+    def __init__(self, rules: Dict[str, Any]):
+        self.rules = rules
+
+    @staticmethod
+    def from_settings():
+        rules = EnvSettings.kpi_merge_rules()
+        try:
+            return KPIMergeRules(json.loads(rules) if rules else {})
+        except ValueError as e:
+            logger.error(f"Invalid KPI_MERGE_RULES, using the default merge rules: {e}")
+            return KPIMergeRules({})
+
+    def rule(self, module_id: str, kpi_name: str, unit: str) -> Union[str, Dict[str, Any]]:
+        module_rules = self.rules.get(module_id)
+        rule = None
+        if isinstance(module_rules, str):
+            rule = module_rules
+        elif isinstance(module_rules, dict):
+            rule = module_rules.get("kpis", {}).get(kpi_name) or module_rules.get("default")
+        if rule is None:
+            rule = "mean" if unit.upper() in PERCENTAGE_UNITS else "sum"
+        return rule
+
+
+def combine(values: List[float], weights: List[float], rule: str) -> float:
+    if rule == "mean":
+        return sum(v * w for v, w in zip(values, weights)) / sum(weights)
+    if rule == "min":
+        return min(values)
+    if rule == "max":
+        return max(values)
+    return sum(values)
+
+
+def merge_selection(selections: List[Dict[str, Any]], weights: List[float], rule: str) -> Dict[str, Any]:
+    """Merge the windows' values of a single KPI, a number or a value per carrier."""
+    merged = dict(selections[0])
+    if isinstance(merged["Values"], list):
+        carriers = [item["carrier"] for item in merged["Values"]]
+        values_per_carrier = {carrier: ([], []) for carrier in carriers}
+        for selection, weight in zip(selections, weights):
+            for item in selection["Values"]:
+                if item["carrier"] not in values_per_carrier:
+                    carriers.append(item["carrier"])
+                values, item_weights = values_per_carrier.setdefault(item["carrier"], ([], []))
+                values.append(float(item["value"]))
+                item_weights.append(weight)
+        merged["Values"] = [
+            {"carrier": carrier, "value": combine(*values_per_carrier[carrier], rule)} for carrier in carriers
+        ]
+    else:
+        merged["Values"] = combine([float(s["Values"]) for s in selections], weights, rule)
+    return merged
+
+
+def derive_ratio(selection: Dict[str, Any], merged: Dict[str, Dict[str, Any]], spec: Dict[str, Any]) -> bool:
+    """Recalculate a ratio KPI from the merged numerator and denominator, returns False if that is impossible."""
+    names = spec.get("ratio")
+    if not isinstance(names, list) or len(names) != 2:
+        return False
+    numerator, denominator = (merged.get(name) for name in names)
+    if numerator is None or denominator is None:
+        return False
+    scale = spec.get("scale", 1)
+
+    if isinstance(selection["Values"], list):
+        numerators = {item["carrier"]: item["value"] for item in numerator["Values"]} \
+            if isinstance(numerator["Values"], list) else None
+        denominators = {item["carrier"]: item["value"] for item in denominator["Values"]} \
+            if isinstance(denominator["Values"], list) else None
+        if numerators is None or denominators is None:
+            return False
+        if any(not denominators.get(item["carrier"]) or item["carrier"] not in numerators
+               for item in selection["Values"]):
+            return False
+        selection["Values"] = [
+            {"carrier": item["carrier"],
+             "value": scale * numerators[item["carrier"]] / denominators[item["carrier"]]}
+            for item in selection["Values"]
+        ]
+    else:
+        if isinstance(numerator["Values"], list) or isinstance(denominator["Values"], list) \
+                or not denominator["Values"]:
+            return False
+        selection["Values"] = scale * numerator["Values"] / denominator["Values"]
+    return True
+
+
+def merge_level(module_id: str, level_selections: List[List[Dict[str, Any]]], weights: List[float],
+                rules: KPIMergeRules) -> List[Dict[str, Any]]:
+    names = [selection["Name"] for selection in level_selections[0]]
+    by_name = [{selection["Name"]: selection for selection in selections} for selections in level_selections]
+
+    merged: Dict[str, Dict[str, Any]] = {}
+    ratios = []
+    for name in names:
+        selections = [window[name] for window in by_name if name in window]
+        rule = rules.rule(module_id, name, selections[0]["Unit"])
+        if isinstance(rule, dict):
+            # Merged as a mean first, replaced by the ratio once all other KPIs are merged
+            ratios.append((name, rule))
+            rule = "mean"
+        elif rule not in MERGE_RULES:
+            logger.warning(f"Unknown KPI merge rule {rule} for {module_id}/{name}, summing it")
+            rule = "sum"
+        merged[name] = merge_selection(selections, [w for window, w in zip(by_name, weights) if name in window],
+                                       rule)
+
+    for name, spec in ratios:
+        if not derive_ratio(merged[name], merged, spec):
+            logger.warning(f"Cannot derive the ratio of {module_id}/{name} from {spec.get('ratio')}, "
+                           f"using the mean over the time windows")
+    return [merged[name] for name in names]
+
+
+def merge_kpi_results(window_results: List[List[Dict[str, Any]]], weights: List[float],
+                      rules: KPIMergeRules) -> List[Dict[str, Any]]:
+    """Merge the KPI results (as returned by ESSIM.process_kpi_results) of the time windows of a run.
+
+    A KPI module that did not succeed in every window keeps the status of the window it failed in.
+    """
+    merged_results = []
+    for module in window_results[0]:
+        modules = [next((m for m in results if m["id"] == module["id"]), None) for results in window_results]
+        merged_module = {key: value for key, value in module.items() if key != "kpi"}
+        if not all(m is not None and "kpi" in m for m in modules):
+            merged_module["calc_status"] = next(
+                (m["calc_status"] for m in modules if m is not None and "kpi" not in m), "Error")
+            merged_results.append(merged_module)
+            continue
+
+        merged_module["kpi"] = []
+        for i, kpi_result in enumerate(module["kpi"]):
+            merged_module["kpi"].append({
+                level: merge_level(module["id"], [m["kpi"][i][level] for m in modules], weights, rules)
+                for level in kpi_result
+            })
+        merged_results.append(merged_module)
+    return merged_results
@@ -0,0 +1,153 @@
+import os
+import tempfile
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+from influxdb import InfluxDBClient
+
+from tno.essim_adapter.model.kpi_table import PARQUET_CONTENT_TYPE, pyarrow
+from tno.essim_adapter.settings import EnvSettings
+from tno.essim_adapter.types import ESSIMAdapterConfig
+from tno.shared.log import get_logger
+
+logger = get_logger(__name__)
+
+# Tags ESSIM writes with every point of its output
+SIMULATION_RUN_TAG = "simulationRun"
+ASSET_TAG = "assetId"
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def quote_literal(value: str) -> str:
+    return "'" + value.replace('\\', '\\\\').replace("'", "\\'") + "'"
+
+
+class TimeSeriesExporter:
+    """Exports the output time series of ESSIM simulations from InfluxDB to Parquet files in MinIO.
+
+    ESSIM writes the results of a simulation to the InfluxDB database named after the scenario, with a
+    measurement per carrier and the simulation and asset as tags. Every (carrier, asset) series becomes a file
+    {prefix}/simulation={id}/carrier={carrier}/asset={id}.parquet. Series are queried chunk_size points at a
+    time and every chunk is appended as a row group to a temporary file, so memory use does not depend on the
+    length of the simulation.
+    """
+
+    def __init__(self, model, chunk_size: int):
+        self.model = model
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def from_settings(model):
+        return TimeSeriesExporter(model, chunk_size=EnvSettings.timeseries_export_chunk_size())
+
+    @staticmethod
+    def connect(essim_post_body: Dict[str, Any]) -> InfluxDBClient:
+        url = urlparse(essim_post_body["influxURL"])
+        return InfluxDBClient(
+            host=url.hostname,
+            port=url.port or 8086,
+            database=essim_post_body["scenarioID"],
+            ssl=url.scheme == "https",
+        )
+
+    def export(self, config: ESSIMAdapterConfig, simulation_ids: List[str]) -> Optional[str]:
+        """Export the series of the given simulations, returns the path the files are stored under."""
+        if pyarrow is None:
+            logger.warning("TIMESERIES_EXPORT is enabled, but the pyarrow package is not installed")
+            return None
+
+        output_path = self.model.process_path(config.output_file_path, config.base_path)
+        prefix = f"{os.path.dirname(output_path)}/timeseries"
+        client = self.connect(config.essim_post_body)
+        try:
+            files = 0
+            for measurement in [m["name"] for m in client.get_list_measurements()]:
+                for simulation_id in simulation_ids:
+                    for asset_id in self.assets(client, measurement, simulation_id):
+                        path = f"{prefix}/simulation={simulation_id}/carrier={measurement}/asset={asset_id}.parquet"
+                        if self.export_series(client, measurement, simulation_id, asset_id, path):
+                            files += 1
+            logger.info(f"Exported {files} time series of simulations {', '.join(simulation_ids)} to {prefix}")
+        finally:
+            client.close()
+        return prefix
+
+    @staticmethod
+    def assets(client: InfluxDBClient, measurement: str, simulation_id: str) -> List[str]:
+        result = client.query(f"SHOW TAG VALUES FROM {quote_identifier(measurement)} "
+                              f"WITH KEY = {quote_identifier(ASSET_TAG)} "
+                              f"WHERE {quote_identifier(SIMULATION_RUN_TAG)} = {quote_literal(simulation_id)}")
+        return [point["value"] for point in result.get_points()]
+
+    def export_series(self, client: InfluxDBClient, measurement: str, simulation_id: str, asset_id: str,
+                      path: str) -> bool:
+        query = (f"SELECT * FROM {quote_identifier(measurement)} "
+                 f"WHERE {quote_identifier(SIMULATION_RUN_TAG)} = {quote_literal(simulation_id)} "
+                 f"AND {quote_identifier(ASSET_TAG)} = {quote_literal(asset_id)} ORDER BY time")
+
+        fd, file_path = tempfile.mkstemp(suffix=".parquet")
+        os.close(fd)
+        writer = None
+        try:
+            offset = 0
+            while True:
+                points = list(client.query(f"{query} LIMIT {self.chunk_size} OFFSET {offset}",
+                                           epoch="s").get_points())
+                if not points:
+                    break
+                if writer is None:
+                    schema = self.schema(points)
+                    writer = pyarrow.parquet.ParquetWriter(file_path, schema, compression="zstd")
+                writer.write_table(self.chunk_table(points, writer.schema))
+                offset += len(points)
+                if len(points) < self.chunk_size:
+                    break
+
+            if writer is None:
+                return False
+            writer.close()
+            writer = None
+            self.model.save_file_to_minio(path, file_path, content_type=PARQUET_CONTENT_TYPE)
+            return True
+        finally:
+            if writer is not None:
+                writer.close()
+            os.remove(file_path)
+
+    @staticmethod
+    def schema(points: List[Dict[str, Any]]):
+        """Columns of a series, typed by the first chunk. Numbers are stored as doubles."""
+        columns = {"time": pyarrow.timestamp("s", tz="UTC")}
+        for point in points:
+            for name, value in point.items():
+                if name in columns or value is None:
+                    continue
+                if isinstance(value, bool):
+                    columns[name] = pyarrow.bool_()
+                elif isinstance(value, (int, float)):
+                    columns[name] = pyarrow.float64()
+                else:
+                    columns[name] = pyarrow.string()
+        return pyarrow.schema(list(columns.items()))
+
+    @staticmethod
+    def chunk_table(points: List[Dict[str, Any]], schema):
+        # Columns that only appear in later chunks are left out, columns missing from a point are null
+        columns = {
+            field.name: [TimeSeriesExporter.convert(point.get(field.name), field.type) for point in points]
+            for field in schema
+        }
+        return pyarrow.table(columns, schema=schema)
+
+    @staticmethod
+    def convert(value, data_type):
+        if value is None or pyarrow.types.is_timestamp(data_type):
+            return value
+        if pyarrow.types.is_floating(data_type):
+            return float(value)
+        if pyarrow.types.is_boolean(data_type):
+            return bool(value)
+        return str(value)
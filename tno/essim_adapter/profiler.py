@@ -0,0 +1,180 @@
+import re
+import sys
+import threading
+from collections import Counter
+from time import perf_counter, time
+from typing import Dict, Optional
+
+from tno.essim_adapter.settings import EnvSettings
+from tno.shared.log import get_logger
+
+logger = get_logger(__name__)
+
+# Thread name prefixes of the roles a sample is attributed to, the first match wins
+THREAD_ROLES = (
+    ("pipeline-simulation", "poller"),
+    ("pipeline-kpi", "poller"),
+    ("async-run-engine", "poller"),
+    ("pipeline-", "run-worker"),
+    ("async-io", "run-worker"),
+    ("essim-health-check", "background"),
+    ("registry-heartbeat", "background"),
+    ("kpi-catalog-refresh", "background"),
+    ("run-retention", "background"),
+    # Request threads of gunicorn (gthread workers, or the main thread of sync workers) and the Flask dev server
+    ("MainThread", "api"),
+    ("ThreadPoolExecutor-", "api"),
+)
+
+
+def thread_role(name: str) -> str:
+    for prefix, role in THREAD_ROLES:
+        if name.startswith(prefix):
+            return role
+    if "process_request_thread" in name:
+        return "api"
+    return "other"
+
+
+def thread_group(name: str) -> str:
+    """The name of a thread without its number in the pool, e.g. pipeline-kpi for pipeline-kpi_3."""
+    name = re.sub(r"^Thread-\d+ \((.*)\)$", r"\1", name)
+    return re.sub(r"_\d+$", "", name)
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads of this process, to see where they spend their time.
+
+    While running, a background thread takes a snapshot of sys._current_frames() every interval seconds and
+    counts every distinct (thread role, thread group, stack). The counts are returned as collapsed stacks,
+    one "role;group;module:function;... count" line per stack, the input of flamegraph.pl and speedscope.
+    A profile stops by itself after max_duration seconds, at most max_stacks distinct stacks of at most
+    max_depth frames are counted, so a forgotten profile costs a bounded amount of time and memory.
+    Each worker process has its own profiler.
+    """
+
+    def __init__(self, interval: float, max_duration: float, max_depth: int, max_stacks: int):
+        self.interval = interval
+        self.max_duration = max_duration
+        self.max_depth = max_depth
+        self.max_stacks = max_stacks
+
+        self._counts: Counter = Counter()
+        self._samples = 0
+        self._dropped = 0
+        self._sampling_time = 0.0
+        self._started_at: Optional[float] = None
+        self._stopped_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def from_settings():
+        return SamplingProfiler(
+            interval=EnvSettings.profiler_interval(),
+            max_duration=EnvSettings.profiler_max_duration(),
+            max_depth=EnvSettings.profiler_max_depth(),
+            max_stacks=EnvSettings.profiler_max_stacks(),
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: Optional[float] = None, duration: Optional[float] = None) -> bool:
+        """Start a new profile, returns False if one is running already."""
+        with self._lock:
+            if self.running:
+                return False
+            interval = max(0.001, interval or self.interval)
+            duration = min(duration or self.max_duration, self.max_duration)
+            self._counts = Counter()
+            self._samples = 0
+            self._dropped = 0
+            self._sampling_time = 0.0
+            self._started_at = time()
+            self._stopped_at = None
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample_loop, args=(interval, self._started_at + duration),
+                                            name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"Started sampling profiler, every {interval}s for at most {duration}s")
+        return True
+
+    def stop(self):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def _sample_loop(self, interval: float, deadline: float):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(interval):
+            started = perf_counter()
+            self.sample(own_ident)
+            self._sampling_time += perf_counter() - started
+            if time() >= deadline:
+                break
+        self._stopped_at = time()
+        logger.info(f"Stopped sampling profiler after {self._samples} samples")
+
+    def sample(self, own_ident: Optional[int] = None):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            name = names.get(ident, "unknown")
+            frames = []
+            while frame is not None:
+                if len(frames) == self.max_depth:
+                    frames.append("...")
+                    break
+                frames.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            frames.reverse()
+            stacks.append((thread_role(name), thread_group(name), tuple(frames)))
+
+        with self._lock:
+            self._samples += 1
+            for key in stacks:
+                if key in self._counts or len(self._counts) < self.max_stacks:
+                    self._counts[key] += 1
+                else:
+                    self._dropped += 1
+
+    def collapsed(self, role: Optional[str] = None) -> str:
+        """The profile as collapsed stacks, optionally of the threads of one role only."""
+        with self._lock:
+            counts = list(self._counts.items())
+        lines = [";".join((key[0], key[1]) + key[2]) + f" {count}"
+                 for key, count in sorted(counts, key=lambda item: -item[1])
+                 if role is None or key[0] == role]
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def roles(self) -> Dict[str, int]:
+        """Samples per thread role."""
+        per_role: Counter = Counter()
+        with self._lock:
+            for (role, _, _), count in self._counts.items():
+                per_role[role] += count
+        return dict(per_role)
+
+    def status(self) -> Dict:
+        end = self._stopped_at or time()
+        elapsed = end - self._started_at if self._started_at else 0.0
+        return {
+            "running": self.running,
+            "started_at": self._started_at,
+            "stopped_at": self._stopped_at,
+            "samples": self._samples,
+            "stacks": len(self._counts),
+            "dropped": self._dropped,
+            "roles": self.roles(),
+            # Share of the elapsed time spent taking samples, while holding the GIL
+            "overhead": self._sampling_time / elapsed if elapsed else 0.0,
+        }
+
+
+profiler = SamplingProfiler.from_settings()
@@ -0,0 +1,178 @@
+import multiprocessing
+import os
+import threading
+from time import sleep
+from typing import Callable, Dict, Optional
+from urllib.parse import quote, urljoin
+
+import requests
+
+from tno.shared.log import get_logger
+
+logger = get_logger(__name__)
+
+REGISTRY_REQUEST_TIMEOUT = 10
+# Fields of a worker's entry in the UsageBoard
+USAGE_FIELDS = ("pid", "used_workers", "queue_length")
+
+
+class UsageBoard:
+    """The usage of the worker processes of one adapter instance, so its gunicorn master can report their total.
+
+    Created in the master before the workers are forked, in memory shared with them. Every worker claims an
+    entry and publishes its usage there every interval seconds. Entries of workers that exited are reused.
+    """
+
+    def __init__(self, entries: int):
+        self._values = multiprocessing.Array("q", entries * len(USAGE_FIELDS))
+        self._index: Optional[int] = None
+
+    @staticmethod
+    def alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+            return True
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+
+    def _entries(self):
+        return range(0, len(self._values), len(USAGE_FIELDS))
+
+    def claim(self) -> bool:
+        with self._values.get_lock():
+            for i in self._entries():
+                pid = self._values[i]
+                if pid == 0 or pid == os.getpid() or not self.alive(pid):
+                    self._values[i:i + len(USAGE_FIELDS)] = [os.getpid(), 0, 0]
+                    self._index = i
+                    return True
+        logger.warning("No free entry in the usage board, the usage of this worker is not reported")
+        return False
+
+    def publish(self, usage: Dict[str, int]):
+        if self._index is not None:
+            with self._values.get_lock():
+                self._values[self._index + 1] = usage["used_workers"]
+                self._values[self._index + 2] = usage["queue_length"]
+
+    def usage(self) -> Dict[str, int]:
+        total = {"used_workers": 0, "queue_length": 0}
+        with self._values.get_lock():
+            entries = [self._values[i:i + len(USAGE_FIELDS)] for i in self._entries()]
+        for pid, used_workers, queue_length in entries:
+            if pid and self.alive(pid):
+                total["used_workers"] += used_workers
+                total["queue_length"] += queue_length
+        return total
+
+    def start(self, usage: Callable[[], Dict[str, int]], interval: float):
+        """Claim an entry for this worker and publish its usage in the background."""
+        if not self.claim():
+            return
+
+        def publish_loop():
+            while True:
+                self.publish(usage())
+                sleep(interval)
+
+        threading.Thread(target=publish_loop, name="registry-usage", daemon=True).start()
+
+
+class RegistryClient:
+    """Keeps the registration of this adapter in the MM Registry up to date.
+
+    The adapter registers itself with its real concurrency limit, sends a heartbeat with the current
+    number of in-flight runs and the queue length every heartbeat interval, and deregisters on shutdown.
+    Heartbeats and deregistration use the id the registry answered the registration with, without one the
+    registration is only renewed when it failed.
+    """
+
+    def __init__(self, endpoint: str, adapter_uri: str, max_workers: int, heartbeat_interval: float,
+                 usage: Callable[[], Dict[str, int]]):
+        self.endpoint = endpoint if endpoint.endswith("/") else endpoint + "/"
+        self.adapter_uri = adapter_uri
+        self.max_workers = max_workers
+        self.heartbeat_interval = heartbeat_interval
+        self.usage = usage
+
+        self.registered = False
+        self.registration_id: Optional[str] = None
+        self._stopped = threading.Event()
+        self._heartbeat_thread = None
+
+    def registry_data(self) -> Dict:
+        usage = self.usage()
+        return {
+            "uri": self.adapter_uri,
+            "name": "ESSIM",
+            "owner": "localhost",
+            "version": "1.0",
+            "max_workers": self.max_workers,
+            "used_workers": usage["used_workers"],
+            "queue_length": usage["queue_length"],
+        }
+
+    def register(self):
+        logger.info("Registering with MM Registry")
+        try:
+            r = requests.post(self.endpoint, json=self.registry_data(), timeout=REGISTRY_REQUEST_TIMEOUT)
+            r.raise_for_status()
+            self.registered = True
+            try:
+                self.registration_id = r.json().get("id")
+            except (ValueError, AttributeError):
+                self.registration_id = None
+            if self.registration_id is None:
+                logger.warning("MM Registry did not return a registration id, no heartbeats will be sent")
+        except requests.exceptions.HTTPError as e:
+            logger.error(f"Registering with MM Registry failed: {e.response.text}")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Could not reach MM Registry: {e}")
+
+    def registration_url(self) -> str:
+        return urljoin(self.endpoint, quote(str(self.registration_id), safe=""))
+
+    def heartbeat(self):
+        try:
+            if not self.registered:
+                self.register()
+            elif self.registration_id is not None:
+                r = requests.put(self.registration_url(), json=self.registry_data(), timeout=REGISTRY_REQUEST_TIMEOUT)
+                if r.status_code == 404:
+                    # The registry forgot about us (e.g. it restarted), register again
+                    self.registered = False
+                    self.registration_id = None
+                    self.register()
+                    return
+                r.raise_for_status()
+        except requests.exceptions.HTTPError as e:
+            logger.warning(f"MM Registry heartbeat failed: {e.response.text}")
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Could not reach MM Registry: {e}")
+
+    def deregister(self):
+        self._stopped.set()
+        if self.registration_id is None:
+            return
+        logger.info("Deregistering from MM Registry")
+        try:
+            r = requests.delete(self.registration_url(), timeout=REGISTRY_REQUEST_TIMEOUT)
+            r.raise_for_status()
+            self.registration_id = None
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Deregistering from MM Registry failed: {e}")
+
+    def _heartbeat_loop(self):
+        self.register()
+        while self.heartbeat_interval > 0 and not self._stopped.wait(self.heartbeat_interval):
+            self.heartbeat()
+
+    def start(self):
+        """Register and send heartbeats in the background, so a slow registry does not delay startup."""
+        if self._heartbeat_thread is None:
+            self._heartbeat_thread = threading.Thread(
+                target=self._heartbeat_loop, name="registry-heartbeat", daemon=True
+            )
+            self._heartbeat_thread.start()
@@ -23,6 +23,24 @@ class EnvSettings:
     def is_production():
         return EnvSettings.env() == "prod"
 
+    @staticmethod
+    def gunicorn_preload():
+        # Load the app in the gunicorn master, so workers share it copy-on-write and boot faster
+        return os.getenv("GUNICORN_PRELOAD", "True").upper() != "FALSE"
+
+    @staticmethod
+    def log_async():
+        return os.getenv("LOG_ASYNC", "False").upper() != "FALSE"
+
+    @staticmethod
+    def log_queue_size():
+        return int(os.getenv("LOG_QUEUE_SIZE", 10000))
+
+    @staticmethod
+    def log_max_message_length():
+        # Longer log messages are truncated, 0 disables truncation
+        return int(os.getenv("LOG_MAX_MESSAGE_LENGTH", 10000))
+
     @staticmethod
     def minio_endpoint():
         return os.getenv("MINIO_ENDPOINT", None)
@@ -44,16 +62,248 @@ class EnvSettings:
     def registry_endpoint():
         return os.getenv("REGISTRY_ENDPOINT", None)
 
+    @staticmethod
+    def kpi_catalog_ttl():
+        return float(os.getenv("KPI_CATALOG_TTL", 300))
+
+    @staticmethod
+    def poll_min_interval():
+        return float(os.getenv("POLL_MIN_INTERVAL", 1))
+
+    @staticmethod
+    def poll_max_interval():
+        return float(os.getenv("POLL_MAX_INTERVAL", 60))
+
+    @staticmethod
+    def registry_heartbeat_interval():
+        return float(os.getenv("REGISTRY_HEARTBEAT_INTERVAL", 30))
+
+    @staticmethod
+    def adapter_uri():
+        return os.getenv("ADAPTER_URI", "http://mmvib-essim-adapter:9203")
+
+    @staticmethod
+    def max_workers():
+        # Number of model runs the threaded engine executes concurrently
+        return int(os.getenv("MAX_WORKERS", 4))
+
+    @staticmethod
+    def run_engine():
+        # "threaded" runs every model run on an executor thread, "async" supervises them on one event loop
+        return os.getenv("RUN_ENGINE", "threaded").lower()
+
+    @staticmethod
+    def async_max_concurrent_runs():
+        # Number of model runs the async engine supervises concurrently, waiting runs only cost a coroutine
+        return int(os.getenv("ASYNC_MAX_CONCURRENT_RUNS", 2000))
+
+    @staticmethod
+    def run_slots():
+        # Number of model runs that are executed concurrently by the selected run engine
+        if EnvSettings.run_engine() == "async":
+            return EnvSettings.async_max_concurrent_runs()
+        return EnvSettings.max_workers()
+
+    @staticmethod
+    def esdl_process_pool_size():
+        # Number of processes parsing and serializing ESDLs, 0 (the default) does it in the thread storing the
+        # results. The pool needs an entry point with an if __name__ == "__main__" guard, like gunicorn
+        return int(os.getenv("ESDL_PROCESS_POOL_SIZE", 0))
+
+    @staticmethod
+    def pipeline_workers(stage: str):
+        # Threads of a pipeline stage: fetch (input ESDL), submit (to ESSIM), post_process (output ESDL), export
+        # (time series) or upload
+        defaults = {"fetch": 2, "submit": 2, "post_process": max(1, EnvSettings.esdl_process_pool_size()),
+                    "export": 2, "upload": 4}
+        return int(os.getenv(f"PIPELINE_{stage.upper()}_WORKERS", defaults.get(stage, 1)))
+
+    @staticmethod
+    def pipeline_queue_size():
+        # Runs waiting for the submit, post_process and upload stages, a full stage holds back the one before it
+        return int(os.getenv("PIPELINE_QUEUE_SIZE", 8))
+
+    @staticmethod
+    def tenant_max_workers():
+        # Runs of one tenant that are executed concurrently, 0 lets a tenant use all run slots
+        return int(os.getenv("TENANT_MAX_WORKERS", 0))
+
+    @staticmethod
+    def max_queue_length():
+        # Runs waiting for a run slot, more runs are refused with 429. 0 leaves the queue unbounded
+        return int(os.getenv("MAX_QUEUE_LENGTH", 0))
+
+    @staticmethod
+    def tenant_max_queue_length():
+        return int(os.getenv("TENANT_MAX_QUEUE_LENGTH", 0))
+
+    @staticmethod
+    def queue_retry_after():
+        # Seconds a refused client is asked to wait before starting the run again
+        return int(os.getenv("QUEUE_RETRY_AFTER", 60))
+
+    @staticmethod
+    def queue_order():
+        # Order of the queued runs of a tenant with the same priority: fifo, sjf (shortest estimated duration
+        # first) or deadline (least time to spare before the deadline of the run first)
+        return os.getenv("QUEUE_ORDER", "fifo").lower()
+
+    @staticmethod
+    def run_history_file():
+        # Durations of the phases of finished runs, to estimate how long the next runs take. Empty, the default,
+        # only keeps the durations of this process in memory
+        return os.getenv("RUN_HISTORY_FILE", "")
+
+    @staticmethod
+    def run_history_size():
+        # Finished runs learned from the history file at startup
+        return int(os.getenv("RUN_HISTORY_SIZE", 1000))
+
+    @staticmethod
+    def duration_min_samples():
+        # Runs after which a phase is estimated from the features of a run instead of the mean duration
+        return int(os.getenv("DURATION_MIN_SAMPLES", 5))
+
+    @staticmethod
+    def response_cache_size():
+        # MB of serialized /model/results responses kept, so repeated fetches of the same results are not serialized again
+        return float(os.getenv("RESPONSE_CACHE_MB", 64))
+
+    @staticmethod
+    def response_gzip_min_size():
+        # Responses of at least this many bytes are gzip compressed for clients that accept it
+        return int(os.getenv("RESPONSE_GZIP_MIN_SIZE", 1024))
+
+    @staticmethod
+    def profiler_enabled():
+        # Adds the /admin/profiler endpoints, which start and stop a sampling profiler of the worker process
+        return os.getenv("PROFILER_ENABLED", "False").upper() != "FALSE"
+
+    @staticmethod
+    def profiler_interval():
+        # Seconds between two samples of the stacks of all threads
+        return float(os.getenv("PROFILER_INTERVAL", 0.01))
+
+    @staticmethod
+    def profiler_max_duration():
+        # A profile stops by itself after this many seconds
+        return float(os.getenv("PROFILER_MAX_DURATION", 300))
+
+    @staticmethod
+    def profiler_max_depth():
+        return int(os.getenv("PROFILER_MAX_DEPTH", 64))
+
+    @staticmethod
+    def profiler_max_stacks():
+        # Distinct stacks counted by a profile, samples of further stacks are dropped
+        return int(os.getenv("PROFILER_MAX_STACKS", 10000))
+
+    @staticmethod
+    def async_io_workers():
+        return int(os.getenv("ASYNC_IO_WORKERS", 8))
+
+    @staticmethod
+    def executor_futures_max_length():
+        return int(os.getenv("EXECUTOR_FUTURES_MAX_LENGTH", 10000))
+
+    @staticmethod
+    def run_state_dir():
+        # Directory with checkpoints of the runs in progress, resumed after a restart. Empty, the default, disables
+        # checkpoints. Every adapter instance needs a directory of its own, it resumes all orphaned runs in it
+        return os.getenv("RUN_STATE_DIR", "")
+
+    @staticmethod
+    def kpi_merge_rules():
+        # JSON with the rules combining the KPIs of the time windows of a split run, see KPIMergeRules
+        return os.getenv("KPI_MERGE_RULES", "")
+
+    @staticmethod
+    def retention_ttl():
+        # Seconds a finished model run is kept in memory (a day by default), 0 disables eviction by age
+        return float(os.getenv("RETENTION_TTL", 86400))
+
+    @staticmethod
+    def retention_memory_budget():
+        # Estimated size in MB of all finished model runs kept in memory, 0 disables eviction by size
+        return float(os.getenv("RETENTION_MEMORY_BUDGET_MB", 256))
+
+    @staticmethod
+    def retention_check_interval():
+        return float(os.getenv("RETENTION_CHECK_INTERVAL", 60))
+
+    @staticmethod
+    def retention_spill_bucket():
+        return os.getenv("RETENTION_SPILL_BUCKET", "essim-adapter-runs")
+
+    @staticmethod
+    def kpi_parquet_export():
+        # Also store the KPIs as a Parquet table next to KPIs.json (needs the pyarrow package)
+        return os.getenv("KPI_PARQUET_EXPORT", "False").upper() != "FALSE"
+
+    @staticmethod
+    def timeseries_export():
+        # Export the output time series of successful simulations from InfluxDB to MinIO (needs the pyarrow package)
+        return os.getenv("TIMESERIES_EXPORT", "False").upper() != "FALSE"
+
+    @staticmethod
+    def timeseries_export_chunk_size():
+        # Points per InfluxDB query, and per Parquet row group, when exporting time series
+        return int(os.getenv("TIMESERIES_EXPORT_CHUNK_SIZE", 10000))
+
+    @staticmethod
+    def artifact_compression():
+        # Compression of the artifacts stored in MinIO: "none", "gzip" or "zstd" (needs the zstandard package)
+        return os.getenv("ARTIFACT_COMPRESSION", "none").lower()
+
+    @staticmethod
+    def artifact_compression_level():
+        level = os.getenv("ARTIFACT_COMPRESSION_LEVEL", None)
+        return int(level) if level else None
+
+    @staticmethod
+    def essim_request_timeout():
+        return float(os.getenv("ESSIM_REQUEST_TIMEOUT", 60))
+
+    @staticmethod
+    def run_timeout():
+        # Wall-clock limit of a complete model run in seconds, 0 disables it
+        return float(os.getenv("RUN_TIMEOUT", 0))
+
+    @staticmethod
+    def phase_timeout(phase: str):
+        # Limits of the start, simulation and kpi phases of a model run in seconds, 0 disables them
+        return float(os.getenv(f"{phase.upper()}_TIMEOUT", 0))
+
     @staticmethod
     def essim_url():
         return os.getenv("ESSIM_URL", "")
 
+    @staticmethod
+    def essim_urls():
+        # Comma separated list of ESSIM engines, falls back to the single ESSIM_URL
+        urls = os.getenv("ESSIM_URLS", None)
+        if urls:
+            return [url.strip().rstrip("/") for url in urls.split(",") if url.strip()]
+        url = EnvSettings.essim_url().rstrip("/")
+        return [url] if url else []
+
+    @staticmethod
+    def essim_health_check_interval():
+        return float(os.getenv("ESSIM_HEALTH_CHECK_INTERVAL", 30))
+
+    @staticmethod
+    def essim_busy_backoff():
+        return float(os.getenv("ESSIM_BUSY_BACKOFF", 5))
+
 
 class Config(object):
     """Generic config for all environments."""
 
     SECRET_KEY = secrets.token_urlsafe(16)
 
+    EXECUTOR_MAX_WORKERS = EnvSettings.max_workers()
+    EXECUTOR_FUTURES_MAX_LENGTH = EnvSettings.executor_futures_max_length()
+
     API_TITLE = "MMvIB ESDL Add Profile REST API"
     API_VERSION = "v1"
     OPENAPI_VERSION = "3.0.2"
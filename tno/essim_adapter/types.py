@@ -24,6 +24,16 @@ class ESSIMAdapterConfig:
     output_esdl_file_path: Optional[str] = None
     output_file_path: Optional[str] = None
     base_path: Optional[str] = None
+    # Split startDate to endDate into this many time windows that are simulated concurrently
+    time_windows: Optional[int] = None
+    # Free-form label of the batch or sweep the run belongs to, to query the status of all its runs at once
+    tag: Optional[str] = None
+    # Workflow the run is scheduled under, base_path if not given. Runs of different tenants take turns
+    tenant: Optional[str] = None
+    # Queued runs with a higher priority start first, the default is 0
+    priority: Optional[int] = None
+    # Time the results are needed by, in seconds since the epoch, for QUEUE_ORDER=deadline
+    deadline: Optional[float] = None
 
 
 @dataclass
@@ -31,6 +41,20 @@ class ModelRun:
     state: ModelState
     config: ESSIMAdapterConfig
     result: dict
+    stored: bool = False
+    reason: Optional[str] = None
+    # Estimated time the run finishes, in seconds since the epoch
+    eta: Optional[float] = None
+
+
+@dataclass
+class RunSummary:
+    state: ModelState
+    finished_at: float
+    reason: Optional[str] = None
+    result_path: Optional[str] = None
+    spill_path: Optional[str] = None
+    tag: Optional[str] = None
 
 
 @dataclass(order=True)
@@ -39,15 +63,35 @@ class ModelRunInfo:
     state: ModelState = field(default=ModelState.UNKNOWN)
     result: Optional[Dict[str, Any]] = None
     reason: Optional[str] = None
+    # Estimated time a queued or running run finishes, in seconds since the epoch
+    eta: Optional[float] = None
 
     # support for Schema generation in Marshmallow
     Schema: ClassVar[Type[Schema]] = Schema
 
 
+@dataclass
+class ModelRunQuery:
+    model_run_ids: Optional[List[str]] = None
+    tag: Optional[str] = None
+    # The ModelRunInfo fields to return besides model_run_id, all fields if not given
+    include: Optional[List[str]] = None
+
+
+@dataclass
+class ProfilerOptions:
+    # Seconds between samples and the length of the profile, the configured defaults if not given
+    interval: Optional[float] = None
+    duration: Optional[float] = None
+    # Only return the stacks of the threads with this role: api, run-worker, poller, background or other
+    role: Optional[str] = None
+
+
 @dataclass
 class MonitorKPIResult:
     still_calculating: bool
     results: List[Dict[str, Any]]
+    progress: Optional[float] = None
 
 
 @dataclass
@@ -96,6 +140,7 @@ class EnvironmentalProfileInfo:
     profile_info: ProfileInfo
 
 
+@dataclass
 class InfluxDBProfilesInfo:
     asset_port_profiles_dict: Dict[Any, AssetPortProfileInfo]
     asset_cost_profiles_list: List[AssetCostInformationProfileInfo]
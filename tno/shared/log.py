@@ -1,5 +1,11 @@
+import atexit
+import copy
 import logging
 import logging.config
+import logging.handlers
+import os
+import queue
+import threading
 
 from typing import List, Any
 import structlog
@@ -54,6 +60,94 @@ logging.config.dictConfig(
 )
 
 
+class AsyncLogHandler(logging.handlers.QueueHandler):
+    """Hands log records to a background QueueListener, so logging never blocks the calling thread.
+
+    Messages, and every other value of a structlog event, longer than max_message_length are truncated.
+    When the queue is full, records are dropped instead of waiting for the writer, the number of dropped
+    records is reported with the next record that fits in the queue.
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_message_length: int):
+        super().__init__(log_queue)
+        self.max_message_length = max_message_length
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def truncate(self, message: str) -> str:
+        if self.max_message_length and len(message) > self.max_message_length:
+            truncated = len(message) - self.max_message_length
+            return f"{message[:self.max_message_length]}... [{truncated} characters truncated]"
+        return message
+
+    def truncate_value(self, value):
+        if value is None or isinstance(value, (bool, int, float)) or not self.max_message_length:
+            return value
+        if isinstance(value, bytes):
+            value = value.decode("utf-8", errors="replace")
+        elif not isinstance(value, str):
+            # Containers, e.g. KPIs or an ESDL, are rendered here so only their truncated text is queued
+            value = str(value)
+            if len(value) <= self.max_message_length:
+                return value
+        return self.truncate(value)
+
+    def take_dropped(self) -> int:
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        return dropped
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike QueueHandler.prepare() the record is not formatted here: the listener runs in this process
+        # and its handler renders the structlog event dict.
+        record = copy.copy(record)
+        if isinstance(record.msg, dict):
+            record.msg = {key: self.truncate_value(value) for key, value in record.msg.items()}
+            dropped = self.take_dropped() if self.dropped else 0
+            if dropped:
+                record.msg["dropped_log_records"] = dropped
+        else:
+            record.msg = self.truncate(record.getMessage())
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+def enable_async_logging():
+    """Move the output of the configured loggers to a background writer thread."""
+    stream_handler = logging.getLogger("tno").handlers[0]
+    log_queue = queue.Queue(EnvSettings.log_queue_size())
+    queue_handler = AsyncLogHandler(log_queue, EnvSettings.log_max_message_length())
+    for name in ("", "alembic", "tno"):
+        configured_logger = logging.getLogger(name)
+        configured_logger.removeHandler(stream_handler)
+        configured_logger.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    def restart_after_fork():
+        # The writer thread does not survive a fork, give the child its own queue and writer
+        child_queue = queue.Queue(EnvSettings.log_queue_size())
+        queue_handler.queue = child_queue
+        child_listener = logging.handlers.QueueListener(child_queue, stream_handler, respect_handler_level=True)
+        child_listener.start()
+        atexit.register(child_listener.stop)
+
+    os.register_at_fork(after_in_child=restart_after_fork)
+
+
+if EnvSettings.log_async():
+    enable_async_logging()
+
+
 structlog.configure(
     processors=[merge_threadlocal]
     + shared_processors
@@ -65,3 +159,8 @@ structlog.configure(
 
 def get_logger(name):
     return structlog.get_logger(name)
+
+
+def debug_enabled(name) -> bool:
+    """Check before building an expensive debug message, e.g. a serialized ESDL."""
+    return logging.getLogger(name).isEnabledFor(logging.DEBUG)